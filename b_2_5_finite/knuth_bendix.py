@@ -0,0 +1,390 @@
+import argparse
+import heapq
+import sys
+import time
+from array import array
+from collections import OrderedDict, defaultdict
+import numpy as np
+from todd_coxeter import GENERATORS, format_word, parse_word, power_relators, sampled_power_relators
+
+
+def pack(word, generators=GENERATORS):
+    """
+    Packs a word into bytes, one byte per letter holding its column as in todd_coxeter.parse_word.
+
+    :param word: a string, a sequence of nonzero integers, or packed bytes
+    :param generators: the lower case names of the generators
+    :return: the packed word
+    """
+    if isinstance(word, bytes):
+        return word
+    return bytes(parse_word(word, generators))
+
+
+def _greater(u, v):
+    """
+    Shortlex order on packed words, with the letters ordered a < A < b < B < ...
+    """
+    return (len(u), u) > (len(v), v)
+
+
+class RewritingSystem:
+    """
+    Knuth-Bendix completion of a group presentation, with the shortlex order.
+
+    Words are packed into bytes (see pack), so that rules are compact and substrings are found
+    with bytes.find. Words are reduced by an Aho-Corasick automaton of the left-hand sides, in a
+    single pass that backs up by the length of a left-hand side after each rewriting. The
+    automaton is rebuilt once enough rules were added since the last build; the newer rules are
+    applied by searching for their left-hand sides. The proper prefixes and suffixes of the
+    left-hand sides are indexed to find the overlaps of a new rule with the others.
+
+    Equations, first the relators and then the critical pairs, wait in a priority queue ordered
+    by length, so that short rules are found first. Adding a rule removes the rules whose
+    left-hand side it reduces, sending them back to the queue, and reduces the right-hand sides.
+
+    Normal forms of words are kept in a bounded LRU cache, and words longer than split_length
+    are reduced from the normal forms of their halves, so that common subwords are only
+    reduced once. Entries computed before the last rule was added are reduced again when used.
+    """
+
+    def __init__(self, relators, generators=GENERATORS, max_length=None, max_overlap_length=None, max_rules=None,
+                 cache_size=1 << 16, split_length=32):
+        """
+        Creates the rewriting system of the free reductions and queues the relators.
+
+        :param relators: the relators of the group, as words, see pack
+        :param generators: the lower case names of the generators
+        :param max_length: equations with a side longer than this are dropped, None for no bound
+        :param max_overlap_length: overlaps longer than this are not considered, None for no bound
+        :param max_rules: completion stops when there are this many rules, None for no bound
+        :param cache_size: the number of cached normal forms
+        :param split_length: words longer than this are reduced from the normal forms of their halves
+        """
+        self.generators = generators
+        self.num_letters = 2 * len(generators)
+        self.max_length = max_length
+        self.max_overlap_length = max_overlap_length
+        self.max_rules = max_rules
+        self.cache_size = cache_size
+        self.split_length = split_length
+
+        self.rules = {}
+        self.by_length = defaultdict(set)
+        self.prefixes = defaultdict(set)  # proper prefix -> left-hand sides starting with it
+        self.suffixes = defaultdict(set)  # proper suffix -> left-hand sides ending with it
+        self.pending = {}  # rules added since the automaton was built
+        self.generation = 0
+        self.cache = OrderedDict()
+        self.queue = []
+        self.counter = 0
+        self.dropped = 0
+        self.statistics = {"pairs": 0, "rules_added": 0, "rules_removed": 0, "rebuilds": 0, "cache_hits": 0,
+                           "cache_misses": 0, "elapsed": 0.0}
+        self._build()
+
+        for x in range(self.num_letters):
+            self._add_rule(bytes((x, x ^ 1)), b"")
+        for relator in relators:
+            self.push(pack(relator, generators), b"")
+
+    def push(self, u, v):
+        """
+        Queues the equation u = v between packed words.
+        """
+        heapq.heappush(self.queue, (max(len(u), len(v)), len(u) + len(v), self.counter, u, v))
+        self.counter += 1
+
+    def _build(self):
+        """
+        Builds the Aho-Corasick automaton of the left-hand sides, as a complete transition
+        table, with for each state the length and reversed right-hand side of a rule whose
+        left-hand side is a suffix of the state's word.
+        """
+        k = self.num_letters
+        goto = [[-1] * k]
+        terminal = [None]
+        for lhs, rhs in self.rules.items():
+            state = 0
+            for x in lhs:
+                if goto[state][x] < 0:
+                    goto[state][x] = len(goto)
+                    goto.append([-1] * k)
+                    terminal.append(None)
+                state = goto[state][x]
+            terminal[state] = (len(lhs), rhs[::-1])
+
+        delta = array("i", [0]) * (len(goto) * k)
+        match_length = array("i", [0]) * len(goto)
+        match_rhs = [b""] * len(goto)
+        failure = [0] * len(goto)
+        order = []
+        for x in range(k):
+            child = goto[0][x]
+            delta[x] = max(child, 0)
+            if child > 0:
+                order.append(child)
+        for state in order:
+            # The failure link of a state is computed before it is appended, by breadth-first order
+            if terminal[state] is not None:
+                match_length[state], match_rhs[state] = terminal[state]
+            elif match_length[failure[state]]:
+                match_length[state], match_rhs[state] = match_length[failure[state]], match_rhs[failure[state]]
+            for x in range(k):
+                child = goto[state][x]
+                if child >= 0:
+                    failure[child] = delta[failure[state] * k + x]
+                    delta[state * k + x] = child
+                    order.append(child)
+                else:
+                    delta[state * k + x] = delta[failure[state] * k + x]
+        self.delta, self.match_length, self.match_rhs = delta, match_length, match_rhs
+        self.pending.clear()
+        self.statistics["rebuilds"] += 1
+
+    def _rewrite(self, word):
+        """
+        Reduces a packed word with the automaton and the pending rules.
+        """
+        delta, match_length, match_rhs, k = self.delta, self.match_length, self.match_rhs, self.num_letters
+        while True:
+            letters, states = [], [0]
+            stack = list(word[::-1])
+            while stack:
+                x = stack.pop()
+                state = delta[states[-1] * k + x]
+                letters.append(x)
+                states.append(state)
+                length = match_length[state]
+                if length:
+                    stack.extend(match_rhs[state])
+                    del letters[-length:]
+                    del states[-length:]
+            word = bytes(letters)
+            for lhs, rhs in self.pending.items():
+                position = word.find(lhs)
+                if position >= 0:
+                    word = word[:position] + rhs + word[position + len(lhs):]
+                    break
+            else:
+                return word
+
+    def reduce(self, word):
+        """
+        Returns a normal form of a word: an irreducible word equal to it in the group, which is
+        the shortlex smallest such word once the system is confluent.
+
+        :param word: a packed word
+        :return: the packed normal form
+        """
+        if not word:
+            return word
+        cached = self.cache.get(word)
+        if cached is not None:
+            self.cache.move_to_end(word)
+            generation, normal_form = cached
+            if generation == self.generation:
+                self.statistics["cache_hits"] += 1
+                return normal_form
+            word_to_reduce = normal_form
+        else:
+            word_to_reduce = word
+        self.statistics["cache_misses"] += 1
+        if len(word_to_reduce) > self.split_length:
+            half = len(word_to_reduce) // 2
+            word_to_reduce = self.reduce(word_to_reduce[:half]) + self.reduce(word_to_reduce[half:])
+        normal_form = self._rewrite(word_to_reduce)
+        self.cache[word] = (self.generation, normal_form)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return normal_form
+
+    def _index(self, lhs):
+        self.by_length[len(lhs)].add(lhs)
+        for k in range(1, len(lhs)):
+            self.prefixes[lhs[:k]].add(lhs)
+            self.suffixes[lhs[-k:]].add(lhs)
+
+    def _remove_rule(self, lhs):
+        rhs = self.rules.pop(lhs)
+        self.pending.pop(lhs, None)
+        self.by_length[len(lhs)].discard(lhs)
+        for k in range(1, len(lhs)):
+            for table, key in ((self.prefixes, lhs[:k]), (self.suffixes, lhs[-k:])):
+                table[key].discard(lhs)
+                if not table[key]:
+                    del table[key]
+        self.statistics["rules_removed"] += 1
+        return rhs
+
+    def _add_rule(self, lhs, rhs):
+        """
+        Adds the rule lhs -> rhs, with lhs irreducible, interreduces the other rules and queues
+        the critical pairs of the new rule.
+        """
+        # Rules whose left-hand side contains lhs go back to the queue
+        longer = [other for length in self.by_length if length >= len(lhs) for other in self.by_length[length]]
+        for other in longer:
+            if lhs in other:
+                self.push(other, self._remove_rule(other))
+        self.rules[lhs] = rhs
+        self.pending[lhs] = rhs
+        self._index(lhs)
+        self.generation += 1
+        self.statistics["rules_added"] += 1
+        for other in longer:
+            if other in self.rules and lhs in self.rules[other]:
+                self.rules[other] = self.reduce(self.rules[other])
+        if len(self.pending) > max(16, len(self.rules) // 16):
+            self._build()
+
+        # Overlaps of a suffix of lhs with a prefix of another left-hand side, or of lhs itself
+        for k in range(1, len(lhs)):
+            for other in list(self.prefixes.get(lhs[-k:], ())):
+                if self.max_overlap_length is None or len(lhs) + len(other) - k <= self.max_overlap_length:
+                    self.push(rhs + other[k:], lhs[:-k] + self.rules[other])
+        # Overlaps of a prefix of lhs with a suffix of another left-hand side
+        for k in range(1, len(lhs)):
+            for other in list(self.suffixes.get(lhs[:k], ())):
+                if other != lhs and (self.max_overlap_length is None
+                                     or len(lhs) + len(other) - k <= self.max_overlap_length):
+                    self.push(self.rules[other] + lhs[k:], other[:-k] + rhs)
+
+    def complete(self, progress=None, report_interval=10.0):
+        """
+        Runs the completion until the queue is empty or the system has max_rules rules.
+
+        :param progress: a text file for progress reports, None for no reports
+        :param report_interval: the number of seconds between progress reports
+        :return: true if the system is confluent, that is the queue was emptied and no equation
+                 or overlap was dropped by the length bounds
+        """
+        start = last_report = time.monotonic()
+        elapsed = self.statistics["elapsed"]
+        while self.queue:
+            if self.max_rules is not None and len(self.rules) >= self.max_rules:
+                break
+            *_, u, v = heapq.heappop(self.queue)
+            self.statistics["pairs"] += 1
+            u, v = self.reduce(u), self.reduce(v)
+            if u == v:
+                continue
+            lhs, rhs = (u, v) if _greater(u, v) else (v, u)
+            if self.max_length is not None and len(lhs) > self.max_length:
+                self.dropped += 1
+                continue
+            self._add_rule(lhs, rhs)
+            now = time.monotonic()
+            if progress is not None and now - last_report >= report_interval:
+                self.statistics["elapsed"] = elapsed + now - start
+                self.report(progress)
+                last_report = now
+        self.statistics["elapsed"] = elapsed + time.monotonic() - start
+        if progress is not None:
+            self.report(progress)
+        return self.is_confluent()
+
+    def is_confluent(self):
+        return not self.queue and not self.dropped and self.max_overlap_length is None
+
+    def report(self, stream):
+        statistics = self.statistics
+        stream.write("{:.0f}s {} rules, {} queued, {} pairs ({:.0f}/s), {} dropped, longest rule {}, "
+                     "cache {:.0%} hits\n".format(
+                         statistics["elapsed"], len(self.rules), len(self.queue), statistics["pairs"],
+                         statistics["pairs"] / max(statistics["elapsed"], 1e-9), self.dropped,
+                         max(self.by_length, default=0),
+                         statistics["cache_hits"] / max(statistics["cache_hits"] + statistics["cache_misses"], 1)))
+        stream.flush()
+
+    def normal_form(self, word):
+        """
+        Returns the normal form of a word given as a string or a sequence of integers, as a string.
+        """
+        return format_word(self.reduce(pack(word, self.generators)), self.generators)
+
+    def equal(self, u, v):
+        """
+        Returns true if u and v reduce to the same normal form, which for a confluent system
+        means that they are equal in the group.
+        """
+        return self.reduce(pack(u, self.generators)) == self.reduce(pack(v, self.generators))
+
+    def rule_list(self):
+        """
+        Returns the rules as pairs of strings, in shortlex order of the left-hand sides.
+        """
+        return [(format_word(lhs, self.generators), format_word(self.rules[lhs], self.generators))
+                for lhs in sorted(self.rules, key=lambda lhs: (len(lhs), lhs))]
+
+    def growth(self, max_length):
+        """
+        Counts the irreducible words of each length, the growth function of the group once the
+        system is confluent, by dynamic programming on the automaton of the left-hand sides.
+
+        :param max_length: the maximal length
+        :return: the list of counts for the lengths 0, ..., max_length, shorter if there are no
+                 irreducible words of some length, in which case the group is finite of order
+                 the sum of the counts
+        """
+        if self.pending:
+            self._build()
+        k = self.num_letters
+        delta = np.frombuffer(self.delta, dtype=np.int32).reshape(-1, k)
+        reducible = np.frombuffer(self.match_length, dtype=np.int32) > 0
+        counts = np.zeros(len(delta), dtype=np.int64)
+        counts[0] = 1
+        growth = []
+        for _ in range(max_length + 1):
+            growth.append(int(counts.sum()))
+            if not growth[-1]:
+                return growth[:-1]
+            following = np.zeros(len(delta), dtype=np.int64)
+            np.add.at(following, delta.ravel(), np.repeat(counts, k))
+            following[reducible] = 0
+            counts = following
+        return growth
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Knuth-Bendix completion for groups generated by a, b.")
+    parser.add_argument("relators", nargs="*", help="relators as words in a, b, with A, B for the inverses")
+    parser.add_argument("--exponent", type=int, default=5, help="exponent of the power relators")
+    parser.add_argument("--power-length", type=int, default=0,
+                        help="add w^EXPONENT for every word w of at most this length, up to conjugacy and inversion")
+    parser.add_argument("--sample", type=int, default=0,
+                        help="add w^EXPONENT for this many random words w of at most --sample-length letters")
+    parser.add_argument("--sample-length", type=int, default=8, help="maximal length of the sampled words")
+    parser.add_argument("--seed", type=int, help="seed of the sampled relators")
+    parser.add_argument("--max-length", type=int, help="drop equations with a side longer than this")
+    parser.add_argument("--max-overlap-length", type=int, help="skip overlaps longer than this")
+    parser.add_argument("--max-rules", type=int, help="stop when there are this many rules")
+    parser.add_argument("--cache-size", type=int, default=1 << 16, help="number of cached normal forms")
+    parser.add_argument("--growth", type=int, default=0, metavar="LENGTH",
+                        help="print the number of irreducible words of each length up to LENGTH")
+    parser.add_argument("--progress", type=float, default=0, metavar="SECONDS",
+                        help="print a progress line every SECONDS seconds")
+    parser.add_argument("--rules", action="store_true", help="print the rules")
+    args = parser.parse_args()
+
+    relators = list(args.relators)
+    if args.power_length:
+        relators.extend(power_relators(args.exponent, args.power_length))
+    if args.sample:
+        relators.extend(sampled_power_relators(args.exponent, args.sample, args.sample_length, seed=args.seed))
+    system = RewritingSystem(relators, max_length=args.max_length, max_overlap_length=args.max_overlap_length,
+                             max_rules=args.max_rules, cache_size=args.cache_size)
+    confluent = system.complete(sys.stderr if args.progress else None, args.progress or 10.0)
+    print(len(system.rules), "rules,", "confluent" if confluent else "not confluent")
+    if args.rules:
+        for lhs, rhs in system.rule_list():
+            print(lhs or "1", "->", rhs or "1")
+    if args.growth:
+        growth = system.growth(args.growth)
+        print("growth", " ".join(map(str, growth)))
+        if confluent and len(growth) <= args.growth:
+            print("order", sum(growth))
+
+
+if __name__ == '__main__':
+    main()
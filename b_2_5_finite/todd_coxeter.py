@@ -0,0 +1,547 @@
+import argparse
+import itertools
+import os
+import random
+import sys
+import time
+import numpy as np
+
+GENERATORS = "ab"
+STRATEGIES = ("hlt", "felsch")
+
+
+def parse_word(word, generators=GENERATORS):
+    """
+    Converts a word to a tuple of columns of the coset table.
+
+    The generator generators[g] has the column 2g and its inverse the column 2g + 1, so the
+    inverse of the column x is x ^ 1.
+
+    :param word: a string in the generators, with upper case letters for the inverses, or a
+                 sequence of nonzero integers with g + 1 for generators[g] and -(g + 1) for its
+                 inverse
+    :param generators: the lower case names of the generators
+    :return: a tuple of columns
+    """
+    if isinstance(word, str):
+        columns = []
+        for letter in word:
+            if letter.lower() not in generators:
+                raise ValueError("unknown generator " + letter)
+            columns.append(2 * generators.index(letter.lower()) + (letter != letter.lower()))
+        return tuple(columns)
+    return tuple(2 * (abs(letter) - 1) + (letter < 0) for letter in word)
+
+
+def format_word(word, generators=GENERATORS):
+    """
+    Inverse of parse_word for strings.
+    """
+    return "".join(generators[x >> 1].upper() if x & 1 else generators[x >> 1] for x in word)
+
+
+def inverse_word(word):
+    return tuple(x ^ 1 for x in reversed(word))
+
+
+def cyclically_reduce(word):
+    """
+    Freely and cyclically reduces a word given as a tuple of columns.
+    """
+    reduced = []
+    for x in word:
+        if reduced and reduced[-1] == x ^ 1:
+            reduced.pop()
+        else:
+            reduced.append(x)
+    start, end = 0, len(reduced)
+    while end - start > 1 and reduced[start] == reduced[end - 1] ^ 1:
+        start += 1
+        end -= 1
+    return tuple(reduced[start:end])
+
+
+def _cyclic_representative(word):
+    """
+    Returns the smallest rotation of the word or of its inverse.
+    """
+    return min(rotation[i:] + rotation[:i] for rotation in (word, inverse_word(word)) for i in range(len(word)))
+
+
+def _is_proper_power(word):
+    return any(len(word) % k == 0 and word == word[:len(word) // k] * k for k in range(2, len(word) + 1))
+
+
+def power_relators(exponent, max_length, generators=GENERATORS):
+    """
+    Returns the relators w^exponent for all the words w of length at most max_length, up to
+    cyclic permutation and inversion. Proper powers w = u^k are skipped, their relators being
+    consequences of u^exponent.
+
+    :param exponent: the exponent, 5 for B(2,5)
+    :param max_length: the maximal length of w
+    :param generators: the lower case names of the generators
+    :return: a list of relators, as strings
+    """
+    roots = set()
+    for length in range(1, max_length + 1):
+        for word in itertools.product(range(2 * len(generators)), repeat=length):
+            if cyclically_reduce(word) == word and not _is_proper_power(word):
+                roots.add(_cyclic_representative(word))
+    return [format_word(root * exponent, generators) for root in sorted(roots, key=lambda root: (len(root), root))]
+
+
+def sampled_power_relators(exponent, count, max_length, generators=GENERATORS, seed=None):
+    """
+    Returns the relators w^exponent for random cyclically reduced words w, to explore the
+    quotients of the Burnside group by a sample of its defining relators.
+
+    :param exponent: the exponent, 5 for B(2,5)
+    :param count: the number of distinct relators
+    :param max_length: the maximal length of w
+    :param generators: the lower case names of the generators
+    :param seed: the seed of the random generator
+    :return: a list of relators, as strings
+    """
+    generator = random.Random(seed)
+    roots = set()
+    for _ in range(100 * count):
+        if len(roots) == count:
+            break
+        word = cyclically_reduce(tuple(generator.randrange(2 * len(generators))
+                                       for _ in range(generator.randint(1, max_length))))
+        if word and not _is_proper_power(word):
+            roots.add(_cyclic_representative(word))
+    else:
+        raise ValueError("could not sample {} relators of length at most {}".format(count, max_length))
+    return [format_word(root * exponent, generators) for root in sorted(roots, key=lambda root: (len(root), root))]
+
+
+class CosetTableFull(Exception):
+    """
+    Raised when a coset has to be defined and the table already holds max_cosets cosets.
+    """
+
+
+class CosetEnumerator:
+    """
+    Todd-Coxeter enumeration of the cosets of a subgroup of a finitely presented group, with
+    the HLT or the Felsch strategy, following Holt, Eick and O'Brien, Handbook of
+    Computational Group Theory, Section 5.1.
+
+    The coset table is a NumPy int32 array with one row per coset and one column per generator
+    and inverse, -1 meaning undefined, which grows by doubling up to max_cosets rows. The hot
+    loops read and write it through a memoryview, which is much faster than indexing the array
+    from Python. Coincidences are processed with a union-find array, each dead coset pointing to
+    a smaller one. Deductions are kept on a bounded stack; when it overflows, it is cleared and
+    every coset is scanned instead. Dead cosets are removed by compact, which renumbers the live
+    ones in order; enumerate calls it when more than compact_threshold of the rows are dead.
+    """
+
+    def __init__(self, relators, subgroup=(), generators=GENERATORS, max_cosets=1 << 24,
+                 initial_capacity=1 << 12, max_deductions=1 << 16, compact_threshold=0.5):
+        """
+        Creates a table with the single coset 0 of the subgroup.
+
+        :param relators: the relators of the group, as words, see parse_word
+        :param subgroup: the generators of the subgroup, as words
+        :param generators: the lower case names of the generators of the group
+        :param max_cosets: the maximal number of rows of the table
+        :param initial_capacity: the initial number of rows of the table
+        :param max_deductions: the size of the deduction stack
+        :param compact_threshold: the fraction of dead rows above which the table is compacted
+        """
+        self.generators = generators
+        self.num_columns = 2 * len(generators)
+        self.relators = [cyclically_reduce(parse_word(word, generators)) for word in relators]
+        self.relators = [word for word in self.relators if word]
+        self.subgroup = [parse_word(word, generators) for word in subgroup]
+        self.max_cosets = max_cosets
+        self.max_deductions = max_deductions
+        self.compact_threshold = compact_threshold
+
+        # The relators, their inverses and all their rotations, by first letter, for the deductions
+        self.relators_by_column = [[] for _ in range(self.num_columns)]
+        for relator in sorted({rotation[i:] + rotation[:i] for word in self.relators
+                               for rotation in (word, inverse_word(word)) for i in range(len(word))}):
+            self.relators_by_column[relator[0]].append(relator)
+
+        self._allocate(min(initial_capacity, max_cosets))
+        self.num_cosets = 1
+        self.live = 1
+        self.position = 0
+        self.deductions = []
+        self.overflowed = False
+        self.statistics = {"defined": 1, "coincidences": 0, "deductions": 0, "max_live": 1, "compactions": 0,
+                           "elapsed": 0.0}
+
+    def _allocate(self, capacity, table=None, parent=None):
+        self.capacity = capacity
+        self.table = np.full(capacity * self.num_columns, -1, dtype=np.int32)
+        self.parent = np.arange(capacity, dtype=np.int32)
+        if table is not None:
+            self.table[:len(table)] = table
+            self.parent[:len(parent)] = parent
+        self._table = memoryview(self.table)
+        self._parent = memoryview(self.parent)
+
+    def _new_coset(self):
+        if self.num_cosets == self.capacity:
+            if self.capacity == self.max_cosets:
+                raise CosetTableFull()
+            self._allocate(min(2 * self.capacity, self.max_cosets), self.table, self.parent)
+        coset = self.num_cosets
+        self.num_cosets += 1
+        self.live += 1
+        self.statistics["defined"] += 1
+        if self.live > self.statistics["max_live"]:
+            self.statistics["max_live"] = self.live
+        return coset
+
+    def _define(self, coset, x):
+        new = self._new_coset()
+        k = self.num_columns
+        self._table[coset * k + x] = new
+        self._table[new * k + (x ^ 1)] = coset
+        self._push(coset, x)
+
+    def _push(self, coset, x):
+        if len(self.deductions) < self.max_deductions:
+            self.deductions.append((coset, x))
+        else:
+            self.deductions.clear()
+            self.overflowed = True
+
+    def is_live(self, coset):
+        return self._parent[coset] == coset
+
+    def _rep(self, coset):
+        parent = self._parent
+        root = coset
+        while parent[root] != root:
+            root = parent[root]
+        while parent[coset] != root:
+            parent[coset], coset = root, parent[coset]
+        return root
+
+    def _merge(self, first, second, queue):
+        first, second = self._rep(first), self._rep(second)
+        if first == second:
+            return
+        if second < first:
+            first, second = second, first
+        self._parent[second] = first
+        queue.append(second)
+        self.live -= 1
+
+    def _coincidence(self, first, second):
+        """
+        Identifies two cosets and all the cosets that follow from it.
+        """
+        self.statistics["coincidences"] += 1
+        table, k = self._table, self.num_columns
+        queue = []
+        self._merge(first, second, queue)
+        index = 0
+        while index < len(queue):
+            dead = queue[index]
+            index += 1
+            for x in range(k):
+                f = table[dead * k + x]
+                if f < 0:
+                    continue
+                table[f * k + (x ^ 1)] = -1
+                e1, f1 = self._rep(dead), self._rep(f)
+                if table[e1 * k + x] >= 0:
+                    self._merge(f1, table[e1 * k + x], queue)
+                elif table[f1 * k + (x ^ 1)] >= 0:
+                    self._merge(e1, table[f1 * k + (x ^ 1)], queue)
+                else:
+                    table[e1 * k + x] = f1
+                    table[f1 * k + (x ^ 1)] = e1
+                    self._push(e1, x)
+
+    def _scan(self, coset, word, fill):
+        """
+        Scans a word from a coset forwards and backwards, recording the deduction or the
+        coincidence it gives when the scan completes or has a gap of one letter. With fill,
+        the gaps are filled by defining new cosets until the scan completes.
+        """
+        k = self.num_columns
+        f = b = coset
+        i, j = 0, len(word) - 1
+        while True:
+            table = self._table
+            while i <= j and table[f * k + word[i]] >= 0:
+                f = table[f * k + word[i]]
+                i += 1
+            if i > j:
+                if f != coset:
+                    self._coincidence(f, coset)
+                return
+            while j >= i and table[b * k + (word[j] ^ 1)] >= 0:
+                b = table[b * k + (word[j] ^ 1)]
+                j -= 1
+            if j < i:
+                self._coincidence(f, b)
+                return
+            if i == j:
+                self.statistics["deductions"] += 1
+                table[f * k + word[i]] = b
+                table[b * k + (word[i] ^ 1)] = f
+                self._push(f, word[i])
+                return
+            if not fill:
+                return
+            self._define(f, word[i])
+
+    def _process_deductions(self):
+        parent, table, k = self._parent, self._table, self.num_columns
+        while self.deductions or self.overflowed:
+            while self.deductions:
+                coset, x = self.deductions.pop()
+                for relator in self.relators_by_column[x]:
+                    if parent[coset] != coset:
+                        break
+                    self._scan(coset, relator, False)
+                if parent[coset] == coset and table[coset * k + x] >= 0:
+                    other = table[coset * k + x]
+                    for relator in self.relators_by_column[x ^ 1]:
+                        if parent[other] != other:
+                            break
+                        self._scan(other, relator, False)
+            if self.overflowed:
+                self.overflowed = False
+                self.lookahead()
+
+    def lookahead(self):
+        """
+        Scans every live coset with every relator without defining new cosets, to find the
+        deductions and coincidences the table already implies.
+        """
+        parent = self._parent
+        for coset in range(self.num_cosets):
+            for relator in self.relators:
+                if parent[coset] != coset:
+                    break
+                self._scan(coset, relator, False)
+
+    def compact(self):
+        """
+        Removes the dead cosets, renumbering the live ones in order, and the deductions
+        pending on them. The position of the enumeration follows the renumbering.
+        """
+        n, k = self.num_cosets, self.num_columns
+        live = self.parent[:n] == np.arange(n)
+        number = np.cumsum(live, dtype=np.int32) - 1
+        rows = self.table[:n * k].reshape(n, k)[live]
+        rows = np.where(rows >= 0, number[np.maximum(rows, 0)], -1)
+        self.position = int(np.count_nonzero(live[:self.position]))
+        self.deductions = [(int(number[coset]), x) for coset, x in self.deductions if live[coset]]
+        self.num_cosets = self.live = len(rows)
+        self.table[:len(rows) * k] = rows.ravel()
+        self.table[len(rows) * k:] = -1
+        self.parent[:] = np.arange(self.capacity, dtype=np.int32)
+        self.statistics["compactions"] += 1
+
+    def is_complete(self):
+        """
+        Returns true if every live coset has all its columns defined.
+        """
+        n, k = self.num_cosets, self.num_columns
+        live = self.parent[:n] == np.arange(n)
+        return bool((self.table[:n * k].reshape(n, k)[live] >= 0).all())
+
+    def index(self):
+        """
+        Returns the number of live cosets, the index of the subgroup once the table is complete.
+        """
+        return self.live
+
+    def coset_table(self):
+        """
+        Returns the table of the live cosets, renumbered in order.
+        """
+        self.compact()
+        return self.table[:self.num_cosets * self.num_columns].reshape(self.num_cosets, self.num_columns).copy()
+
+    def _step(self, coset, strategy):
+        """
+        Processes one coset of the enumeration.
+        """
+        parent, table, k = self._parent, self._table, self.num_columns
+        if strategy == "hlt":
+            for relator in self.relators:
+                if parent[coset] != coset:
+                    return
+                self._scan(coset, relator, True)
+            for x in range(k):
+                if parent[coset] == coset and self._table[coset * k + x] < 0:
+                    self._define(coset, x)
+            self.deductions.clear()
+            self.overflowed = False
+        else:
+            for x in range(k):
+                if parent[coset] == coset and self._table[coset * k + x] < 0:
+                    self._define(coset, x)
+                    self._process_deductions()
+
+    def enumerate(self, strategy="hlt", progress=None, report_interval=10.0, checkpoint_path=None,
+                  checkpoint_interval=600.0):
+        """
+        Runs the enumeration until the table is complete or full.
+
+        With HLT, every coset in turn is scanned with every relator, defining new cosets to
+        fill the gaps, and its undefined columns are then defined. With Felsch, the undefined
+        columns of every coset in turn are defined, and each definition is followed by the
+        processing of the deductions it implies, so that no coset is defined before the
+        consequences of the previous ones are known. When the table is full, the enumeration
+        scans all cosets for coincidences (see lookahead), compacts the table and continues if
+        that freed enough rows, and stops otherwise.
+
+        :param strategy: "hlt" or "felsch"
+        :param progress: a text file for progress reports, None for no reports
+        :param report_interval: the number of seconds between progress reports
+        :param checkpoint_path: the file to save the enumeration to, see save, None for no
+                                checkpoints
+        :param checkpoint_interval: the number of seconds between checkpoints
+        :return: the index of the subgroup, or None if the table is full
+        """
+        if strategy not in STRATEGIES:
+            raise ValueError("unknown strategy " + strategy)
+        start = last_report = last_checkpoint = time.monotonic()
+        elapsed = self.statistics["elapsed"]
+        if self.position == 0:
+            for word in self.subgroup:
+                self._scan(0, word, True)
+            if strategy == "felsch":
+                self._process_deductions()
+        index = None
+        while self.position < self.num_cosets:
+            try:
+                if self.is_live(self.position):
+                    self._step(self.position, strategy)
+                self.position += 1
+            except CosetTableFull:
+                # Give up unless the coincidences found free at least 1/64 of the table
+                self.deductions.clear()
+                self.lookahead()
+                self.compact()
+                if self.capacity - self.num_cosets <= self.capacity // 64:
+                    break
+            if self.num_cosets - self.live > self.compact_threshold * self.num_cosets > 1024:
+                self.compact()
+            now = time.monotonic()
+            self.statistics["elapsed"] = elapsed + now - start
+            if progress is not None and now - last_report >= report_interval:
+                self.report(progress)
+                last_report = now
+            # Checkpoints are only taken between cosets, when no deduction is pending
+            if checkpoint_path is not None and now - last_checkpoint >= checkpoint_interval:
+                self.save(checkpoint_path)
+                last_checkpoint = now
+        else:
+            index = self.index()
+        self.statistics["elapsed"] = elapsed + time.monotonic() - start
+        if progress is not None:
+            self.report(progress)
+        if checkpoint_path is not None:
+            self.save(checkpoint_path)
+        return index
+
+    def report(self, stream):
+        statistics = self.statistics
+        stream.write("{:.0f}s coset {}/{}, {} live (max {}), {} defined ({:.0f}/s), {} coincidences, "
+                     "{} deductions, {:.0f} MiB\n".format(
+                         statistics["elapsed"], self.position, self.num_cosets, self.live, statistics["max_live"],
+                         statistics["defined"], statistics["defined"] / max(statistics["elapsed"], 1e-9),
+                         statistics["coincidences"], statistics["deductions"],
+                         (self.table.nbytes + self.parent.nbytes) / (1 << 20)))
+        stream.flush()
+
+    def save(self, path):
+        """
+        Saves the enumeration, at a point where no deduction is pending, to a NumPy .npz file.
+
+        :param path: the file to write to
+        """
+        relators = [np.array(word, dtype=np.int8) for word in self.relators + [()] + self.subgroup]
+        temporary = path + ".tmp"
+        with open(temporary, "wb") as file:
+            np.savez(file, generators=np.frombuffer(self.generators.encode(), dtype=np.uint8),
+                     table=self.table[:self.num_cosets * self.num_columns], parent=self.parent[:self.num_cosets],
+                     state=np.array([self.num_columns, self.num_cosets, self.live, self.position, self.max_cosets,
+                                     self.max_deductions], dtype=np.int64),
+                     statistics=np.array([self.statistics[key] for key in sorted(self.statistics)]),
+                     lengths=np.array([len(word) for word in relators], dtype=np.int64),
+                     words=np.concatenate(relators))
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path, compact_threshold=0.5):
+        """
+        Loads an enumeration saved by save, to continue it with enumerate.
+
+        :param path: the file to read
+        :param compact_threshold: see __init__
+        :return: the enumerator
+        """
+        with np.load(path) as data:
+            num_columns, num_cosets, live, position, max_cosets, max_deductions = data["state"].tolist()
+            generators = data["generators"].tobytes().decode()
+            words = np.split(data["words"], np.cumsum(data["lengths"])[:-1])
+            words = [format_word(word.tolist(), generators) for word in words]
+            separator = words.index("")
+            enumerator = cls(words[:separator], words[separator + 1:], generators, max_cosets, 1, max_deductions,
+                             compact_threshold)
+            capacity = 1 << max(num_cosets - 1, 1).bit_length()
+            enumerator._allocate(min(capacity, max_cosets), data["table"], data["parent"])
+            enumerator.num_cosets, enumerator.live, enumerator.position = num_cosets, live, position
+            keys = sorted(enumerator.statistics)
+            enumerator.statistics.update((key, value if key == "elapsed" else int(value))
+                                         for key, value in zip(keys, data["statistics"].tolist()))
+        return enumerator
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Todd-Coxeter coset enumeration for groups generated by a, b.")
+    parser.add_argument("relators", nargs="*", help="relators as words in a, b, with A, B for the inverses")
+    parser.add_argument("--subgroup", nargs="*", default=[], help="generators of the subgroup")
+    parser.add_argument("--exponent", type=int, default=5, help="exponent of the power relators")
+    parser.add_argument("--power-length", type=int, default=0,
+                        help="add w^EXPONENT for every word w of at most this length, up to conjugacy and inversion")
+    parser.add_argument("--sample", type=int, default=0,
+                        help="add w^EXPONENT for this many random words w of at most --sample-length letters")
+    parser.add_argument("--sample-length", type=int, default=8, help="maximal length of the sampled words")
+    parser.add_argument("--seed", type=int, help="seed of the sampled relators")
+    parser.add_argument("--strategy", choices=STRATEGIES, default="hlt", help="coset enumeration strategy")
+    parser.add_argument("--max-cosets", type=int, default=1 << 24, help="maximal number of rows of the table")
+    parser.add_argument("--progress", type=float, default=0, metavar="SECONDS",
+                        help="print a progress line every SECONDS seconds")
+    parser.add_argument("--checkpoint", help="save the enumeration to this file periodically")
+    parser.add_argument("--checkpoint-interval", type=float, default=600, help="seconds between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue the enumeration saved in --checkpoint")
+    args = parser.parse_args()
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume needs --checkpoint")
+
+    if args.resume:
+        enumerator = CosetEnumerator.load(args.checkpoint)
+    else:
+        relators = list(args.relators)
+        if args.power_length:
+            relators.extend(power_relators(args.exponent, args.power_length))
+        if args.sample:
+            relators.extend(sampled_power_relators(args.exponent, args.sample, args.sample_length, seed=args.seed))
+        enumerator = CosetEnumerator(relators, args.subgroup, max_cosets=args.max_cosets)
+        print(len(enumerator.relators), "relators")
+    index = enumerator.enumerate(args.strategy, sys.stderr if args.progress else None, args.progress or 10.0,
+                                 args.checkpoint, args.checkpoint_interval)
+    if index is None:
+        print("coset table full with", enumerator.live, "live cosets")
+    else:
+        print("index", index)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,306 @@
+import numpy as np
+
+# Largest prime below 2^30: products of two residues summed over a row of a 4x4 matrix fit in an int64
+DEFAULT_PRIME = 1073741789
+
+
+def pad_words(words, length=None):
+    """
+    Stacks braid words of different lengths into one array, padded with zeros.
+
+    :param words: an iterable of words, sequences of nonzero integers with i for the generator
+                  sigma_i and -i for its inverse
+    :param length: the length of the rows, None for the length of the longest word
+    :return: an integer array of shape (batch, length)
+    """
+    words = [np.asarray(word, dtype=np.int64).ravel() for word in words]
+    if length is None:
+        length = max((len(word) for word in words), default=0)
+    padded = np.zeros((len(words), length), dtype=np.int64)
+    for index, word in enumerate(words):
+        padded[index, :len(word)] = word
+    return padded
+
+
+def random_t_values(p, count, n=None, seed=None):
+    """
+    Draws random values of t in F_p other than 0 and 1, as FastIdentityChecker does.
+
+    :param p: a prime
+    :param count: the number of points
+    :param n: the number of strands to draw one value per strand for the colored Burau
+              representation, None for a single value per point
+    :param seed: the seed of the random generator
+    :return: an integer array of shape (count,), or (count, n)
+    """
+    generator = np.random.default_rng(seed)
+    shape = (count,) if n is None else (count, n)
+    return generator.integers(2, p, size=shape, dtype=np.int64)
+
+
+def _check_words(words, n):
+    words = np.asarray(words, dtype=np.int64)
+    if words.ndim != 2:
+        raise ValueError("words must have shape (batch, length)")
+    if (np.abs(words) >= n).any():
+        raise ValueError("index of a generator is out of range")
+    return words
+
+
+def _check_prime(p, n):
+    if n * (p - 1) ** 2 >= 1 << 63:
+        raise ValueError("p is too large for exact int64 products of {}x{} matrices".format(n, n))
+
+
+def _generator_matrices(words, values, n, p):
+    """
+    Builds the matrices of the letters of the words, as CBMatrix does: sigma_i replaces the row
+    i-1 of the identity by (..., t, -t, 1, ...) and sigma_i^-1 by (..., 1, -1/t, 1/t, ...), the
+    first entry being dropped for i = 1. Zeros give the identity.
+
+    :param words: an integer array of shape (batch, length)
+    :param values: an array of shape (batch, points, length) holding t for the positive letters
+                   and 1/t for the negative ones, modulo p
+    :return: an array of shape (batch, points, length, n, n)
+    """
+    batch, length = words.shape
+    points = values.shape[1]
+    matrices = np.zeros((batch, points, length, n, n), dtype=np.int64)
+    diagonal = np.arange(n)
+    matrices[..., diagonal, diagonal] = 1
+
+    rows, positions = np.nonzero(words)
+    letters = words[rows, positions]
+    r = np.abs(letters) - 1
+    v = values[rows, :, positions]
+    positive = (letters > 0)[:, None]
+    matrices[rows, :, positions, r, r] = (p - v) % p
+    matrices[rows, :, positions, r, r + 1] = np.where(positive, 1, v)
+    # sigma_1 has no entry left of the diagonal
+    left = r > 0
+    rows, positions, r, v, positive = rows[left], positions[left], r[left], v[left], positive[left]
+    matrices[rows, :, positions, r, r - 1] = np.where(positive, v, 1)
+    return matrices
+
+
+def _product_mod_p(matrices, p):
+    """
+    Multiplies the matrices along the third axis from the last, in order, by a reduction tree:
+    each level multiplies adjacent pairs of matrices for the whole batch at once.
+    """
+    n = matrices.shape[-1]
+    while matrices.shape[-3] > 1:
+        if matrices.shape[-3] % 2:
+            identity = np.broadcast_to(np.eye(n, dtype=np.int64), matrices.shape[:-3] + (1, n, n))
+            matrices = np.concatenate((matrices, identity), axis=-3)
+        matrices = np.matmul(matrices[..., 0::2, :, :], matrices[..., 1::2, :, :]) % p
+    if matrices.shape[-3] == 0:
+        return np.broadcast_to(np.eye(n, dtype=np.int64), matrices.shape[:-3] + (n, n)).copy()
+    return matrices[..., 0, :, :]
+
+
+def _inverse_mod_p(values, p):
+    return np.vectorize(lambda value: pow(int(value), -1, p), otypes=[np.int64])(values)
+
+
+def burau_mod_p(words, t_values, p=DEFAULT_PRIME, n=4, chunk_size=4096):
+    """
+    Computes the Burau matrices of a batch of braid words on n strands, with t specialised to
+    points of F_p.
+
+    The matrices are those of CBImage with all the t_i equal to t, so that a word is in the
+    kernel of the Burau representation if and only if its matrix is the identity for t
+    transcendental. Words are processed in chunks of chunk_size words, and the matrices of a
+    chunk are multiplied as a batch, see _product_mod_p.
+
+    :param words: an integer array of shape (batch, length), see pad_words
+    :param t_values: the points, an integer array of shape (points,)
+    :param p: a prime with n (p - 1)^2 < 2^63
+    :param n: the number of strands
+    :param chunk_size: the number of words processed together
+    :return: an integer array of shape (batch, points, n, n)
+    """
+    words = _check_words(words, n)
+    _check_prime(p, n)
+    t_values = np.asarray(t_values, dtype=np.int64).ravel() % p
+    inverses = _inverse_mod_p(t_values, p)
+    result = np.empty((len(words), len(t_values), n, n), dtype=np.int64)
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start:start + chunk_size]
+        values = np.where(chunk[:, None, :] > 0, t_values[None, :, None], inverses[None, :, None])
+        result[start:start + chunk_size] = _product_mod_p(_generator_matrices(chunk, values, n, p), p)
+    return result
+
+
+def colored_burau_mod_p(words, t_values, p=DEFAULT_PRIME, n=4, chunk_size=4096):
+    """
+    Computes the colored Burau images of a batch of braid words on n strands, with the
+    variables t_1, ..., t_n specialised to points of F_p, like CBProjectionElement.
+
+    The letter sigma_i at a position where the permutation of the prefix is s uses t_{s(i-1)},
+    and sigma_i^-1 uses t_{s(i)}^-1, numbering strands from 0. The permutations of all the
+    prefixes are computed first, one position at a time for the whole chunk, and the matrices
+    are then multiplied as in burau_mod_p.
+
+    :param words: an integer array of shape (batch, length), see pad_words
+    :param t_values: the points, an integer array of shape (points, n)
+    :param p: a prime with n (p - 1)^2 < 2^63
+    :param n: the number of strands
+    :param chunk_size: the number of words processed together
+    :return: the matrices, an integer array of shape (batch, points, n, n), and the
+             permutations, an integer array of shape (batch, n)
+    """
+    words = _check_words(words, n)
+    _check_prime(p, n)
+    t_values = np.asarray(t_values, dtype=np.int64).reshape(-1, n) % p
+    inverses = _inverse_mod_p(t_values, p)
+    matrices = np.empty((len(words), len(t_values), n, n), dtype=np.int64)
+    permutations = np.empty((len(words), n), dtype=np.int64)
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start:start + chunk_size]
+        batch, length = chunk.shape
+        rows = np.arange(batch)
+        permutation = np.broadcast_to(np.arange(n), (batch, n)).copy()
+        strands = np.zeros((batch, length), dtype=np.int64)
+        for position in range(length):
+            letters = chunk[:, position]
+            i = np.maximum(np.abs(letters), 1)
+            strands[:, position] = permutation[rows, np.where(letters > 0, i - 1, i)]
+            moving = np.nonzero(letters)[0]
+            i = i[moving]
+            permutation[moving, i - 1], permutation[moving, i] = permutation[moving, i], permutation[moving, i - 1]
+        values = np.where(chunk[:, None, :] > 0, t_values.T[strands].transpose(0, 2, 1),
+                          inverses.T[strands].transpose(0, 2, 1))
+        matrices[start:start + chunk_size] = _product_mod_p(_generator_matrices(chunk, values, n, p), p)
+        permutations[start:start + chunk_size] = permutation
+    return matrices, permutations
+
+
+def _multiply_laurent(a, b):
+    """
+    Multiplies matrices of Laurent polynomials stored as coefficient arrays along the last axis.
+
+    :param a: an array of shape (..., n, n, d1)
+    :param b: an array of shape (..., n, n, d2)
+    :return: an array of shape (..., n, n, d1 + d2 - 1)
+    """
+    d2 = b.shape[-1]
+    product = np.zeros(a.shape[:-1] + (a.shape[-1] + d2 - 1,), dtype=a.dtype)
+    for shift in range(a.shape[-1]):
+        product[..., shift:shift + d2] += (a[..., :, :, None, None, shift] * b[..., None, :, :, :]).sum(axis=-3)
+    return product
+
+
+def _trim_laurent(coefficients, offset):
+    """
+    Drops the leading and trailing coefficients that are zero in every entry.
+    """
+    nonzero = np.nonzero(coefficients.reshape(-1, coefficients.shape[-1]).any(axis=0))[0]
+    if len(nonzero) == 0:
+        return coefficients[..., :1], 0
+    return coefficients[..., nonzero[0]:nonzero[-1] + 1], offset - int(nonzero[0])
+
+
+def burau_exact(words, n=4, chunk_size=1024):
+    """
+    Computes the Burau matrices of a batch of braid words on n strands with exact Laurent
+    polynomial entries in t.
+
+    An entry is stored as a dense array of integer coefficients with an exponent offset shared
+    by the whole batch: coefficients[..., k] is the coefficient of t^(k - offset). The matrices
+    are multiplied by the same reduction tree as in burau_mod_p, multiplying polynomials by
+    convolution of the coefficient arrays. The sum of the absolute values of the coefficients
+    of a row grows at most by a factor 3 per letter, so the coefficients are int64 for words
+    of length at most 39 and Python integers beyond.
+
+    :param words: an integer array of shape (batch, length), see pad_words
+    :param n: the number of strands
+    :param chunk_size: the number of words processed together
+    :return: the coefficients, an array of shape (batch, n, n, d), and the offset
+    """
+    words = _check_words(words, n)
+    length = int(np.count_nonzero(words, axis=1).max(initial=0))
+    dtype = np.int64 if length <= 39 else object
+    chunks = []
+    for start in range(0, len(words), chunk_size):
+        chunk = words[start:start + chunk_size]
+        # The letters as in _generator_matrices, with the coefficients of t^-1, t^0 and t^1
+        coefficients = np.zeros(chunk.shape + (n, n, 3), dtype=dtype)
+        diagonal = np.arange(n)
+        coefficients[:, :, diagonal, diagonal, 1] = 1
+        rows, positions = np.nonzero(chunk)
+        letters = chunk[rows, positions]
+        r = np.abs(letters) - 1
+        positive = letters > 0
+        coefficients[rows, positions, r, r, 1] = 0
+        coefficients[rows, positions, r, r, np.where(positive, 2, 0)] = -1
+        coefficients[rows, positions, r, r + 1, np.where(positive, 1, 0)] = 1
+        left = r > 0
+        coefficients[rows[left], positions[left], r[left], r[left] - 1, np.where(positive[left], 2, 1)] = 1
+        offset = 1
+        while coefficients.shape[1] > 1:
+            if coefficients.shape[1] % 2:
+                identity = np.zeros((len(chunk), 1, n, n, coefficients.shape[-1]), dtype=dtype)
+                identity[:, :, diagonal, diagonal, offset] = 1
+                coefficients = np.concatenate((coefficients, identity), axis=1)
+            coefficients = _multiply_laurent(coefficients[:, 0::2], coefficients[:, 1::2])
+            coefficients, offset = _trim_laurent(coefficients, 2 * offset)
+        if coefficients.shape[1] == 0:
+            coefficients = np.zeros((len(chunk), 1, n, n, 1), dtype=dtype)
+            coefficients[:, :, diagonal, diagonal, 0] = 1
+            offset = 0
+        chunks.append((coefficients[:, 0], offset))
+
+    # Align the chunks on a common offset
+    offset = max((chunk_offset for _, chunk_offset in chunks), default=0)
+    width = max((chunk.shape[-1] - chunk_offset for chunk, chunk_offset in chunks), default=1) + offset
+    result = np.zeros((len(words), n, n, width), dtype=dtype)
+    start = 0
+    for chunk, chunk_offset in chunks:
+        result[start:start + len(chunk), ..., offset - chunk_offset:offset - chunk_offset + chunk.shape[-1]] = chunk
+        start += len(chunk)
+    return _trim_laurent(result, offset) if len(words) else (result, offset)
+
+
+def evaluate_laurent(coefficients, offset, t_values, p=DEFAULT_PRIME):
+    """
+    Evaluates Laurent polynomials stored as by burau_exact at points of F_p, by Horner's rule.
+
+    :param coefficients: an array of shape (..., d)
+    :param offset: the exponent offset
+    :param t_values: the points, an integer array of shape (points,)
+    :param p: a prime below 2^31
+    :return: an integer array of shape (..., points)
+    """
+    t_values = np.asarray(t_values, dtype=np.int64).ravel() % p
+    coefficients = (coefficients % p).astype(np.int64)
+    values = np.zeros(coefficients.shape[:-1] + (len(t_values),), dtype=np.int64)
+    for k in range(coefficients.shape[-1] - 1, -1, -1):
+        values = (values * t_values + coefficients[..., k, None]) % p
+    scale = np.array([pow(int(t), -offset, p) for t in t_values], dtype=np.int64)
+    return values * scale % p
+
+
+def is_identity_mod_p(matrices):
+    """
+    Returns which words have the identity matrix at every point.
+
+    :param matrices: an integer array of shape (batch, points, n, n), see burau_mod_p
+    :return: a boolean array of shape (batch,)
+    """
+    return (matrices == np.eye(matrices.shape[-1], dtype=np.int64)).all(axis=(1, 2, 3))
+
+
+def is_identity_laurent(coefficients, offset):
+    """
+    Returns which words have the identity matrix as exact Burau image.
+
+    :param coefficients: an array of shape (batch, n, n, d), see burau_exact
+    :param offset: the exponent offset
+    :return: a boolean array of shape (batch,)
+    """
+    n, d = coefficients.shape[-2:]
+    identity = np.zeros((n, n, d), dtype=np.int64)
+    if 0 <= offset < d:
+        identity[np.arange(n), np.arange(n), offset] = 1
+    return (coefficients == identity).all(axis=(1, 2, 3))
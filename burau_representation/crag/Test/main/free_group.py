@@ -0,0 +1,270 @@
+import hashlib
+from collections import OrderedDict, defaultdict, deque
+import numpy as np
+
+
+class Folding:
+    """
+    A partition of the vertices of a labeled graph that is closed under Stallings folding:
+    two edges with the same label out of, or into, the same block have their other ends in
+    the same block. Vertices are numbered 0, ..., n-1 and every block is represented by its
+    smallest vertex in a union-find.
+    """
+
+    def __init__(self, n, edges):
+        self.parent = list(range(n))
+        self.out = [{} for _ in range(n)]  # label -> some head of an edge out of the block
+        self.into = [{} for _ in range(n)]  # label -> some tail of an edge into the block
+        for u, v, label in edges:
+            self._add_edge(u, v, label)
+
+    def copy(self):
+        folding = Folding.__new__(Folding)
+        folding.parent = list(self.parent)
+        folding.out = [dict(table) for table in self.out]
+        folding.into = [dict(table) for table in self.into]
+        return folding
+
+    def find(self, x):
+        while self.parent[x] != x:
+            self.parent[x] = self.parent[self.parent[x]]
+            x = self.parent[x]
+        return x
+
+    def _add_edge(self, u, v, label):
+        pending = []
+        for table, x, y in ((self.out, u, v), (self.into, v, u)):
+            root = self.find(x)
+            if label in table[root]:
+                pending.append((table[root][label], y))
+            else:
+                table[root][label] = y
+        for x, y in pending:
+            self.merge(x, y)
+
+    def merge(self, x, y):
+        """Merges the blocks of x and y, and folds until the partition is closed again."""
+        pending = [(x, y)]
+        while pending:
+            x, y = pending.pop()
+            x, y = self.find(x), self.find(y)
+            if x == y:
+                continue
+            if y < x:
+                x, y = y, x
+            self.parent[y] = x
+            # Edges with the same label out of or into the merged block must be identified
+            for table in (self.out, self.into):
+                for label, end in table[y].items():
+                    if label in table[x]:
+                        pending.append((table[x][label], end))
+                    else:
+                        table[x][label] = end
+                table[y] = {}
+
+    def edges(self):
+        """Returns the edges of the folded graph, between block representatives."""
+        return [(root, self.find(end), label)
+                for root in range(len(self.parent)) if self.find(root) == root
+                for label, end in self.out[root].items()]
+
+
+def canonical_key(edges, root):
+    """
+    Returns a key of the connected component of root in a folded labeled graph, equal for
+    two such graphs if and only if they are isomorphic by an isomorphism fixing the root.
+
+    Vertices are numbered in the order a breadth-first search from the root discovers them,
+    following the edges out of and then into each vertex by increasing label. Folded graphs
+    have at most one such edge per label, so the numbering does not depend on the names of
+    the vertices.
+    """
+    out, into = defaultdict(dict), defaultdict(dict)
+    for u, v, label in edges:
+        out[u][label] = v
+        into[v][label] = u
+
+    number = {root: 0}
+    queue = deque([root])
+    key = []
+    while queue:
+        u = queue.popleft()
+        for direction, table in ((0, out[u]), (1, into[u])):
+            for label in sorted(table):
+                v = table[label]
+                if v not in number:
+                    number[v] = len(number)
+                    queue.append(v)
+                if direction == 0:
+                    key.append((number[u], number[v], label))
+    return len(number), tuple(key)
+
+
+def free_reduce(word):
+    """
+    Freely reduces a word, given as a sequence of nonzero integers with -a the inverse of a.
+    Returns the reduced word as a tuple.
+    """
+    reduced = []
+    for letter in word:
+        if reduced and reduced[-1] == -letter:
+            reduced.pop()
+        else:
+            reduced.append(letter)
+    return tuple(reduced)
+
+
+def inverse(word):
+    """Returns the inverse of a word."""
+    return tuple(-letter for letter in reversed(word))
+
+
+def shortlex(word):
+    """
+    Sort key ordering words by length, then lexicographically with the letters ordered
+    1 < -1 < 2 < -2 < ...
+    """
+    return len(word), tuple((abs(letter), letter < 0) for letter in word)
+
+
+def pack_words(words):
+    """
+    Packs words into bytes, as an int32 array holding the length of each word followed by
+    its letters.
+    """
+    packed = []
+    for word in words:
+        packed.append(len(word))
+        packed.extend(word)
+    return np.array(packed, dtype=np.int32).tobytes()
+
+
+def unpack_words(data):
+    """Inverse of pack_words."""
+    values = np.frombuffer(data, dtype=np.int32).tolist()
+    words, position = [], 0
+    while position < len(values):
+        length = values[position]
+        words.append(tuple(values[position + 1:position + 1 + length]))
+        position += 1 + length
+    return words
+
+
+def stallings_graph(words):
+    """
+    Builds the Stallings graph of the subgroup generated by the words: the flower of the
+    words at the root 0, folded, with the trees hanging off it removed except for the path
+    to the root.
+    Returns the edges (u, v, label) and the root.
+    """
+    edges, num_vertices = [], 1
+    for word in words:
+        current = 0
+        for k, letter in enumerate(word):
+            # The last letter of a word returns to the root
+            following = 0 if k == len(word) - 1 else num_vertices
+            if following:
+                num_vertices += 1
+            edges.append((current, following, letter) if letter > 0 else (following, current, -letter))
+            current = following
+    folding = Folding(num_vertices, edges)
+    edges, root = folding.edges(), folding.find(0)
+
+    # Remove the vertices of degree 1 other than the root until there are none
+    degree = defaultdict(int)
+    incident = defaultdict(list)
+    for edge in edges:
+        for v in edge[:2]:
+            degree[v] += 1
+            incident[v].append(edge)
+    removed = set()
+    hanging = [v for v in degree if degree[v] == 1 and v != root]
+    while hanging:
+        v = hanging.pop()
+        for edge in incident[v]:
+            if edge in removed:
+                continue
+            removed.add(edge)
+            for w in edge[:2]:
+                degree[w] -= 1
+                if degree[w] == 1 and w != root:
+                    hanging.append(w)
+    return [edge for edge in edges if edge not in removed], root
+
+
+def nielsen_reduce(words):
+    """
+    Returns a canonical Nielsen-reduced basis of the subgroup generated by the words, so that
+    two generating sets give the same basis if and only if they generate the same subgroup.
+
+    The basis is read off the Stallings graph of the subgroup (see stallings_graph) with the
+    spanning tree of a breadth-first search from the root, which follows the edges out of and
+    then into each vertex by increasing label. Every non-tree edge u -> v with label a gives
+    the generator w(u) a w(v)^-1, w(x) being the tree word from the root to x. The tree is
+    geodesic, so this Schreier basis is Nielsen-reduced, and the search only depends on the
+    labels, so it is canonical. Each generator is replaced by its inverse if that is smaller
+    in the shortlex order, and the basis is sorted in that order.
+
+    :param words: an iterable of words, sequences of nonzero integers
+    :return: the basis, as a tuple of tuples
+    """
+    edges, root = stallings_graph([word for word in map(free_reduce, words) if word])
+    out, into = defaultdict(dict), defaultdict(dict)
+    for u, v, label in edges:
+        out[u][label] = v
+        into[v][label] = u
+
+    tree_words = {root: ()}
+    tree_edges = set()
+    queue = deque([root])
+    while queue:
+        u = queue.popleft()
+        for sign, table in ((1, out[u]), (-1, into[u])):
+            for label in sorted(table):
+                v = table[label]
+                if v not in tree_words:
+                    tree_words[v] = tree_words[u] + (sign * label,)
+                    tree_edges.add((u, v, label) if sign > 0 else (v, u, label))
+                    queue.append(v)
+
+    basis = []
+    for u, v, label in edges:
+        if (u, v, label) in tree_edges:
+            continue
+        word = free_reduce(tree_words[u] + (label,) + inverse(tree_words[v]))
+        basis.append(min(word, inverse(word), key=shortlex))
+    return tuple(sorted(basis, key=shortlex))
+
+
+class GeneratorCache:
+    """
+    Bounded LRU cache of canonical bases (see nielsen_reduce), keyed by a hash of the set of
+    freely reduced generators, so that repeated generating sets are only reduced once.
+    """
+
+    def __init__(self, maxsize=1 << 16):
+        self.maxsize = maxsize
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def reduce(self, words):
+        """
+        Returns the canonical basis of the subgroup generated by the words.
+
+        :param words: an iterable of words, sequences of nonzero integers
+        :return: the basis, as a tuple of tuples
+        """
+        reduced = sorted({word for word in map(free_reduce, words) if word}, key=shortlex)
+        key = hashlib.blake2b(pack_words(reduced), digest_size=16).digest()
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return self.cache[key]
+        self.misses += 1
+        basis = nielsen_reduce(reduced)
+        self.cache[key] = basis
+        if len(self.cache) > self.maxsize:
+            self.cache.popitem(last=False)
+        return basis
+
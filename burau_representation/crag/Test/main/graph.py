@@ -1,130 +1,442 @@
+import argparse
 import itertools
+import json
+import numbers
+import os
+import sys
+import time
 import networkx as nx
-from collections import defaultdict
+import numpy as np
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from free_group import Folding, GeneratorCache, canonical_key
 
 
 def all_partitions(vertices):
-    """Generate all unique partitions of a set of vertices."""
-    if len(vertices) == 0:
-        return [[]]
-    
-    first = vertices[0]
-    rest_partitions = all_partitions(vertices[1:])
-    
-    unique_partitions = []
-    for partition in rest_partitions:
-        # Create a new partition with `first` as a separate subset
-        unique_partitions.append([[first]] + partition)
-        
-        # Try adding `first` to existing subsets
-        for i in range(len(partition)):
-            new_partition = [subset if j != i else subset + [first] for j, subset in enumerate(partition)]
-            unique_partitions.append(new_partition)
-    
-    return unique_partitions
+    """
+    Generate all set partitions of a list of vertices, lazily.
+
+    Each partition is yielded as a restricted growth string: a tuple a with a[k] the block of
+    vertices[k], where a[0] = 0 and a[k] <= 1 + max(a[0], ..., a[k-1]). The strings are generated
+    in lexicographic order by Knuth's Algorithm H (TAOCP 7.2.1.5) in constant amortized time,
+    using memory linear in the number of vertices whatever the number of partitions.
+    """
+    n = len(vertices)
+    a = [0] * n
+    if n <= 1:
+        yield tuple(a)
+        return
+
+    # b[j] is 1 + max(a[0], ..., a[j-1]), the largest value a[j] may take, and m is b[n-1]
+    b = [1] * n
+    m = 1
+    while True:
+        yield tuple(a)
+        if a[n - 1] != m:
+            a[n - 1] += 1
+            continue
+
+        # Find the rightmost position below n-1 that can be increased
+        j = n - 2
+        while a[j] == b[j]:
+            j -= 1
+        if j == 0:
+            return
+        a[j] += 1
+
+        # Reset the positions after it
+        m = b[j] + (a[j] == b[j])
+        for k in range(j + 1, n - 1):
+            a[k] = 0
+            b[k] = m
+        a[n - 1] = 0
+
+
+def partition_blocks(vertices, rgs):
+    """Converts a restricted growth string over the vertices to a list of blocks."""
+    blocks = [[] for _ in range(max(rgs, default=-1) + 1)]
+    for v, block in zip(vertices, rgs):
+        blocks[block].append(v)
+    return blocks
+
+
+class LabeledGraph:
+    """
+    A directed multigraph with integer edge labels on the vertices 0, ..., n-1, stored as
+    NumPy arrays of edge sources, targets and labels sorted by (source, target, label), with
+    CSR offsets so that the edges out of v are those in offsets[v]:offsets[v+1].
+    A lightweight replacement for nx.MultiDiGraph in the functions of this module.
+    """
+
+    def __init__(self, num_vertices, src, dst, label):
+        # Edges are encoded as single integers ordered like (source, target, label), with
+        # labels replaced by their rank, so that sorting and merging work on one array
+        self.label_values, label_code = np.unique(np.asarray(label, dtype=np.int64), return_inverse=True)
+        codes = (np.asarray(src, dtype=np.int64) * num_vertices + np.asarray(dst, dtype=np.int64)) \
+            * len(self.label_values) + label_code
+        self._set_codes(num_vertices, np.sort(codes))
+
+    def _set_codes(self, num_vertices, codes):
+        num_labels = max(len(self.label_values), 1)
+        self.num_vertices = num_vertices
+        self.src = codes // (num_vertices * num_labels)
+        self.dst = codes // num_labels % num_vertices
+        self.label_code = codes % num_labels
+        self.label = self.label_values[self.label_code]
+        self.offsets = np.searchsorted(self.src, np.arange(num_vertices + 1))
+
+    @classmethod
+    def from_networkx(cls, graph):
+        """Converts a MultiDiGraph, numbering its vertices in the order of graph.nodes()."""
+        index = {v: k for k, v in enumerate(graph.nodes())}
+        edges = np.array([(index[u], index[v], data['label']) for u, v, data in graph.edges(data=True)],
+                         dtype=np.int64).reshape(-1, 3)
+        return cls(len(index), edges[:, 0], edges[:, 1], edges[:, 2])
+
+    def to_networkx(self):
+        graph = nx.MultiDiGraph()
+        graph.add_nodes_from(range(self.num_vertices))
+        for u, v, label in self.edges():
+            graph.add_edge(u, v, label=label)
+        return graph
+
+    def edges(self):
+        """Returns the list of edges (u, v, label) as Python integers."""
+        return list(zip(self.src.tolist(), self.dst.tolist(), self.label.tolist()))
+
+    def quotient(self, vertex_map):
+        """
+        Returns the quotient by a map from the vertices to 0, ..., k-1, merging the edges
+        that get the same source, target and label.
+        """
+        vertex_map = np.asarray(vertex_map, dtype=np.int64)
+        num_vertices = int(vertex_map.max()) + 1 if len(vertex_map) else 0
+        num_labels = len(self.label_values)
+        codes = (vertex_map[self.src] * num_vertices + vertex_map[self.dst]) * num_labels + self.label_code
+        quotient = LabeledGraph.__new__(LabeledGraph)
+        quotient.label_values = self.label_values
+        quotient._set_codes(num_vertices, np.unique(codes))
+        return quotient
+
+    def spanning_tree(self, root=0):
+        """
+        Finds a spanning tree of the vertices reachable from root using BFS.
+        Returns, for every vertex, the index of its tree edge (-1 for the root and unreached
+        vertices), and the parent map in the order the vertices are discovered.
+        """
+        offsets, dst = self.offsets.tolist(), self.dst.tolist()
+        tree_edge = [-1] * self.num_vertices
+        parent = {root: None}
+        queue = deque([root])
+        while queue:
+            node = queue.popleft()
+            for edge in range(offsets[node], offsets[node + 1]):
+                neighbor = dst[edge]
+                if neighbor not in parent:
+                    tree_edge[neighbor] = edge
+                    parent[neighbor] = node
+                    queue.append(neighbor)
+        return tree_edge, parent
+
+    def generators(self, tree_edge, parent_map):
+        """Computes generators for the subgroup based on non-tree edges, see compute_generators."""
+        src, dst, label = self.src.tolist(), self.dst.tolist(), self.label.tolist()
+        words = {}
+        for v, p in parent_map.items():
+            words[v] = [] if p is None else words[p] + [label[tree_edge[v]]]
+        return [words[u] + [a] + [-l for l in reversed(words[v])]
+                for edge, (u, v, a) in enumerate(zip(src, dst, label)) if tree_edge[v] != edge]
+
 
 def partition_and_merge_edges(graph, partition):
     """
     Merges edges with the same label in a given partitioned graph.
-    Returns a new labeled graph after merging.
+    The partition is a list of blocks of vertices, or a restricted growth string from
+    all_partitions over the vertices in the order of graph.nodes().
+    Returns a new labeled graph after merging, a LabeledGraph if graph is one.
     """
-    new_graph = nx.MultiDiGraph()
-    vertex_map = {}
-    
     # Assign new vertex numbers based on partition
-    for new_v, group in enumerate(partition):
-        for v in group:
-            vertex_map[v] = new_v
+    is_rgs = len(partition) > 0 and isinstance(partition[0], numbers.Integral)
+    if isinstance(graph, LabeledGraph) and is_rgs:
+        return graph.quotient(partition)
+    vertices = range(graph.num_vertices) if isinstance(graph, LabeledGraph) else graph.nodes()
+    if is_rgs:
+        vertex_map = dict(zip(vertices, partition))
+    else:
+        vertex_map = {}
+        for new_v, group in enumerate(partition):
+            for v in group:
+                vertex_map[v] = new_v
+
+    if isinstance(graph, LabeledGraph):
+        return graph.quotient([vertex_map[v] for v in vertices])
     
     # Merge edges with the same label
-    edge_dict = defaultdict(set)
-    for u, v, data in graph.edges(data=True):
-        new_u, new_v = vertex_map[u], vertex_map[v]
-        label = data['label']
-        edge_dict[(new_u, new_v, label)].add((u, v))
-    
-    # Add merged edges to new graph
-    for (new_u, new_v, label), edges in edge_dict.items():
+    new_graph = nx.MultiDiGraph()
+    merged_edges = {(vertex_map[u], vertex_map[v], data['label']) for u, v, data in graph.edges(data=True)}
+    for new_u, new_v, label in merged_edges:
         new_graph.add_edge(new_u, new_v, label=label)
     
     return new_graph
 
+
+def _closed_partitions(folding, k, separated):
+    """
+    Generate the closed partitions coarser than folding that respect the separations.
+
+    Vertices before k are decided. Vertex k either joins the block of an earlier vertex, or
+    starts a new block that must then stay apart from all earlier blocks, which is recorded
+    in separated. Branches whose folding merges separated blocks are pruned, as their
+    closed partition is generated by the branch that made that merge directly, so every
+    closed partition is generated exactly once.
+    """
+    if k == len(folding.parent):
+        yield folding
+        return
+    if folding.find(k) < k:
+        # Already merged with an earlier block by folding
+        yield from _closed_partitions(folding, k + 1, separated)
+        return
+
+    earlier_roots = sorted({folding.find(v) for v in range(k)})
+    for root in earlier_roots:
+        branch = folding.copy()
+        branch.merge(root, k)
+        if all(branch.find(a) != branch.find(b) for a, b in separated):
+            yield from _closed_partitions(branch, k + 1, separated)
+    yield from _closed_partitions(folding, k + 1, separated + [(k, root) for root in earlier_roots])
+
+
+def folded_quotient_keys(graph, root=0):
+    """
+    Generate the canonical keys of the distinct folded quotients of a labeled graph, one per
+    subgroup.
+
+    Every partition of the vertices gives a quotient graph, and folding it gives the graph
+    of the closed partition it generates, so only closed partitions are enumerated (see
+    Folding and _closed_partitions). Quotients that are isomorphic at the root describe the
+    same subgroup and are deduplicated by canonical_key.
+    """
+    vertices = list(graph.nodes())
+    index = {v: k for k, v in enumerate(vertices)}
+    folding = Folding(len(vertices), [(index[u], index[v], data['label'])
+                                      for u, v, data in graph.edges(data=True)])
+
+    seen = set()
+    for closed in _closed_partitions(folding, 0, []):
+        num_vertices, key = canonical_key(closed.edges(), closed.find(index[root]))
+        if key in seen:
+            continue
+        seen.add(key)
+        yield num_vertices, key
+
+
+def quotient_labeled_graph(num_vertices, key):
+    """Builds the LabeledGraph of a canonical key, see quotient_graph."""
+    edges = np.array(key, dtype=np.int64).reshape(-1, 3)
+    return LabeledGraph(num_vertices, edges[:, 0], edges[:, 1], edges[:, 2])
+
+
+def quotient_graph(num_vertices, key):
+    """
+    Builds the MultiDiGraph of a canonical key, on the vertices 0, 1, ... of the connected
+    component of the root, numbered as in canonical_key, so that the root is 0.
+    """
+    quotient = nx.MultiDiGraph()
+    quotient.add_nodes_from(range(num_vertices))
+    for u, v, label in key:
+        quotient.add_edge(u, v, label=label)
+    return quotient
+
+
+def folded_quotients(graph, root=0):
+    """
+    Generate the distinct folded quotients of a labeled graph, one per subgroup, as
+    MultiDiGraphs (see folded_quotient_keys and quotient_graph).
+    """
+    for num_vertices, key in folded_quotient_keys(graph, root):
+        yield quotient_graph(num_vertices, key)
+
+
 def find_spanning_tree(graph, root=0):
-    """Finds a spanning tree of the directed graph using BFS."""
+    """
+    Finds a spanning tree of the directed graph using BFS.
+    The parent map lists the vertices in the order they are discovered, so every vertex
+    comes after its parent. For a LabeledGraph, the tree is given by the index of the tree
+    edge of every vertex, see LabeledGraph.spanning_tree.
+    """
+    if isinstance(graph, LabeledGraph):
+        return graph.spanning_tree(root)
     tree = nx.DiGraph()
-    visited = set()
-    queue = [root]
     parent = {root: None}
+    queue = deque([root])
     
     while queue:
-        node = queue.pop(0)
-        if node in visited:
-            continue
-        visited.add(node)
-        for neighbor in graph.successors(node):
-            if neighbor not in visited:
-                tree.add_edge(node, neighbor, label=graph[node][neighbor][0]['label'])
+        node = queue.popleft()
+        for neighbor, edges in graph[node].items():
+            # Mark vertices when they are queued, so that each one gets a single tree edge
+            if neighbor not in parent:
+                tree.add_edge(node, neighbor, label=next(iter(edges.values()))['label'])
                 parent[neighbor] = node
                 queue.append(neighbor)
     
     return tree, parent
 
+
 def compute_generators(graph, spanning_tree, parent_map):
     """
     Computes generators for the subgroup based on non-tree edges.
+    The generator of an edge u -> v with label a is w(u) a w(v)^-1, where w(x) is the word
+    read along the tree path from the root to x. The words are built once, in the order of
+    parent_map, each one extending the word of its parent.
     """
+    if isinstance(graph, LabeledGraph):
+        return graph.generators(spanning_tree, parent_map)
     generators = []
     
-    def get_path(v):
-        path = []
-        while parent_map[v] is not None:
-            p = parent_map[v]
-            if graph.has_edge(p, v):
-                # Fetch the first edge label (assuming MultiDiGraph with possible multiple edges)
-                label = list(graph[p][v].values())[0]['label']
-                path.append(label)
-            v = p
-        return path
+    words = {}
+    for v, p in parent_map.items():
+        words[v] = [] if p is None else words[p] + [spanning_tree[p][v]['label']]
     
     for u, v, data in graph.edges(data=True):
-        if not spanning_tree.has_edge(u, v):
-            path_start = get_path(u)
-            path_end = get_path(v)[::-1]  # Reverse path to end
-            edge_label = [data['label']]
-            generator = path_start + edge_label + [-l for l in path_end]  # Use negative integers for inversion
-            generators.append(generator)
-        elif spanning_tree[u][v]['label'] != data['label']:
-            path_start = get_path(u)
-            path_end = get_path(v)[::-1]  # Reverse path to end
-            edge_label = [data['label']]
-            generator = path_start + edge_label + [-l for l in path_end]  # Use negative integers for inversion
-            generators.append(generator)
-            
+        if spanning_tree.has_edge(u, v) and spanning_tree[u][v]['label'] == data['label']:
+            continue
+        # Use negative integers for inversion
+        generator = words[u] + [data['label']] + [-l for l in reversed(words[v])]
+        generators.append(generator)
     
     return generators
 
-# Example Usage
-G = nx.MultiDiGraph()
-G.add_edge(0, 1, label = 1)
-G.add_edge(1, 2, label = 1)
-G.add_edge(2, 0, label = 1)
-G.add_edge(0, 3, label = 2)
-G.add_edge(3, 4, label = 2)
-G.add_edge(4, 0, label = 2)
 
-vertices = list(G.nodes())
-partitions = list(all_partitions(vertices))
-print(len(partitions))
-print(all_partitions([0,1,2]))
-# Store all sets of generators
-all_generators = []
+_worker_graph = None
+_worker_cache = None
+
+
+def _init_worker(graph):
+    global _worker_graph, _worker_cache
+    _worker_graph = LabeledGraph.from_networkx(graph)
+    _worker_cache = GeneratorCache()
+
+
+def _process_chunk(chunk, folded, reduce):
+    """
+    Computes the generators for a chunk of work items in a worker process.
+    Items are canonical keys of folded quotients if folded is set, and restricted growth
+    strings of partitions of the graph given to _init_worker otherwise. With reduce, the
+    generators are replaced by the canonical Nielsen-reduced basis they generate.
+    """
+    records = []
+    for item in chunk:
+        if folded:
+            merged_graph = quotient_labeled_graph(*item)
+        else:
+            merged_graph = partition_and_merge_edges(_worker_graph, item)
+        spanning_tree, parent_map = find_spanning_tree(merged_graph)
+        generators = compute_generators(merged_graph, spanning_tree, parent_map)
+        if reduce:
+            generators = _worker_cache.reduce(generators)
+        records.append(json.dumps({"quotient" if folded else "partition": item[1] if folded else item,
+                                   "generators": generators}, separators=(',', ':')))
+    return records
+
+
+def run_pipeline(graph, output, folded=True, workers=None, chunk_size=256, max_in_flight=None,
+                 progress=sys.stderr, report_interval=5.0, reduce=True):
+    """
+    Computes the generators of every partition, or every distinct folded quotient, of a
+    labeled graph in a pool of worker processes, and writes them to output as JSON lines
+    {"partition": rgs, "generators": [...]} or {"quotient": edges, "generators": [...]}.
+
+    Work items are streamed to the pool in chunks, with at most max_in_flight chunks
+    submitted and not yet written at any time, so memory does not grow with the number
+    of partitions. Results are written in the order of the items.
+
+    :param graph: the labeled MultiDiGraph
+    :param output: a path, or a text file to write to
+    :param folded: whether to process the folded quotients instead of all partitions
+    :param workers: the number of worker processes, None for one per CPU
+    :param chunk_size: the number of items sent to a worker at once
+    :param max_in_flight: the maximum number of pending chunks, None for twice the workers
+    :param progress: a text file for progress reports, None for no reports
+    :param report_interval: the number of seconds between progress reports
+    :param reduce: whether to write canonical Nielsen-reduced bases instead of the raw
+                   generators, see free_group.nielsen_reduce
+    :return: the number of items processed
+    """
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+    if folded:
+        items = folded_quotient_keys(graph)
+    else:
+        items = all_partitions(list(graph.nodes()))
+    chunks = iter(lambda: list(itertools.islice(items, chunk_size)), [])
+
+    file = open(output, "w") if isinstance(output, str) else output
+    count = 0
+    start = last_report = time.monotonic()
+    try:
+        with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(graph,)) as executor:
+            in_flight = deque()
+            for chunk in itertools.chain(chunks, [None]):
+                if chunk is not None:
+                    in_flight.append(executor.submit(_process_chunk, chunk, folded, reduce))
+                # Write the oldest chunks once the limit is reached, and all of them at the end
+                while in_flight and (chunk is None or len(in_flight) >= max_in_flight):
+                    records = in_flight.popleft().result()
+                    file.write("\n".join(records) + "\n")
+                    count += len(records)
+                    now = time.monotonic()
+                    if progress is not None and now - last_report >= report_interval:
+                        progress.write("{} items, {:.0f} items/s\n".format(count, count / (now - start)))
+                        last_report = now
+    finally:
+        if file is not output:
+            file.close()
+    if progress is not None:
+        elapsed = time.monotonic() - start
+        progress.write("{} items in {:.1f} s, {:.0f} items/s\n".format(count, elapsed, count / max(elapsed, 1e-9)))
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compute subgroup generators from the quotients of a labeled graph.")
+    parser.add_argument("--output", help="write the generators to this JSON lines file using a process pool")
+    parser.add_argument("--all-partitions", action="store_true",
+                        help="process every partition instead of the distinct folded quotients")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--chunk-size", type=int, default=256, help="number of items per chunk")
+    parser.add_argument("--raw", action="store_true",
+                        help="write the raw generators instead of canonical Nielsen-reduced bases")
+    args = parser.parse_args()
+
+    # Example Usage
+    G = nx.MultiDiGraph()
+    G.add_edge(0, 1, label = 1)
+    G.add_edge(1, 2, label = 1)
+    G.add_edge(2, 0, label = 1)
+    G.add_edge(0, 3, label = 2)
+    G.add_edge(3, 4, label = 2)
+    G.add_edge(4, 0, label = 2)
+
+    vertices = list(G.nodes())
+    print(sum(1 for _ in all_partitions(vertices)))
+    print([partition_blocks([0,1,2], rgs) for rgs in all_partitions([0,1,2])])
+    if args.output:
+        run_pipeline(G, args.output, not args.all_partitions, args.workers, args.chunk_size, reduce=not args.raw)
+        return
+
+    # Store all distinct sets of generators, as canonical Nielsen-reduced bases
+    all_generators = set()
+    cache = GeneratorCache()
 
-# Iterate over each partition and process it
-for partition in partitions:
-    merged_graph = partition_and_merge_edges(G, partition)
-    spanning_tree, parent_map = find_spanning_tree(merged_graph)
-    generators = compute_generators(merged_graph, spanning_tree, parent_map)
+    # Iterate over each distinct folded quotient and process it
+    for merged_graph in folded_quotients(G):
+        spanning_tree, parent_map = find_spanning_tree(merged_graph)
+        generators = compute_generators(merged_graph, spanning_tree, parent_map)
 
-    all_generators.append(generators)
+        all_generators.add(cache.reduce(generators))
+    print(len(all_generators))
 
 
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,380 @@
+import argparse
+import itertools
+import os
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from burau import DEFAULT_PRIME, burau_exact, burau_mod_p, is_identity_laurent, pad_words, random_t_values
+from free_group import free_reduce, inverse, shortlex
+
+CHECKPOINT = "checkpoint.npz"
+
+
+def _allowed_pairs(n):
+    """
+    Returns a boolean table of the letters b that may follow a letter a in a reduced braid
+    word, indexed by a + n - 1 and b + n - 1: b is not the inverse of a, and commuting
+    generators appear in increasing order, so b is not sigma_j^+-1 with j <= |a| - 2.
+    Every braid word can be rewritten into a reduced one of at most the same length.
+    """
+    letters = np.arange(-(n - 1), n)
+    previous, following = letters[:, None], letters[None, :]
+    allowed = (following != -previous) & (np.abs(previous) - np.abs(following) < 2)
+    allowed[n - 1, :] = allowed[:, n - 1] = False
+    return allowed
+
+
+def reduced_words(prefix, length, n=4):
+    """
+    Returns all the reduced braid words of a given length that start with a prefix, see
+    _allowed_pairs.
+
+    :param prefix: a reduced word
+    :param length: the length of the words, at least the length of the prefix
+    :param n: the number of strands
+    :return: an integer array of shape (count, length)
+    """
+    allowed = _allowed_pairs(n)
+    letters = np.array([letter for letter in range(-(n - 1), n) if letter], dtype=np.int64)
+    words = np.array([prefix], dtype=np.int64).reshape(1, len(prefix))
+    for _ in range(len(prefix), length):
+        extended = np.concatenate((np.repeat(words, len(letters), axis=0),
+                                   np.tile(letters, len(words))[:, None]), axis=1)
+        if words.shape[1]:
+            extended = extended[allowed[extended[:, -2] + n - 1, extended[:, -1] + n - 1]]
+        words = extended
+    return words
+
+
+def artin_key(word, n=4):
+    """
+    Returns the images of the generators x_1, ..., x_n of the free group under the Artin
+    automorphism of a braid word, with sigma_i sending x_i to x_i x_{i+1} x_i^-1 and x_{i+1}
+    to x_i. The Artin representation is faithful, so two words give the same key if and only
+    if they are the same braid.
+
+    :param word: a sequence of nonzero integers
+    :param n: the number of strands
+    :return: a tuple of n freely reduced words
+    """
+    images = [(k,) for k in range(1, n + 1)]
+    for letter in word:
+        i = abs(letter)
+        a, b = images[i - 1], images[i]
+        if letter > 0:
+            images[i - 1], images[i] = free_reduce(a + b + inverse(a)), a
+        else:
+            images[i - 1], images[i] = b, free_reduce(inverse(b) + a + b)
+    return tuple(images)
+
+
+def fingerprints(matrices, multipliers):
+    """
+    Hashes matrices over F_p to 64-bit fingerprints, by a random linear combination of the
+    entries modulo 2^64 followed by a mixing step.
+
+    :param matrices: an integer array of shape (batch, ...), see burau.burau_mod_p
+    :param multipliers: odd uint64 multipliers, one per entry of a matrix
+    :return: a uint64 array of shape (batch,)
+    """
+    entries = matrices.reshape(len(matrices), -1).astype(np.uint64)
+    hashes = (entries * multipliers).sum(axis=1, dtype=np.uint64)
+    hashes ^= hashes >> np.uint64(31)
+    hashes *= np.uint64(0x9E3779B97F4A7C15)
+    return hashes ^ (hashes >> np.uint64(29))
+
+
+class BloomFilter:
+    """
+    Bloom filter of 64-bit fingerprints, in front of the fingerprint index: a fingerprint
+    that the filter has not seen cannot be a collision, so only the fingerprints it reports
+    as seen are kept for the join.
+    """
+
+    def __init__(self, num_bits=1 << 27, num_hashes=4, seed=0):
+        if num_bits & (num_bits - 1) or num_bits < 8:
+            raise ValueError("num_bits must be a power of two")
+        self.shift = np.uint64(64 - num_bits.bit_length() + 1)
+        self.bits = np.zeros(num_bits // 8, dtype=np.uint8)
+        self.multipliers = np.random.default_rng(seed).integers(0, 1 << 63, size=num_hashes,
+                                                                dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+
+    def add(self, hashes):
+        """
+        Adds fingerprints to the filter.
+
+        :param hashes: a uint64 array
+        :return: a boolean array, true for the fingerprints that may have been added before,
+                 including earlier in the same array
+        """
+        positions = (hashes[:, None] * self.multipliers[None, :]) >> self.shift
+        byte, bit = positions >> np.uint64(3), (positions & np.uint64(7)).astype(np.uint8)
+        seen = ((self.bits[byte] >> bit) & 1).all(axis=1)
+        np.bitwise_or.at(self.bits, byte.ravel(), (np.uint8(1) << bit).ravel())
+        _, index, counts = np.unique(hashes, return_inverse=True, return_counts=True)
+        return seen | (counts[index] > 1)
+
+
+class FingerprintIndex:
+    """
+    On-disk index of (fingerprint, word) records, sharded by the top bits of the fingerprint
+    so that each shard can be sorted and joined in memory. Words are stored as int8 arrays
+    padded with zeros to the maximal length.
+    """
+
+    def __init__(self, directory, length, shard_bits=6):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.shard_bits = shard_bits
+        self.dtype = np.dtype([("fingerprint", "<u8"), ("word", "i1", (max(length, 1),))])
+
+    def path(self, shard):
+        return os.path.join(self.directory, "shard_{:04d}.bin".format(shard))
+
+    def append(self, hashes, words):
+        records = np.zeros(len(hashes), dtype=self.dtype)
+        records["fingerprint"] = hashes
+        records["word"][:, :words.shape[1]] = words
+        shards = (hashes >> np.uint64(64 - self.shard_bits)).astype(np.int64)
+        order = np.argsort(shards, kind="stable")
+        bounds = np.searchsorted(shards[order], np.arange((1 << self.shard_bits) + 1))
+        for shard in range(1 << self.shard_bits):
+            if bounds[shard] < bounds[shard + 1]:
+                with open(self.path(shard), "ab") as file:
+                    records[order[bounds[shard]:bounds[shard + 1]]].tofile(file)
+
+    def sizes(self):
+        return np.array([os.path.getsize(self.path(shard)) if os.path.exists(self.path(shard)) else 0
+                         for shard in range(1 << self.shard_bits)], dtype=np.int64)
+
+    def truncate(self, sizes):
+        """Cuts the shards back to the sizes saved in a checkpoint, dropping later records."""
+        for shard, size in enumerate(sizes):
+            with open(self.path(shard), "ab") as file:
+                file.truncate(int(size))
+
+    def shard(self, shard):
+        if not os.path.exists(self.path(shard)):
+            return np.zeros(0, dtype=self.dtype)
+        return np.fromfile(self.path(shard), dtype=self.dtype)
+
+
+_worker_parameters = None
+
+
+def _init_worker(t_values, p, n, multipliers):
+    global _worker_parameters
+    _worker_parameters = t_values, p, n, multipliers
+
+
+def _process_task(prefix, min_length, max_length):
+    """
+    Computes the fingerprints of the reduced words with a given prefix and length between
+    min_length and max_length, with the parameters given to _init_worker.
+    """
+    t_values, p, n, multipliers = _worker_parameters
+    results = []
+    for length in range(min_length, max_length + 1):
+        words = reduced_words(prefix, length, n)
+        hashes = fingerprints(burau_mod_p(words, t_values, p, n), multipliers)
+        padded = np.zeros((len(words), max_length), dtype=np.int8)
+        padded[:, :length] = words
+        results.append((hashes, padded))
+    return (np.concatenate([hashes for hashes, _ in results]),
+            np.concatenate([words for _, words in results]))
+
+
+def _tasks(half_length, split_depth, n):
+    """
+    Splits the reduced words of length at most half_length into tasks (prefix, min length,
+    max length): one for the words shorter than split_depth, and one per reduced prefix of
+    length split_depth for the longer ones.
+    """
+    depth = min(split_depth, half_length)
+    tasks = [((), 0, depth - 1)] if depth else []
+    tasks.extend((tuple(prefix), depth, half_length) for prefix in reduced_words((), depth, n).tolist())
+    return tasks
+
+
+def _save_checkpoint(path, parameters, completed, index, bloom, candidates):
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as file:
+        np.savez(file, parameters=parameters, completed=completed, sizes=index.sizes(), bloom=bloom.bits,
+                 candidates=np.unique(np.concatenate(candidates)) if candidates else np.zeros(0, np.uint64))
+    os.replace(temporary, path)
+
+
+def build_index(half_length, directory, n=4, points=2, p=DEFAULT_PRIME, seed=0, workers=None, split_depth=3,
+                shard_bits=6, bloom_bits=1 << 27, num_hashes=4, checkpoint_interval=600, resume=False,
+                progress=sys.stderr, report_interval=5.0):
+    """
+    Fingerprints the Burau images of all the reduced braid words of length at most half_length
+    in a pool of worker processes, and writes them to a FingerprintIndex in directory.
+
+    A fingerprint combines the matrices of burau.burau_mod_p at several random points of F_p.
+    Each fingerprint goes through a BloomFilter, and the ones it may have seen before are kept
+    as candidates for the join. The filter, the candidates, the number of completed tasks and
+    the sizes of the shards are saved to directory/checkpoint.npz every checkpoint_interval
+    seconds and at the end, and a run started with resume=True continues from there.
+
+    :param half_length: the maximal length of the words
+    :param directory: the directory of the index
+    :param n: the number of strands
+    :param points: the number of random points of F_p
+    :param p: a prime, see burau.burau_mod_p
+    :param seed: the seed of the points and the hash functions
+    :param workers: the number of worker processes, None for one per CPU
+    :param split_depth: the length of the prefixes that split the words into tasks
+    :param shard_bits: the index has 2^shard_bits shards
+    :param bloom_bits: the size of the Bloom filter in bits, a power of two
+    :param num_hashes: the number of hash functions of the Bloom filter
+    :param checkpoint_interval: the number of seconds between checkpoints
+    :param resume: whether to continue from the checkpoint
+    :param progress: a text file for progress reports, None for no reports
+    :param report_interval: the number of seconds between progress reports
+    :return: the index, and a sorted uint64 array of the candidate fingerprints
+    """
+    workers = workers or os.cpu_count() or 1
+    t_values = random_t_values(p, points, seed=seed)
+    generator = np.random.default_rng(seed + 1)
+    multipliers = generator.integers(0, 1 << 63, size=points * n * n, dtype=np.uint64) * np.uint64(2) + np.uint64(1)
+    parameters = np.array([half_length, n, points, p, seed, split_depth, shard_bits, bloom_bits, num_hashes])
+    path = os.path.join(directory, CHECKPOINT)
+    index = FingerprintIndex(directory, half_length, shard_bits)
+    bloom = BloomFilter(bloom_bits, num_hashes, seed)
+    tasks = _tasks(half_length, split_depth, n)
+    completed, candidates = 0, []
+    if resume:
+        with np.load(path) as checkpoint:
+            if not np.array_equal(checkpoint["parameters"], parameters):
+                raise ValueError("checkpoint was saved with parameters " + str(checkpoint["parameters"].tolist()))
+            completed = int(checkpoint["completed"])
+            index.truncate(checkpoint["sizes"])
+            bloom.bits[:] = checkpoint["bloom"]
+            candidates.append(checkpoint["candidates"])
+    else:
+        index.truncate(np.zeros(1 << shard_bits, dtype=np.int64))
+
+    count = 0
+    start = last_report = last_checkpoint = time.monotonic()
+    with ProcessPoolExecutor(workers, initializer=_init_worker, initargs=(t_values, p, n, multipliers)) as executor:
+        in_flight = deque()
+        for task in itertools.chain(tasks[completed:], [None]):
+            if task is not None:
+                in_flight.append(executor.submit(_process_task, *task))
+            # Tasks are recorded in order, so the checkpoint only needs the number of completed ones
+            while in_flight and (task is None or len(in_flight) >= 2 * workers):
+                hashes, words = in_flight.popleft().result()
+                index.append(hashes, words)
+                candidates.append(hashes[bloom.add(hashes)])
+                completed += 1
+                count += len(hashes)
+                now = time.monotonic()
+                if progress is not None and now - last_report >= report_interval:
+                    progress.write("{}/{} tasks, {} words, {:.0f} words/s\n".format(
+                        completed, len(tasks), count, count / (now - start)))
+                    last_report = now
+                if now - last_checkpoint >= checkpoint_interval:
+                    _save_checkpoint(path, parameters, completed, index, bloom, candidates)
+                    last_checkpoint = now
+    _save_checkpoint(path, parameters, completed, index, bloom, candidates)
+    if progress is not None:
+        elapsed = time.monotonic() - start
+        progress.write("{} words in {:.1f} s, {:.0f} words/s\n".format(count, elapsed, count / max(elapsed, 1e-9)))
+    candidates = np.unique(np.concatenate(candidates)) if candidates else np.zeros(0, dtype=np.uint64)
+    return index, candidates
+
+
+def verify_kernel_elements(words, n=4):
+    """
+    Checks with exact Laurent polynomials that words are in the kernel of the Burau
+    representation.
+
+    :param words: a list of words
+    :param n: the number of strands
+    :return: a boolean array, true for the words whose Burau matrix is the identity
+    """
+    if not words:
+        return np.zeros(0, dtype=bool)
+    return is_identity_laurent(*burau_exact(pad_words(words), n))
+
+
+def join(index, candidates, n=4):
+    """
+    Finds the pairs of words of the index with the same fingerprint that are different braids,
+    and returns the kernel elements u v^-1 they give that pass the exact check.
+
+    The words of each shard whose fingerprint is a candidate are grouped by fingerprint, and
+    the words of a group by braid, see artin_key. Pairs of words of the same braid are trivial
+    collisions, and pairs of different braids whose quotient fails the exact check are false
+    positives of the evaluation at random points.
+
+    :param index: a FingerprintIndex
+    :param candidates: a sorted uint64 array of candidate fingerprints
+    :param n: the number of strands
+    :return: the kernel elements, as a sorted list of shortlex-minimal words up to inversion,
+             and a dictionary of statistics
+    """
+    statistics = {"groups": 0, "trivial_collisions": 0, "false_positives": 0}
+    kernel = set()
+    for shard in range(1 << index.shard_bits):
+        records = index.shard(shard)
+        records = records[np.isin(records["fingerprint"], candidates)]
+        records = records[np.argsort(records["fingerprint"], kind="stable")]
+        bounds = np.flatnonzero(np.diff(records["fingerprint"])) + 1
+        for group in np.split(records, bounds):
+            if len(group) < 2:
+                continue
+            statistics["groups"] += 1
+            braids = {}
+            for word in group["word"].tolist():
+                word = tuple(letter for letter in word if letter)
+                braids.setdefault(artin_key(word, n), word)
+            statistics["trivial_collisions"] += len(group) - len(braids)
+            first, *others = braids.values()
+            quotients = [free_reduce(first + inverse(other)) for other in others]
+            for quotient, in_kernel in zip(quotients, verify_kernel_elements(quotients, n)):
+                if in_kernel:
+                    kernel.add(min(quotient, inverse(quotient), key=shortlex))
+                else:
+                    statistics["false_positives"] += 1
+    return sorted(kernel, key=shortlex), statistics
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Meet-in-the-middle search for elements of the Burau kernel.")
+    parser.add_argument("length", type=int, help="search the kernel elements of length at most this")
+    parser.add_argument("--directory", default="burau_index", help="directory of the fingerprint index")
+    parser.add_argument("-n", type=int, default=4, help="number of strands")
+    parser.add_argument("--points", type=int, default=2, help="number of random points of F_p")
+    parser.add_argument("-p", type=int, default=DEFAULT_PRIME, help="prime of the evaluation")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the points and the hash functions")
+    parser.add_argument("--workers", type=int, help="number of worker processes")
+    parser.add_argument("--split-depth", type=int, default=3, help="length of the prefixes of the tasks")
+    parser.add_argument("--shard-bits", type=int, default=6, help="the index has 2^SHARD_BITS shards")
+    parser.add_argument("--bloom-bits", type=int, default=27, help="the Bloom filter has 2^BLOOM_BITS bits")
+    parser.add_argument("--hashes", type=int, default=4, help="number of hash functions of the Bloom filter")
+    parser.add_argument("--checkpoint-interval", type=float, default=600, help="seconds between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue the indexing saved in the directory")
+    parser.add_argument("--output", help="write the kernel elements to this file, one per line")
+    args = parser.parse_args()
+
+    half_length = (args.length + 1) // 2
+    index, candidates = build_index(half_length, args.directory, args.n, args.points, args.p, args.seed,
+                                    args.workers, args.split_depth, args.shard_bits, 1 << args.bloom_bits,
+                                    args.hashes, args.checkpoint_interval, args.resume)
+    kernel, statistics = join(index, candidates, args.n)
+    print(len(candidates), "candidate fingerprints,", statistics["groups"], "collisions,",
+          statistics["trivial_collisions"], "trivial,", statistics["false_positives"], "false positives")
+    print(len(kernel), "kernel elements")
+    for word in kernel:
+        print(" ".join(map(str, word)))
+    if args.output:
+        with open(args.output, "w") as file:
+            file.writelines(" ".join(map(str, word)) + "\n" for word in kernel)
+
+
+if __name__ == '__main__':
+    main()
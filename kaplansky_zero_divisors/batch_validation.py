@@ -0,0 +1,150 @@
+import numpy as np
+
+
+def pad_cells(two_cell_lists):
+    """
+    Stacks lists of 2-cells of different lengths into one array, padded with rows of zeros.
+
+    :param two_cell_lists: an iterable of lists of 4-tuples, or of arrays of shape (k, 4)
+    :return: an integer array of shape (batch, max k, 4)
+    """
+    two_cell_lists = [np.asarray(cells, dtype=np.int64).reshape(-1, 4) for cells in two_cell_lists]
+    length = max((len(cells) for cells in two_cell_lists), default=0)
+    padded = np.zeros((len(two_cell_lists), length, 4), dtype=np.int64)
+    for index, cells in enumerate(two_cell_lists):
+        padded[index, :len(cells)] = cells
+    return padded
+
+
+def has_cycle_shorter_than_batch(adjacency, n):
+    """
+    Returns, for every graph of a batch, whether it has a cycle of length less than n.
+
+    Uses non-backtracking walk counts: a closed non-backtracking walk of length k exists if and
+    only if the graph has a cycle of length at most k. The counts satisfy W_1 = A, W_2 = A^2 - D
+    and W_k = A W_{k-1} - (D - I) W_{k-2}, where D is the diagonal degree matrix.
+
+    The non-backtracking walk counts are computed in floating point, which is exact as long as
+    they stay below 2^53. Larger counts, for graphs of high degree, fall back to integers.
+
+    :param adjacency: an array of shape (batch, size, size) of symmetric 0/1 matrices without loops
+    :param n: a positive integer >= 3
+    :return: a boolean array of shape (batch,), true where the graph has a cycle of length less than n
+    """
+    found = np.zeros(len(adjacency), dtype=bool)
+    if n <= 3 or adjacency.shape[1] < 3:
+        return found
+    degree = adjacency.sum(axis=2)
+    exact = float(max(int(degree.max(initial=0)), 1)) ** n < 2 ** 53
+    adjacency = adjacency.astype(np.float64 if exact else np.int64)
+    degree_minus_one = (degree - 1).astype(adjacency.dtype)[:, :, None]
+    diagonal = np.arange(adjacency.shape[1])
+
+    previous = adjacency
+    current = adjacency @ adjacency
+    current[:, diagonal, diagonal] -= degree_minus_one[:, :, 0] + 1
+    for _ in range(3, n):
+        previous, current = current, adjacency @ current - degree_minus_one * previous
+        found |= np.trace(current, axis1=1, axis2=2) > 0
+    return found
+
+
+def _connected_components(adjacency):
+    """
+    Labels the connected components of a batch of graphs by label propagation.
+
+    Every node starts with its own index as label and repeatedly takes the smallest label among
+    its neighbors, with pointer jumping, until no label changes.
+
+    :param adjacency: a boolean array of shape (batch, size, size), symmetric with a true diagonal
+    :return: an array of shape (batch, size) giving the smallest node of the component of each node
+    """
+    batch, size = adjacency.shape[:2]
+    labels = np.broadcast_to(np.arange(size), (batch, size)).copy()
+    rows = np.arange(batch)[:, None]
+    while True:
+        updated = np.where(adjacency, labels[:, None, :], size).min(axis=2)
+        updated = updated[rows, updated]
+        if np.array_equal(updated, labels):
+            return labels
+        labels = updated
+
+
+def validate_batch(cells, p, q, chunk_size=1024):
+    """
+    Checks many taikos at once, with the same answer as building each one with Taiko.
+
+    A taiko is valid if each of its 2-cells is non-degenerate and left-aligned with respect to
+    the cells before it, and the taiko satisfies no-fold and girth(p,q). Taikos with fewer cells
+    are padded with rows of zeros, see pad_cells.
+
+    Every step works on the whole batch with array operations: left-alignment from running
+    maxima of the coordinates, the color classes of the horizontal edges as the connected
+    components of the cells sharing an edge, folds as pairs of distinct edges with a common
+    tail or head and the same color, and short cycles in L_A, L_B and the middle link graph
+    from non-backtracking walk counts. The batch is processed in chunks of chunk_size taikos to
+    bound the memory used.
+
+    :param cells: an integer array of shape (batch, k, 4)
+    :param p: a positive integer >= 3
+    :param q: a positive integer
+    :param chunk_size: the number of taikos processed together
+    :return: a boolean array of shape (batch,), true for the valid taikos
+    """
+    cells = np.asarray(cells, dtype=np.int64)
+    if cells.ndim != 3 or cells.shape[2] != 4:
+        raise ValueError("cells must have shape (batch, k, 4)")
+    valid = np.empty(len(cells), dtype=bool)
+    for start in range(0, len(cells), chunk_size):
+        valid[start:start + chunk_size] = _validate_chunk(cells[start:start + chunk_size], p, q)
+    return valid
+
+
+def _validate_chunk(cells, p, q):
+    """
+    Computes validate_batch for a chunk of taikos.
+    """
+    batch, k = cells.shape[:2]
+    present = cells.any(axis=2)
+    i1, j1, i2, j2 = (cells[:, :, index] for index in range(4))
+    valid = ~(present & ((cells < 1).any(axis=2) | (i1 == i2) | (j1 == j2))).any(axis=1)
+
+    # Left-alignment against the number of vertices before each cell
+    for first, second in ((i1, i2), (j1, j2)):
+        size = np.maximum.accumulate(np.maximum(first, second), axis=1)
+        size = np.concatenate((np.zeros((batch, 1), dtype=np.int64), size[:, :-1]), axis=1)
+        aligned = (first <= size + 1) & ((second <= size + 1) | (second <= first + 1))
+        valid &= (aligned | ~present).all(axis=1)
+
+    # Color classes: cells sharing a horizontal edge have the same color
+    same_a = (i1[:, :, None] == i1[:, None, :]) & (i2[:, :, None] == i2[:, None, :])
+    same_b = (j1[:, :, None] == j1[:, None, :]) & (j2[:, :, None] == j2[:, None, :])
+    both_present = present[:, :, None] & present[:, None, :]
+    colors = _connected_components((same_a | same_b) & both_present | np.eye(k, dtype=bool))
+    same_color = (colors[:, :, None] == colors[:, None, :]) & both_present
+
+    # No-fold: distinct edges of the same color with a common tail or head
+    for first, second, same_edge in ((i1, i2, same_a), (j1, j2, same_b)):
+        for end in (first, second):
+            fold = same_color & ~same_edge & (end[:, :, None] == end[:, None, :])
+            valid &= ~fold.any(axis=(1, 2))
+
+    # Girth: L_A and L_B have no cycle shorter than p, the middle link graph none shorter than 2q
+    size = int(cells.max(initial=0)) + 1
+    rows = np.broadcast_to(np.arange(batch)[:, None], (batch, k))[present]
+    for first, second in ((i1, i2), (j1, j2)):
+        link = np.zeros((batch, size, size), dtype=np.int8)
+        link[rows, first[present], second[present]] = 1
+        link[rows, second[present], first[present]] = 1
+        valid &= ~has_cycle_shorter_than_batch(link, p)
+
+    # Nodes of the middle link graph: A-vertices, B-vertices, then an "in" and an "out" node
+    # for each color, colors being numbered by cells
+    middle = np.zeros((batch, 2 * size + 2 * k, 2 * size + 2 * k), dtype=np.int8)
+    in_nodes = (2 * size + 2 * colors)[present]
+    for first, second, offset in ((i1, i2, 0), (j1, j2, size)):
+        for end, nodes in ((first, in_nodes + 1), (second, in_nodes)):
+            middle[rows, offset + end[present], nodes] = 1
+            middle[rows, nodes, offset + end[present]] = 1
+    valid &= ~has_cycle_shorter_than_batch(middle, 2 * q)
+    return valid
@@ -0,0 +1,220 @@
+import argparse
+import cProfile
+import json
+import platform
+import pstats
+import sys
+import time
+import tracemalloc
+from taiko import *
+from taiko_dfs import ENGINES, search
+from taiko_examples import random_taiko, taiko_example_1, taiko_example_2
+from visited_store import KeySetStore
+
+def measure(function, repeat):
+    """
+    Runs a function several times and returns its best and mean running times.
+
+    :param function: a function without arguments
+    :param repeat: the number of runs
+    :return: a dictionary with the best and mean times in seconds
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    return {"best": min(times), "mean": sum(times) / len(times)}
+
+
+def peak_memory(function):
+    """
+    Runs a function once under tracemalloc.
+
+    :param function: a function without arguments
+    :return: the peak memory allocated during the run, in bytes
+    """
+    tracemalloc.start()
+    try:
+        function()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def profile(function, top=15):
+    """
+    Runs a function once under cProfile.
+
+    :param function: a function without arguments
+    :param top: the number of functions to report
+    :return: the functions with the largest cumulative times, as dictionaries
+    """
+    profiler = cProfile.Profile()
+    profiler.runcall(function)
+    statistics = pstats.Stats(profiler)
+    rows = []
+    for (file, line, name), (_, calls, total_time, cumulative_time, _) in statistics.stats.items():
+        rows.append({"function": "{}:{}({})".format(file.split("/")[-1], line, name), "calls": calls,
+                     "tottime": total_time, "cumtime": cumulative_time})
+    rows.sort(key=lambda row: row["cumtime"], reverse=True)
+    return rows[:top]
+
+
+def uncached_girth(taiko, p, q):
+    """
+    Checks girth(p,q) without using the results cached by earlier calls, see Taiko.link_girth_at_least_n.
+    """
+    if hasattr(taiko, "girth_cache"):
+        taiko.girth_cache.clear()
+    return taiko.is_girth_p_q(p, q)
+
+
+def taiko_inputs(seed):
+    """
+    Returns the taikos the operations are timed on: the examples and random valid taikos.
+
+    :param seed: the seed of the random taikos
+    :return: a dictionary from names to lists of 2-cells
+    """
+    inputs = {"example_1": taiko_example_1, "example_2": taiko_example_2}
+    for size in (4, 6, 8):
+        inputs["random_{}x{}".format(size, size)] = random_taiko(size, size, seed=seed)
+    return inputs
+
+
+def operation_benchmarks(inputs, engines, repeat):
+    """
+    Times the operations of the taiko classes on the given taikos.
+
+    add_two_cell and pop_two_cell are timed over all the 2-cells of a taiko, and the results are
+    given per 2-cell.
+
+    :param inputs: a dictionary from names to lists of 2-cells
+    :param engines: the names of the taiko classes, keys of ENGINES
+    :param repeat: the number of runs of each operation
+    :return: a dictionary from benchmark names to results
+    """
+    results = {}
+    for engine in engines:
+        taiko_class = ENGINES[engine]
+        for name, two_cell_list in inputs.items():
+            prefix = "{}/{}/".format(engine, name)
+            count = len(two_cell_list)
+            results[prefix + "construction"] = measure(lambda: taiko_class(two_cell_list), repeat)
+            results[prefix + "construction"]["peak_memory"] = peak_memory(lambda: taiko_class(two_cell_list))
+
+            taiko = taiko_class()
+            add_times, pop_times = [], []
+            for _ in range(repeat):
+                start = time.perf_counter()
+                for cell in two_cell_list:
+                    taiko.add_two_cell(*cell)
+                add_times.append((time.perf_counter() - start) / count)
+                start = time.perf_counter()
+                for _ in two_cell_list:
+                    taiko.pop_two_cell()
+                pop_times.append((time.perf_counter() - start) / count)
+            results[prefix + "add_two_cell"] = {"best": min(add_times), "mean": sum(add_times) / repeat}
+            results[prefix + "pop_two_cell"] = {"best": min(pop_times), "mean": sum(pop_times) / repeat}
+
+            taiko = taiko_class(two_cell_list)
+            results[prefix + "no_fold"] = measure(taiko.no_fold, repeat)
+            results[prefix + "is_girth_p_q"] = measure(lambda: uncached_girth(taiko, 4, 4), repeat)
+            results[prefix + "last_two_cell_is_valid"] = measure(lambda: taiko.last_two_cell_is_valid(4, 4), repeat)
+    return results
+
+
+def search_benchmarks(sizes, engines, canonical, profile_top):
+    """
+    Times full depth-first searches, see taiko_dfs.search.
+
+    :param sizes: the values of max_M = max_N to search
+    :param engines: the names of the taiko classes checking the extensions, keys of ENGINES
+    :param canonical: whether to explore one taiko per isomorphism class
+    :param profile_top: the number of functions to report from a profile of each search, 0 for none
+    :return: a dictionary from benchmark names to results
+    """
+    results = {}
+    for engine in engines:
+        taiko_class = ENGINES[engine]
+        for size in sizes:
+            explored = KeySetStore()
+            start = time.perf_counter()
+            leaves = search(size, size, canonical=canonical, explored=explored, taiko_class=taiko_class)
+            elapsed = time.perf_counter() - start
+            result = {"best": elapsed, "mean": elapsed, "leaves": len(leaves), "states": len(explored),
+                      "states_per_second": len(explored) / elapsed,
+                      "peak_memory": peak_memory(lambda: search(size, size, canonical=canonical,
+                                                                taiko_class=taiko_class))}
+            if profile_top:
+                result["profile"] = profile(lambda: search(size, size, canonical=canonical, taiko_class=taiko_class),
+                                            profile_top)
+            name = "{}/search/{}x{}/{}".format(engine, size, size, "canonical" if canonical else "labelled")
+            results[name] = result
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """
+    Returns the benchmarks that are slower than in a baseline.
+
+    :param results: the current results
+    :param baseline: the results of a previous run
+    :param tolerance: the allowed relative slowdown of the best times
+    :return: a list of (name, baseline time, current time) for the regressions
+    """
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result["best"] > (1 + tolerance) * baseline[name]["best"]:
+            regressions.append((name, baseline[name]["best"], result["best"]))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the taiko operations and searches.")
+    parser.add_argument("--engines", nargs="+", choices=sorted(ENGINES), default=sorted(ENGINES),
+                        help="taiko classes to benchmark")
+    parser.add_argument("--sizes", type=int, nargs="*", default=[2, 3, 4], help="max_M = max_N of the searches")
+    parser.add_argument("--labelled", action="store_true", help="search labelled taikos instead of canonical ones")
+    parser.add_argument("--repeat", type=int, default=5, help="number of runs of each operation")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the random taikos")
+    parser.add_argument("--profile", type=int, default=0, metavar="TOP",
+                        help="profile each search and report the TOP functions by cumulative time")
+    parser.add_argument("--output", help="save the results to this JSON file")
+    parser.add_argument("--baseline", help="compare the results to this JSON file")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="relative slowdown over the baseline reported as a regression")
+    args = parser.parse_args()
+
+    results = operation_benchmarks(taiko_inputs(args.seed), args.engines, args.repeat)
+    results.update(search_benchmarks(args.sizes, args.engines, not args.labelled, args.profile))
+
+    for name, result in results.items():
+        line = "{:45} {:12.3e} s".format(name, result["best"])
+        if "states_per_second" in result:
+            line += "  {:10.0f} states/s  {} states  {} leaves".format(
+                result["states_per_second"], result["states"], result["leaves"])
+        if "peak_memory" in result:
+            line += "  peak {:.1f} KiB".format(result["peak_memory"] / 1024)
+        print(line)
+        for row in result.get("profile", []):
+            print("    {:>8} {:10.4f} {:10.4f}  {}".format(row["calls"], row["tottime"], row["cumtime"],
+                                                       row["function"]))
+
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump({"python": sys.version, "platform": platform.platform(), "results": results}, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for name, before, after in regressions:
+            print("regression: {} {:.3e} s -> {:.3e} s".format(name, before, after))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+def swap_sides(two_cell_list):
+    """
+    Exchanges the roles of the A- and B-vertices in the given 2-cells.
+
+    :param two_cell_list: the list of 4-tuples (i1, j1, i2, j2)
+    :return: the list of 4-tuples (j1, i1, j2, i2)
+    """
+    return [(j1, i1, j2, i2) for i1, j1, i2, j2 in two_cell_list]
+
+
+def flip_orientation(two_cell_list):
+    """
+    Reverses the orientation of all the given 2-cells, and so of every horizontal edge.
+
+    :param two_cell_list: the list of 4-tuples (i1, j1, i2, j2)
+    :return: the list of 4-tuples (i2, j2, i1, j1)
+    """
+    return [(i2, j2, i1, j1) for i1, j1, i2, j2 in two_cell_list]
+
+
+def refine(two_cell_list, coloring):
+    """
+    Refines a coloring of the vertices until it is stable (1-dimensional Weisfeiler-Leman).
+
+    Vertices are pairs (0, i) for A-vertices and (1, j) for B-vertices. In each round, a vertex is
+    recolored by its color together with the sorted list of the 2-cells it lies on, each seen as
+    its position in the cell and the colors of the cell's four vertices. Colors are renumbered by
+    the sorted order of these signatures, so the result does not depend on the vertex names.
+
+    :param two_cell_list: the list of 4-tuples (i1, j1, i2, j2)
+    :param coloring: a dictionary from vertices to integer colors
+    :return: the stable refinement, as a new dictionary
+    """
+    num_colors = len(set(coloring.values()))
+    while True:
+        incidences = {vertex: [] for vertex in coloring}
+        for i1, j1, i2, j2 in two_cell_list:
+            corners = ((0, i1), (1, j1), (0, i2), (1, j2))
+            colors = tuple(coloring[corner] for corner in corners)
+            for position, corner in enumerate(corners):
+                incidences[corner].append((position, colors))
+        signatures = {vertex: (coloring[vertex], tuple(sorted(incidence)))
+                      for vertex, incidence in incidences.items()}
+        ranks = {signature: rank for rank, signature in enumerate(sorted(set(signatures.values())))}
+        coloring = {vertex: ranks[signature] for vertex, signature in signatures.items()}
+        if len(ranks) == num_colors:
+            return coloring
+        num_colors = len(ranks)
+
+
+def _orbit(vertices, automorphisms):
+    """
+    Returns the union of the orbits of the given vertices under the group generated by the given
+    automorphisms.
+
+    :param vertices: an iterable of vertices
+    :param automorphisms: a list of dictionaries from vertices to vertices
+    :return: the set of vertices in the orbits
+    """
+    orbit = set(vertices)
+    frontier = list(orbit)
+    while frontier:
+        vertex = frontier.pop()
+        for automorphism in automorphisms:
+            image = automorphism[vertex]
+            if image not in orbit:
+                orbit.add(image)
+                frontier.append(image)
+    return orbit
+
+
+def _smallest_certificate(two_cell_list, coloring, path=(), leaves=None, automorphisms=None):
+    """
+    Returns the smallest relabelled cell list over all discrete refinements of the given coloring.
+
+    The first non-singleton color class is split by individualising each of its vertices in turn,
+    and the search recurses on the refined colorings.
+
+    Two leaves with the same certificate differ by an automorphism of the taiko, which is recorded.
+    A vertex is not individualised when an automorphism fixing the vertices of the path maps a
+    vertex already individualised at this node to it, as its subtree is then the image of that
+    vertex's subtree and has the same certificates. This keeps the search small on symmetric
+    taikos, but it can still grow exponentially on taikos whose refinement stalls without
+    symmetries to prune.
+
+    :param two_cell_list: the list of 4-tuples (i1, j1, i2, j2)
+    :param coloring: a stable coloring of the vertices
+    :param path: the vertices individualised so far
+    :param leaves: a dictionary from the certificates found so far to the labellings giving them,
+                   shared by the whole search
+    :param automorphisms: the list of the automorphisms found so far, as dictionaries from vertices
+                          to vertices, shared by the whole search
+    :return: the smallest certificate, as a tuple of 4-tuples
+    """
+    if leaves is None:
+        leaves, automorphisms = {}, []
+    classes = {}
+    for vertex, color in coloring.items():
+        classes.setdefault(color, []).append(vertex)
+    non_singleton = [color for color, members in classes.items() if len(members) > 1]
+
+    if not non_singleton:
+        # The coloring orders the A- and B-vertices, relabel them 1, 2, ... in that order
+        labels = {}
+        for side in (0, 1):
+            vertices = sorted((vertex for vertex in coloring if vertex[0] == side), key=coloring.get)
+            labels.update((vertex, (side, label)) for label, vertex in enumerate(vertices, start=1))
+        certificate = tuple(sorted((labels[0, i1][1], labels[1, j1][1], labels[0, i2][1], labels[1, j2][1])
+                                   for i1, j1, i2, j2 in two_cell_list))
+        if certificate in leaves:
+            # Both labellings map the cells to the certificate, so this is an automorphism
+            vertices = {label: vertex for vertex, label in leaves[certificate].items()}
+            automorphism = {vertex: vertices[label] for vertex, label in labels.items()}
+            if any(vertex != image for vertex, image in automorphism.items()):
+                automorphisms.append(automorphism)
+        else:
+            leaves[certificate] = labels
+        return certificate
+
+    best = None
+    individualised_here = []
+    for vertex in classes[min(non_singleton)]:
+        # Skip the vertices equivalent to one already individualised at this node
+        if individualised_here:
+            stabilizer = [automorphism for automorphism in automorphisms
+                          if all(automorphism[fixed] == fixed for fixed in path)]
+            if vertex in _orbit(individualised_here, stabilizer):
+                continue
+        individualised_here.append(vertex)
+        # Split off the vertex just before the rest of its class
+        individualised = {other: 2 * color + (other != vertex) for other, color in coloring.items()}
+        certificate = _smallest_certificate(two_cell_list, refine(two_cell_list, individualised),
+                                            path + (vertex,), leaves, automorphisms)
+        if best is None or certificate < best:
+            best = certificate
+    return best
+
+
+def canonical_form(two_cell_list, swap=True, flip=True):
+    """
+    Returns a certificate of the taiko with the given 2-cells that is invariant under relabelling
+    the A-vertices, relabelling the B-vertices and, optionally, exchanging the A- and B-sides and
+    reversing the orientation of every 2-cell.
+
+    Two taikos have the same certificate if and only if they are isomorphic under these
+    symmetries. The certificate is the smallest relabelled cell list found by color refinement
+    and individualisation, so it is itself a valid list of 2-cells of an isomorphic taiko.
+
+    :param two_cell_list: the list of 4-tuples (i1, j1, i2, j2)
+    :param swap: whether exchanging the A- and B-sides is a symmetry
+    :param flip: whether reversing the orientation of all the 2-cells is a symmetry
+    :return: the certificate, as a tuple of 4-tuples
+    """
+    variants = [list(two_cell_list)]
+    if swap:
+        variants += [swap_sides(cells) for cells in variants]
+    if flip:
+        variants += [flip_orientation(cells) for cells in variants]
+
+    best = None
+    for cells in variants:
+        coloring = {}
+        for i1, j1, i2, j2 in cells:
+            coloring.update((((0, i1), 0), ((0, i2), 0), ((1, j1), 1), ((1, j2), 1)))
+        certificate = _smallest_certificate(cells, refine(cells, coloring))
+        if best is None or certificate < best:
+            best = certificate
+    return best
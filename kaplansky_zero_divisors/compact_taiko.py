@@ -0,0 +1,552 @@
+import itertools
+import networkx as nx
+import numpy as np
+from taiko import Taiko
+from taiko_storage import decode_cells, encode_cells
+from union_find import UnionFind
+
+
+class CompactTaiko:
+
+    def __init__(self, two_cell_list=None):
+        """
+        Creates a taiko with the given two cells, stored in arrays instead of a networkx graph.
+
+        Offers the same interface as Taiko. The colors of the vertical edges are kept in an M x N
+        grid, the horizontal A- and B-edges in M x M and N x N adjacency grids holding the color of
+        each edge (0 when there is no edge), and the color classes in a union-find. Vertices are
+        numbered as in the 2-cells, so B-vertex j is column j of the grids.
+
+        As in Taiko, the tails and heads of every color class are kept with multiplicities to count
+        folds as 2-cells are added, and the horizontal edges at every vertex are also kept in
+        dictionaries so that girth checks only visit the edges they need.
+
+        :param two_cell_list: the list of 4-tuples giving the vertices and orientations of the 2-cells
+        """
+        if two_cell_list is None:
+            two_cell_list = []
+        self.next_color = 1  # Next available color for cell addition if a new one is needed
+        self.undo_log = []  # One list of undo records per added 2-cell, see add_two_cell
+        self.M, self.N = 0, 0
+
+        # Row and column 0 of the grids are unused so that vertices can be used as indices
+        self.vertical = np.zeros((4, 4), dtype=np.int32)
+        self.a_edges = np.zeros((4, 4), dtype=np.int32)
+        self.b_edges = np.zeros((4, 4), dtype=np.int32)
+        self.colors = UnionFind(1)  # Color 0 marks uncolored vertical edges
+
+        # Tails and heads of the horizontal edges of every color class and number of folds, see Taiko
+        self.color_tails = {}
+        self.color_heads = {}
+        self.folds = 0
+        # Horizontal edges at every vertex, from and to the vertices on its side, with their color.
+        # B-vertices are denoted with negative integers, as in Taiko.
+        self.link_succ = {}
+        self.link_pred = {}
+
+        self.two_cell_list = []
+        for cell in two_cell_list:
+            self.add_two_cell(*cell)
+
+    def color(self, raw_color):
+        """
+        Returns the current color of an edge that was colored with the given color.
+
+        :param raw_color: a color stored in one of the grids
+        :return: the representative of its color class
+        """
+        return self.colors.find(int(raw_color))
+
+    def can_add_two_cell(self, i1, j1, i2, j2, max_M=-1, max_N=-1):
+        """
+        Returns true if the given 2-cell can be added to the taiko, false otherwise.
+
+        :param i1: the first A-coordinate
+        :param j1: the first B-coordinate
+        :param i2: the second A-coordinate
+        :param j2: the second B-coordinate
+        :param max_M: the maximum number of A-vertices for this taiko, -1 if no bound
+        :param max_N: the maximum number of B-vertices for this taiko, -1 if no bound
+        :return: true if the given 2-cell can be added to the taiko, false otherwise
+        """
+        # Degenerate square
+        if i1 == i2 or j1 == j2:
+            return False
+        # Vertices above given upper bound
+        elif max_M > 0 and max_N > 0 and (i1 > max_M or j1 > max_N or i2 > max_M or j2 > max_N):
+            return False
+        # Cell is not left-aligned
+        elif not self.is_left_aligned(i1, j1, i2, j2):
+            return False
+
+        # No vertices in graph
+        if self.M == 0 or self.N == 0:
+            return True
+
+        has_a_edge = self._has_a_edge(i1, i2)
+        has_b_edge = self._has_b_edge(j1, j2)
+        # Bipartite edges are colored
+        if has_a_edge and has_b_edge and (self.vertical[i1, j1] != 0 or self.vertical[i2, j2] != 0):
+            return False
+        # Cannot add cell with current orientation
+        elif self._has_a_edge(i2, i1) or self._has_b_edge(j2, j1):
+            return False
+
+        return True
+
+    def candidate_cells(self, max_M=-1, max_N=-1):
+        """
+        Generates the 2-cells that can be added to the taiko, see Taiko.candidate_cells.
+
+        :param max_M: the maximum number of A-vertices for this taiko, -1 if no bound
+        :param max_N: the maximum number of B-vertices for this taiko, -1 if no bound
+        :return: a generator of 4-tuples (i1, j1, i2, j2)
+        """
+        bounded = max_M > 0 and max_N > 0
+        a_pairs = self._candidate_pairs(self.M, max_M if bounded else -1, self._has_a_edge)
+        b_pairs = self._candidate_pairs(self.N, max_N if bounded else -1, self._has_b_edge)
+        for i1, i2 in a_pairs:
+            a_edge = self._has_a_edge(i1, i2)
+            for j1, j2 in b_pairs:
+                # Bipartite edges are colored
+                if a_edge and self._has_b_edge(j1, j2) and (self.vertical[i1, j1] != 0 or self.vertical[i2, j2] != 0):
+                    continue
+                yield i1, j1, i2, j2
+
+    @staticmethod
+    def _candidate_pairs(size, bound, has_edge):
+        """
+        Returns the pairs of vertices on one side that can be the horizontal edge of a new 2-cell.
+
+        :param size: the number of vertices on this side, M or N
+        :param bound: the maximum number of vertices on this side, -1 if no bound
+        :param has_edge: the function telling whether a horizontal edge exists on this side
+        :return: the list of pairs of vertices
+        """
+        pairs = []
+        for k1 in range(1, min(size + 1, bound if bound > 0 else size + 1) + 1):
+            for k2 in range(1, size + 3):
+                # Degenerate, above the bound, not left-aligned, or against an existing orientation
+                if k1 == k2 or (bound > 0 and k2 > bound) or (k2 > size + 1 and k2 > k1 + 1) or has_edge(k2, k1):
+                    continue
+                pairs.append((k1, k2))
+        return pairs
+
+    def add_two_cell(self, i1, j1, i2, j2):
+        """
+        Adds a 2-cell to the taiko.
+
+        :param i1: the first A-coordinate
+        :param j1: the first B-coordinate
+        :param i2: the second A-coordinate
+        :param j2: the second B-coordinate
+        """
+        self.undo_log.append([("colors", self.colors.mark())])
+
+        # Add any vertices needed, new rows and columns of the grids are already zero
+        self._set_attribute("M", max(self.M, i1, i2))
+        self._set_attribute("N", max(self.N, j1, j2))
+        self._reserve(max(self.M, self.N))
+
+        self.two_cell_list.append((i1, j1, i2, j2))
+
+        has_a_edge = self._has_a_edge(i1, i2)
+        has_b_edge = self._has_b_edge(j1, j2)
+        # Both horizontal edges are colored
+        if has_a_edge and has_b_edge:
+            new_color = self._merge_colors(int(self.a_edges[i1, i2]), int(self.b_edges[j1, j2]))
+        # A-edge is colored
+        elif has_a_edge:
+            new_color = self.color(self.a_edges[i1, i2])
+            self._add_horizontal_edge("b_edges", j1, j2, new_color)
+        # B-edge is colored
+        elif has_b_edge:
+            new_color = self.color(self.b_edges[j1, j2])
+            self._add_horizontal_edge("a_edges", i1, i2, new_color)
+        # Neither edge is colored
+        else:
+            new_color = self.colors.add()
+            self.color_tails[new_color] = {}
+            self.color_heads[new_color] = {}
+            self.undo_log[-1].append(("new_color", new_color))
+            self._add_horizontal_edge("a_edges", i1, i2, new_color)
+            self._add_horizontal_edge("b_edges", j1, j2, new_color)
+            self._set_attribute("next_color", self.next_color + 1)
+        self._set_entry("vertical", i1, j1, new_color)
+        self._set_entry("vertical", i2, j2, new_color)
+
+    def _add_horizontal_edge(self, name, u, v, color):
+        """
+        Adds a new horizontal edge with the given color, recording it in the undo log.
+
+        The edge is also added to the tails and heads of its color class, see Taiko._add_horizontal_edge.
+
+        :param name: "a_edges" or "b_edges"
+        :param u: the tail of the edge, as a positive integer
+        :param v: the head of the edge, as a positive integer
+        :param color: the color of the edge, the representative of its class
+        """
+        self._set_entry(name, u, v, color)
+        if name == "b_edges":
+            u, v = -u, -v
+        self.link_succ.setdefault(u, {})[v] = color
+        self.link_pred.setdefault(v, {})[u] = color
+        for table, vertex in ((self.color_tails[color], u), (self.color_heads[color], v)):
+            if vertex in table:
+                table[vertex] += 1
+                self.folds += 1
+            else:
+                table[vertex] = 1
+        self.undo_log[-1].append(("edge", u, v, color))
+
+    def _merge_colors(self, color_A, color_B):
+        """
+        Identifies the classes of the given colors, recording the merge in the undo log.
+
+        See Taiko._merge_colors.
+
+        :param color_A: a color
+        :param color_B: a color
+        :return: the representative of the merged class
+        """
+        new_color, old_color = self.colors.union(color_A, color_B)
+        if old_color is None:
+            return new_color
+
+        tails, heads = self.color_tails, self.color_heads
+        if len(tails[old_color]) + len(heads[old_color]) > len(tails[new_color]) + len(heads[new_color]):
+            tails[new_color], tails[old_color] = tails[old_color], tails[new_color]
+            heads[new_color], heads[old_color] = heads[old_color], heads[new_color]
+            self.undo_log[-1].append(("swap", new_color, old_color))
+        for table in (tails, heads):
+            for vertex, count in table[old_color].items():
+                if vertex in table[new_color]:
+                    table[new_color][vertex] += count
+                    self.folds += 1
+                else:
+                    table[new_color][vertex] = count
+        self.undo_log[-1].append(("merge", new_color, old_color))
+        return new_color
+
+    def two_cell_in_taiko(self, i1, j1, i2, j2):
+        """
+        Returns true if the given 2-cell is in the taiko, false otherwise.
+
+        :param i1: the first A-coordinate
+        :param j1: the first B-coordinate
+        :param i2: the second A-coordinate
+        :param j2: the second B-coordinate
+        :return: true if the given 2-cell is in the taiko, false otherwise
+        """
+        # Vertices don't exist
+        if i1 > self.M or i2 > self.M or j1 > self.N or j2 > self.N:
+            return False
+        # Degenerate square
+        elif i1 == i2 or j1 == j2:
+            return False
+        # Bipartite edges aren't colored
+        elif self.vertical[i1, j1] == 0 or self.vertical[i2, j2] == 0:
+            return False
+        # Bipartite edges don't match color
+        elif self.color(self.vertical[i1, j1]) != self.color(self.vertical[i2, j2]):
+            return False
+        # No horizontal edges
+        elif not self._has_a_edge(i1, i2) or not self._has_b_edge(j1, j2):
+            return False
+        # Horizontal colors don't match
+        elif self.color(self.a_edges[i1, i2]) != self.color(self.b_edges[j1, j2]):
+            return False
+        # Passed checks
+        else:
+            return True
+
+    def num_two_cells(self):
+        """
+        Returns the number of 2-cells in the taiko.
+
+        :return: the number of 2-cells in the taiko
+        """
+        return len(self.two_cell_list)
+
+    def num_horizontal_edges(self):
+        """
+        Returns the number of horizontal edges in the taiko.
+
+        :return: the number of horizontal edges in the taiko
+        """
+        return sum(len(heads) for heads in self.link_succ.values())
+
+    def to_bytes(self):
+        """
+        Serializes the 2-cells of the taiko in the order they were added, see
+        taiko_storage.encode_cells.
+
+        :return: the serialized taiko
+        """
+        return encode_cells(self.two_cell_list)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Creates a taiko from the output of to_bytes.
+
+        :param data: the serialized taiko
+        :return: the taiko
+        """
+        return cls(decode_cells(data))
+
+    def pop_two_cell(self):
+        """
+        Removes the most recently added 2-cell from the taiko.
+
+        :return: the most recently added 2-cell, as a 4-tuple of integers
+        """
+        tails, heads = self.color_tails, self.color_heads
+        for record in reversed(self.undo_log.pop()):
+            kind = record[0]
+            if kind == "entry":
+                getattr(self, record[1])[record[2], record[3]] = record[4]
+            elif kind == "edge":
+                _, u, v, color = record
+                del self.link_succ[u][v]
+                del self.link_pred[v][u]
+                for table, vertex in ((tails[color], u), (heads[color], v)):
+                    table[vertex] -= 1
+                    if table[vertex] == 0:
+                        del table[vertex]
+                    else:
+                        self.folds -= 1
+            elif kind == "attribute":
+                setattr(self, record[1], record[2])
+            elif kind == "new_color":
+                del tails[record[1]]
+                del heads[record[1]]
+            elif kind == "merge":
+                _, new_color, old_color = record
+                for table in (tails, heads):
+                    for vertex, count in table[old_color].items():
+                        table[new_color][vertex] -= count
+                        if table[new_color][vertex] == 0:
+                            del table[new_color][vertex]
+                        else:
+                            self.folds -= 1
+            elif kind == "swap":
+                _, new_color, old_color = record
+                tails[new_color], tails[old_color] = tails[old_color], tails[new_color]
+                heads[new_color], heads[old_color] = heads[old_color], heads[new_color]
+            else:
+                self.colors.rollback(record[1])
+        return self.two_cell_list.pop()
+
+    def remove_two_cell(self, i1, j1, i2, j2):
+        """
+        Removes the given 2-cell from the taiko.
+
+        :param i1: the first A-coordinate
+        :param j1: the first B-coordinate
+        :param i2: the second A-coordinate
+        :param j2: the second B-coordinate
+        """
+        # Undo back to the given 2-cell and replay the ones added after it
+        index = self.two_cell_list.index((i1, j1, i2, j2))
+        later_cells = [self.pop_two_cell() for _ in range(len(self.two_cell_list) - index - 1)]
+        self.pop_two_cell()
+        for cell in reversed(later_cells):
+            self.add_two_cell(*cell)
+
+    def is_left_aligned(self, i1, j1, i2, j2):
+        """
+        Takes as input a 2-cell (i1, j1, i2, j2).
+
+        Returns true if the given 2-cell is left-aligned, false otherwise.
+
+        Based on left-alignment as described in Section 3.2 of Garg-Minyev.
+
+        :param i1: the first A-coordinate
+        :param j1: the first B-coordinate
+        :param i2: the second A-coordinate
+        :param j2: the second B-coordinate
+        :return: true if the given 2-cell is left-aligned, false otherwise
+        """
+        if i1 > self.M + 1:
+            return False
+        elif i2 > self.M + 1 and i2 > i1 + 1:
+            return False
+
+        if j1 > self.N + 1:
+            return False
+        elif j2 > self.N + 1 and j2 > j1 + 1:
+            return False
+
+        return True
+
+    def no_fold(self):
+        """
+        Returns true if the taiko satisfies the no-fold condition, false otherwise.
+
+        Folds are counted by add_two_cell, see Taiko.no_fold.
+
+        :return: true if the taiko satisfies the no-fold condition, false otherwise
+        """
+        return self.folds == 0
+
+    def is_girth_p_q(self, p, q):
+        """
+        Returns true if the taiko satisfies the girth(p,q) condition, false otherwise.
+
+        :param p: a positive integer >= 3
+        :param q: a positive integer
+        :return: true if the taiko satisfies the girth(p,q), false otherwise
+        """
+        a_vertices, b_vertices = range(1, self.M + 1), range(-1, -self.N - 1, -1)
+        if Taiko.has_short_cycle(a_vertices, p, self._link_neighbors) or \
+                Taiko.has_short_cycle(b_vertices, p, self._link_neighbors):
+            return False
+        color_nodes = [(color, side) for color in self.color_tails if self.colors.find(color) == color
+                       for side in ("in", "out")]
+        nodes = itertools.chain(a_vertices, b_vertices, color_nodes)
+        return not Taiko.has_short_cycle(nodes, 2 * q, self._middle_link_neighbors)
+
+    def last_two_cell_is_valid(self, p, q):
+        """
+        Returns true if the taiko satisfies the no-fold and girth(p,q) conditions, assuming that it
+        satisfied them before the most recent call to add_two_cell.
+
+        Only the neighborhoods of the edges and color classes created by that 2-cell are searched for
+        short cycles, see Taiko.last_two_cell_is_valid.
+
+        :param p: a positive integer >= 3
+        :param q: a positive integer
+        :return: true if the taiko still satisfies no-fold and girth(p,q), false otherwise
+        """
+        if self.folds:
+            return False
+
+        link_vertices, middle_link_nodes = set(), set()
+        for record in self.undo_log[-1]:
+            if record[0] == "edge":
+                _, u, v, color = record
+                link_vertices.update((u, v))
+                middle_link_nodes.update((u, v))
+            elif record[0] == "merge":
+                middle_link_nodes.update(((record[1], "in"), (record[1], "out")))
+
+        for vertex in link_vertices:
+            if Taiko.has_short_cycle_through(vertex, p, self._link_neighbors):
+                return False
+        for node in middle_link_nodes:
+            if Taiko.has_short_cycle_through(node, 2 * q, self._middle_link_neighbors):
+                return False
+        return True
+
+    def _link_neighbors(self, vertex):
+        """
+        Returns the neighbors of a vertex in L_A or L_B, the graph of horizontal edges on its side.
+
+        :param vertex: an A-vertex or a B-vertex, as a negative integer
+        :return: the list of neighbors
+        """
+        return list(self.link_pred.get(vertex, ())) + list(self.link_succ.get(vertex, ()))
+
+    def _middle_link_neighbors(self, node):
+        """
+        Returns the neighbors of a node of the middle link graph, see Taiko._middle_link_neighbors.
+
+        :param node: a vertex, B-vertices being negative, or a pair (color, "in"/"out") for a
+                     representative color
+        :return: the list of neighbors
+        """
+        if isinstance(node, tuple):
+            color, side = node
+            return list((self.color_heads if side == "in" else self.color_tails)[color])
+        find = self.colors.find
+        return [(find(color), "in") for color in self.link_pred.get(node, {}).values()] + \
+               [(find(color), "out") for color in self.link_succ.get(node, {}).values()]
+
+    def to_networkx(self):
+        """
+        Exports the taiko as a networkx DiGraph with the same nodes and colored edges as Taiko.
+
+        :return: the DiGraph, with B-vertices denoted with negative integers
+        """
+        graph = nx.DiGraph()
+        graph.add_nodes_from(range(1, self.M + 1))
+        graph.add_nodes_from(range(-1, -self.N - 1, -1))
+        roots = self._color_roots()
+        for i in range(1, self.M + 1):
+            for j in range(1, self.N + 1):
+                graph.add_edge(i, -j, color=int(roots[self.vertical[i, j]]))
+        for i1, i2 in zip(*np.nonzero(self.a_edges)):
+            graph.add_edge(int(i1), int(i2), color=int(roots[self.a_edges[i1, i2]]))
+        for j1, j2 in zip(*np.nonzero(self.b_edges)):
+            graph.add_edge(-int(j1), -int(j2), color=int(roots[self.b_edges[j1, j2]]))
+        graph.next_color = self.next_color
+        return graph
+
+    def layout(self):
+        """
+        Returns a layout for the graph returned by to_networkx to be plotted.
+
+        :return: a layout for this taiko to be plotted.
+        """
+        return nx.bipartite_layout(self.to_networkx(), nodes=[j for j in range(-1, -(self.N + 1), -1)],
+                                   align='horizontal')
+
+    def _has_a_edge(self, i1, i2):
+        return i1 <= self.M and i2 <= self.M and self.a_edges[i1, i2] != 0
+
+    def _has_b_edge(self, j1, j2):
+        return j1 <= self.N and j2 <= self.N and self.b_edges[j1, j2] != 0
+
+    def _color_roots(self):
+        """
+        Returns an array mapping every color to the representative of its class.
+
+        :return: the array, indexed by color
+        """
+        return np.array([self.colors.find(color) for color in range(len(self.colors))], dtype=np.int32)
+
+    def _reserve(self, size):
+        """
+        Grows the grids so that vertices up to size + 2 can be used as indices.
+
+        :param size: the number of vertices needed
+        """
+        capacity = self.vertical.shape[0]
+        if size + 3 <= capacity:
+            return
+        while capacity < size + 3:
+            capacity *= 2
+        for name in ("vertical", "a_edges", "b_edges"):
+            grid = getattr(self, name)
+            grown = np.zeros((capacity, capacity), dtype=grid.dtype)
+            grown[:grid.shape[0], :grid.shape[1]] = grid
+            setattr(self, name, grown)
+
+    def _set_entry(self, name, row, column, value):
+        """
+        Sets an entry of one of the grids, recording the previous value in the undo log.
+
+        The grid is recorded by name since _reserve replaces the arrays when they grow.
+
+        :param name: the name of the grid
+        :param row: the row index
+        :param column: the column index
+        :param value: the new value
+        """
+        grid = getattr(self, name)
+        old = int(grid[row, column])
+        if old != value:
+            self.undo_log[-1].append(("entry", name, row, column, old))
+            grid[row, column] = value
+
+    def _set_attribute(self, name, value):
+        """
+        Sets one of the counters M, N or next_color, recording the previous value in the undo log.
+
+        :param name: the name of the attribute
+        :param value: the new value
+        """
+        if getattr(self, name) != value:
+            self.undo_log[-1].append(("attribute", name, getattr(self, name)))
+            setattr(self, name, value)
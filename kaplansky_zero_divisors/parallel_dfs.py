@@ -0,0 +1,330 @@
+import multiprocessing as mp
+import queue
+import secrets
+import struct
+from multiprocessing import shared_memory
+from taiko import Taiko
+from taiko_dfs import extensions, state_key
+from taiko_storage import pack_cells
+from visited_store import state_digest
+
+
+class SharedStateStore:
+    """
+    Exact set of search state keys in shared memory, usable from several processes at once.
+
+    The set is split into shards, each with its own lock, so that workers only contend when they
+    insert into the same shard. A shard is an open-addressing hash table with linear probing in a
+    shared memory block. Its slots hold the 64-bit hash of a key and the offset of the packed key in
+    an arena at the end of the block, so that keys with the same hash are told apart.
+
+    A shard that is half full, or whose arena is full, is rebuilt twice as large in a new block.
+    The generation of every shard is kept in a shared array, and a process attaches to the new
+    block the next time it uses the shard.
+    """
+
+    # Fields of the shared array of shard metadata
+    GENERATION, NUM_SLOTS, COUNT, ARENA_USED, ARENA_SIZE = range(5)
+
+    def __init__(self, capacity=1 << 16, shards=64, key_size=64, prefix=None, locks=None, metadata=None):
+        """
+        Creates an empty store, or attaches to an existing one when prefix, locks and metadata are given.
+
+        :param capacity: the initial total number of slots, each 16 bytes
+        :param shards: the number of independently locked shards
+        :param key_size: the expected size of a packed key in bytes, which sizes the arenas
+        :param prefix: the prefix of the names of the shared memory blocks of an existing store
+        :param locks: the locks of an existing store
+        :param metadata: the shard metadata of an existing store
+        """
+        self.capacity = capacity
+        self.key_size = key_size
+        self.blocks = {}  # Shard -> (generation, SharedMemory, slots, arena) attached by this process
+        if prefix is None:
+            prefix = "taiko_" + secrets.token_hex(6)
+            locks = [mp.Lock() for _ in range(shards)]
+            metadata = mp.RawArray('q', 5 * shards)
+            num_slots = 1 << max(4, (capacity // shards - 1).bit_length())
+            for shard in range(shards):
+                self._create_block(prefix, shard, 0, num_slots, num_slots // 2 * (2 + key_size), metadata)
+        self.prefix = prefix
+        self.locks = locks
+        self.metadata = metadata
+
+    def __reduce__(self):
+        return SharedStateStore, (self.capacity, len(self.locks), self.key_size, self.prefix, self.locks,
+                                  self.metadata)
+
+    @staticmethod
+    def _block_name(prefix, shard, generation):
+        return "{}_{}_{}".format(prefix, shard, generation)
+
+    def _create_block(self, prefix, shard, generation, num_slots, arena_size, metadata):
+        """
+        Creates the block of a generation of a shard, records it in the metadata and attaches to it.
+
+        :return: the slots and the arena of the block
+        """
+        memory = shared_memory.SharedMemory(name=self._block_name(prefix, shard, generation), create=True,
+                                            size=16 * num_slots + arena_size)
+        memory.buf[:16 * num_slots] = bytes(16 * num_slots)
+        metadata[5 * shard:5 * shard + 5] = [generation, num_slots, 0, 0, arena_size]
+        self._detach(shard)
+        slots, arena = memory.buf[:16 * num_slots].cast('Q'), memory.buf[16 * num_slots:]
+        self.blocks[shard] = (generation, memory, slots, arena)
+        return slots, arena
+
+    def _attach(self, shard):
+        """
+        Returns the slots and the arena of the current block of a shard, attaching to it if needed.
+        Must be called with the lock of the shard held.
+        """
+        generation = self.metadata[5 * shard + self.GENERATION]
+        block = self.blocks.get(shard)
+        if block is not None and block[0] == generation:
+            return block[2], block[3]
+        self._detach(shard)
+        memory = shared_memory.SharedMemory(name=self._block_name(self.prefix, shard, generation))
+        num_slots = self.metadata[5 * shard + self.NUM_SLOTS]
+        slots, arena = memory.buf[:16 * num_slots].cast('Q'), memory.buf[16 * num_slots:]
+        self.blocks[shard] = (generation, memory, slots, arena)
+        return slots, arena
+
+    def _detach(self, shard):
+        block = self.blocks.pop(shard, None)
+        if block is not None:
+            _, memory, slots, arena = block
+            slots.release()
+            arena.release()
+            memory.close()
+
+    def _grow(self, shard):
+        """
+        Moves a shard to a new block with twice as many slots and twice as large an arena, and frees
+        the old block. Must be called with the lock of the shard held.
+
+        :return: the slots and the arena of the new block
+        """
+        old_slots, old_arena = self._attach(shard)
+        base = 5 * shard
+        generation, num_slots, count, arena_used, arena_size = self.metadata[base:base + 5]
+        old_memory = self.blocks.pop(shard)[1]
+        slots, arena = self._create_block(self.prefix, shard, generation + 1, 2 * num_slots, 2 * arena_size,
+                                          self.metadata)
+        shards = len(self.locks)
+        mask = 2 * num_slots - 1
+        for slot in range(num_slots):
+            value = old_slots[2 * slot]
+            if value:
+                position = (value // shards) & mask
+                while slots[2 * position]:
+                    position = (position + 1) & mask
+                slots[2 * position], slots[2 * position + 1] = value, old_slots[2 * slot + 1]
+        arena[:arena_used] = old_arena[:arena_used]
+        self.metadata[base + self.COUNT], self.metadata[base + self.ARENA_USED] = count, arena_used
+        old_slots.release()
+        old_arena.release()
+        old_memory.close()
+        old_memory.unlink()
+        return slots, arena
+
+    def add(self, key):
+        """
+        Inserts a state key into the store.
+
+        :param key: the state key, an iterable of 2-cells
+        :return: true if the key was not in the store yet, false if it was
+        """
+        packed = pack_cells(sorted(key))
+        record = struct.pack("<H", len(packed)) + packed
+        value = state_digest(key)
+        shard = value % len(self.locks)
+        base = 5 * shard
+        with self.locks[shard]:
+            slots, arena = self._attach(shard)
+            mask = self.metadata[base + self.NUM_SLOTS] - 1
+            position = (value // len(self.locks)) & mask
+            while slots[2 * position]:
+                if slots[2 * position] == value:
+                    offset = slots[2 * position + 1]
+                    if arena[offset:offset + len(record)] == record:
+                        return False
+                position = (position + 1) & mask
+
+            metadata = self.metadata
+            grown = False
+            while 2 * (metadata[base + self.COUNT] + 1) > metadata[base + self.NUM_SLOTS] or \
+                    metadata[base + self.ARENA_USED] + len(record) > metadata[base + self.ARENA_SIZE]:
+                slots, arena = self._grow(shard)
+                grown = True
+            if grown:
+                # The key is not in the new block, only its first empty slot is needed
+                mask = metadata[base + self.NUM_SLOTS] - 1
+                position = (value // len(self.locks)) & mask
+                while slots[2 * position]:
+                    position = (position + 1) & mask
+            offset = metadata[base + self.ARENA_USED]
+            arena[offset:offset + len(record)] = record
+            slots[2 * position], slots[2 * position + 1] = value, offset
+            metadata[base + self.COUNT] += 1
+            metadata[base + self.ARENA_USED] = offset + len(record)
+        return True
+
+    def __len__(self):
+        return sum(self.metadata[5 * shard + self.COUNT] for shard in range(len(self.locks)))
+
+    def close(self, unlink=False):
+        """
+        Detaches from the shared memory, and frees it if unlink is set.
+
+        :param unlink: whether to free the memory, to be done once by the creating process after the
+                       other processes have closed the store
+        """
+        for shard in list(self.blocks):
+            self._detach(shard)
+        if unlink:
+            for shard in range(len(self.locks)):
+                name = self._block_name(self.prefix, shard, self.metadata[5 * shard + self.GENERATION])
+                memory = shared_memory.SharedMemory(name=name)
+                memory.close()
+                memory.unlink()
+
+
+def _visit(current, store, max_M, max_N, canonical):
+    """
+    Marks a state as explored, returning false if some worker has already explored it.
+    """
+    return store.add(state_key(current, max_M, max_N, canonical))
+
+
+def _worker(index, tasks, results, pending, idle, store, max_M, max_N, p, q, canonical, steal_interval,
+            taiko_class):
+    """
+    Explores subtrees taken from the task queue until every subtree has been explored.
+
+    While some worker is idle, the bottom half of the local stack, holding the states closest to
+    the root and so the largest subtrees, is handed back to the task queue for it to steal.
+    """
+    leaves = []
+    explored = steals = 0
+    waiting = False
+    while True:
+        try:
+            state = tasks.get(timeout=0.05)
+        except queue.Empty:
+            if not waiting:
+                waiting = True
+                with idle.get_lock():
+                    idle.value += 1
+            if pending.value == 0:
+                break
+            continue
+        if waiting:
+            waiting = False
+            with idle.get_lock():
+                idle.value -= 1
+
+        stack = [state]
+        while stack:
+            current = stack.pop()
+            if not _visit(current, store, max_M, max_N, canonical):
+                continue
+            explored += 1
+            neighbors = extensions(current, max_M, max_N, p, q, taiko_class=taiko_class)
+            stack.extend(neighbors)
+            if not neighbors:
+                leaves.append(current)
+
+            if explored % steal_interval == 0 and idle.value > 0 and len(stack) > 1:
+                donated = stack[:len(stack) // 2]
+                del stack[:len(stack) // 2]
+                with pending.get_lock():
+                    pending.value += len(donated)
+                for donated_state in donated:
+                    tasks.put(donated_state)
+                steals += len(donated)
+
+        with pending.get_lock():
+            pending.value -= 1
+
+    results.put((index, leaves, {"explored": explored, "stolen": steals}))
+    store.close()
+
+
+def parallel_search(max_M=4, max_N=4, p=4, q=4, canonical=True, workers=4, split_depth=2,
+                    store_capacity=1 << 16, steal_interval=64, taiko_class=Taiko):
+    """
+    Searches for maximal taikos like taiko_dfs.search, using several processes.
+
+    The search tree is expanded serially down to split_depth 2-cells, and the subtrees below are
+    explored by a pool of worker processes sharing a SharedStateStore of explored states. Workers
+    that run out of subtrees steal half of the stack of a busy worker.
+
+    The leaves are the same as those of the serial search, up to the choice of representative of
+    each isomorphism class when canonical is set. A worker that exits without reporting its leaves
+    stops the search with a RuntimeError.
+
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param p: the girth bound for L_A and L_B
+    :param q: the girth bound for the middle link graph is 2q
+    :param canonical: whether to explore one taiko per isomorphism class
+    :param workers: the number of worker processes
+    :param split_depth: the number of 2-cells at which subtrees are handed to the workers
+    :param store_capacity: the initial number of slots of the shared store of explored states, which
+                           grows as needed
+    :param steal_interval: how many states a worker explores between checks for idle workers
+    :param taiko_class: the class checking the extensions, Taiko or CompactTaiko, see taiko_dfs.ENGINES
+    :return: a pair (leaves, statistics), leaves being a list of frozensets of 2-cells
+    """
+    store = SharedStateStore(store_capacity)
+    leaves, frontier = [], [frozenset()]
+    explored = 0
+    for _ in range(split_depth):
+        next_frontier = []
+        for current in frontier:
+            if _visit(current, store, max_M, max_N, canonical):
+                explored += 1
+                neighbors = extensions(current, max_M, max_N, p, q, taiko_class=taiko_class)
+                next_frontier.extend(neighbors)
+                if not neighbors:
+                    leaves.append(current)
+        frontier = next_frontier
+
+    tasks, results = mp.Queue(), mp.Queue()
+    pending, idle = mp.Value('q', len(frontier)), mp.Value('i', 0)
+    for state in frontier:
+        tasks.put(state)
+    processes = [mp.Process(target=_worker, args=(index, tasks, results, pending, idle, store, max_M, max_N, p, q,
+                                                  canonical, steal_interval, taiko_class))
+                 for index in range(workers)]
+    for process in processes:
+        process.start()
+
+    statistics = {"explored": explored, "stolen": 0, "workers": []}
+    reported = set()
+    try:
+        while len(reported) < len(processes):
+            try:
+                index, worker_leaves, worker_statistics = results.get(timeout=1)
+            except queue.Empty:
+                # The other workers would wait forever for the subtrees of a worker that died
+                for index, process in enumerate(processes):
+                    if index not in reported and process.exitcode not in (None, 0):
+                        raise RuntimeError("worker process {} exited with code {}".format(index, process.exitcode))
+                continue
+            reported.add(index)
+            leaves.extend(worker_leaves)
+            statistics["explored"] += worker_statistics["explored"]
+            statistics["stolen"] += worker_statistics["stolen"]
+            statistics["workers"].append(worker_statistics)
+    except BaseException:
+        for process in processes:
+            process.terminate()
+        raise
+    finally:
+        for process in processes:
+            process.join()
+        store.close(unlink=True)
+    statistics["leaves"] = len(leaves)
+    return leaves, statistics
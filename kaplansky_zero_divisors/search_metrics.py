@@ -0,0 +1,206 @@
+import cProfile
+import csv
+import json
+import os
+import pstats
+import resource
+import sys
+import time
+
+
+class NullMetrics:
+    """
+    Metrics that record nothing, used by the search when instrumentation is turned off.
+    """
+
+    enabled = False
+
+    def state(self, depth, num_children, num_candidates, max_candidates):
+        pass
+
+    def revisit(self):
+        pass
+
+    def leaf(self):
+        pass
+
+    def maybe_report(self, explored):
+        pass
+
+    def start_profile(self):
+        return False
+
+    def stop_profile(self):
+        pass
+
+    def finish(self, explored):
+        pass
+
+
+class SearchMetrics(NullMetrics):
+    """
+    Counters and timings for taiko_dfs.search.
+
+    Records the number of states explored and revisited, the depth histogram and branching
+    factor, how many candidate 2-cells each check rejects and the time spent in each step of
+    extensions, the size of the explored store and the peak memory of the process. A progress
+    line is written every report_interval seconds, and the metrics are saved to a JSON file, or
+    appended as a row to a CSV file, at each report and at the end. Every profile_every-th
+    expansion can be run under cProfile, to find the hot functions at a small cost.
+    """
+
+    enabled = True
+    CHECKS = ("can_add_two_cell", "no_fold", "girth")
+    STEPS = ("add_two_cell", "no_fold", "girth", "pop_two_cell")
+
+    def __init__(self, report_interval=10.0, path=None, profile_every=0, profile_path=None, stream=sys.stderr):
+        """
+        Creates empty metrics.
+
+        :param report_interval: the number of seconds between progress reports, 0 for no reports
+        :param path: the metrics file, ending in .csv for CSV and JSON otherwise, None for no file
+        :param profile_every: profile one expansion out of this many, 0 for no profiling
+        :param profile_path: the file to dump the profile to in pstats format, None for no file
+        :param stream: the text stream for the progress line
+        """
+        self.report_interval = report_interval
+        self.path = path
+        self.profile_every = profile_every
+        self.profile_path = profile_path
+        self.stream = stream
+        self.profiler = cProfile.Profile() if profile_every else None
+        self.profiled = 0
+
+        self.start = self.last_report = time.monotonic()
+        self.states = self.revisits = self.leaves = 0
+        self.children = self.candidates = 0
+        self.depths = {}
+        self.rejected = {check: 0 for check in self.CHECKS}
+        self.step_time = {step: 0.0 for step in self.STEPS}
+        self.explored_size = 0
+
+    def state(self, depth, num_children, num_candidates, max_candidates):
+        """
+        Records the expansion of a state.
+
+        :param depth: the number of 2-cells of the state
+        :param num_children: the number of valid extensions
+        :param num_candidates: the number of candidates passing can_add_two_cell
+        :param max_candidates: the number of candidates before can_add_two_cell
+        """
+        self.states += 1
+        self.depths[depth] = self.depths.get(depth, 0) + 1
+        self.children += num_children
+        self.candidates += num_candidates
+        self.rejected["can_add_two_cell"] += max_candidates - num_candidates
+
+    def revisit(self):
+        self.revisits += 1
+
+    def leaf(self):
+        self.leaves += 1
+
+    def start_profile(self):
+        """
+        Starts profiling if the next expansion is to be sampled.
+
+        :return: true if profiling was started, in which case stop_profile must be called
+        """
+        if self.profiler is None or self.states % self.profile_every:
+            return False
+        self.profiled += 1
+        self.profiler.enable()
+        return True
+
+    def stop_profile(self):
+        self.profiler.disable()
+
+    def snapshot(self, explored=None):
+        """
+        Returns the current metrics.
+
+        :param explored: the store of explored states, to record its size
+        :return: a dictionary of metrics
+        """
+        if explored is not None:
+            self.explored_size = len(explored)
+        elapsed = time.monotonic() - self.start
+        # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+        peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+        return {
+            "elapsed": elapsed,
+            "states": self.states,
+            "states_per_second": self.states / elapsed if elapsed else 0.0,
+            "revisits": self.revisits,
+            "leaves": self.leaves,
+            "explored": self.explored_size,
+            "branching_factor": self.children / self.states if self.states else 0.0,
+            "candidates": self.candidates,
+            "rejected": dict(self.rejected),
+            "step_time": dict(self.step_time),
+            "depths": {str(depth): count for depth, count in sorted(self.depths.items())},
+            "peak_memory": peak_memory,
+            "profiled_expansions": self.profiled,
+        }
+
+    def maybe_report(self, explored):
+        """
+        Writes a progress report if report_interval seconds have passed since the last one.
+
+        :param explored: the store of explored states
+        """
+        if self.report_interval and time.monotonic() - self.last_report >= self.report_interval:
+            self.report(explored)
+
+    def report(self, explored):
+        """
+        Writes the progress line and saves the metrics file.
+
+        :param explored: the store of explored states
+        """
+        self.last_report = time.monotonic()
+        snapshot = self.snapshot(explored)
+        if self.stream is not None and self.report_interval:
+            depth = max(self.depths, default=0)
+            self.stream.write("{:.0f}s {} states ({:.0f}/s), {} leaves, {} explored, depth {}, "
+                              "branching {:.2f}, rejected {}, peak {:.0f} MiB\n".format(
+                                  snapshot["elapsed"], self.states, snapshot["states_per_second"], self.leaves,
+                                  snapshot["explored"], depth, snapshot["branching_factor"],
+                                  " ".join("{}={}".format(check, count) for check, count in self.rejected.items()),
+                                  snapshot["peak_memory"] / (1 << 20)))
+            self.stream.flush()
+        if self.path is not None:
+            self.save(snapshot)
+
+    def save(self, snapshot):
+        """
+        Saves a snapshot to the metrics file.
+
+        :param snapshot: the output of snapshot
+        """
+        if self.path.endswith(".csv"):
+            row = {key: value for key, value in snapshot.items() if not isinstance(value, dict)}
+            row.update(("rejected_" + check, count) for check, count in snapshot["rejected"].items())
+            row.update(("time_" + step, seconds) for step, seconds in snapshot["step_time"].items())
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            with open(self.path, "a", newline="") as file:
+                writer = csv.DictWriter(file, fieldnames=list(row))
+                if new_file:
+                    writer.writeheader()
+                writer.writerow(row)
+        else:
+            with open(self.path, "w") as file:
+                json.dump(snapshot, file, indent=2)
+
+    def finish(self, explored):
+        """
+        Writes the final report, with the hottest functions of the sampled profile if any.
+
+        :param explored: the store of explored states
+        """
+        self.report(explored)
+        if self.profiler is not None and self.profiled:
+            if self.profile_path is not None:
+                self.profiler.dump_stats(self.profile_path)
+            if self.stream is not None:
+                pstats.Stats(self.profiler, stream=self.stream).sort_stats("cumulative").print_stats(15)
@@ -1,4 +1,10 @@
+import itertools
 import networkx as nx
+from canonical_form import canonical_form
+from taiko_storage import decode_cells, encode_cells
+from union_find import UnionFind
+
+GIRTH_CACHE_SIZE = 1 << 12  # Cached girth checks kept per taiko, see link_girth_at_least_n
 
 
 class Taiko(nx.DiGraph):
@@ -17,52 +23,34 @@ class Taiko(nx.DiGraph):
         if two_cell_list is None:
             two_cell_list = []
         self.next_color = 1  # Next available color for cell addition if a new one is needed
-
-        # Compute number of nodes needed
-        lambda_a, lambda_b = 0, 0
-        for cell in two_cell_list:
-            if cell[0] > lambda_a:
-                lambda_a = cell[0]
-            if cell[2] > lambda_a:
-                lambda_a = cell[2]
-            if cell[1] > lambda_b:
-                lambda_b = cell[1]
-            if cell[3] > lambda_b:
-                lambda_b = cell[3]
-        self.M, self.N = lambda_a, lambda_b
-        a_vertices = [i for i in range(1, self.M + 1)]
-        b_vertices = [j for j in range(-1, -self.N - 1, -1)]
-        self.add_nodes_from(a_vertices)
-        self.add_nodes_from(b_vertices)  # Note that B-vertices are denoted with negative integers.
-
-        # Add vertical edges
-        for i in range(1, self.M + 1):
-            for j in range(-1, -(self.N + 1), -1):
-                self.add_edge(i, j, color=0)
-
-        # Initialize middle link graph L_1
-        self.middle_link_graph = nx.Graph()
-        self.middle_link_graph.add_nodes_from([str(i) for i in range(1, self.M + 1)])
-        self.middle_link_graph.add_nodes_from([str(j) for j in range(-1, -self.N - 1, -1)])
-        self.middle_link_graph.add_nodes_from([str(color) + "_in" for color in range(1, self.next_color)])
-        self.middle_link_graph.add_nodes_from([str(color) + "_out" for color in range(1, self.next_color)])
+        self.undo_log = []  # One list of undo records per added 2-cell, see add_two_cell
+
+        # Vertices are created by add_two_cell as the cells need them, so that undoing a cell also
+        # removes the vertices it introduced. Note that B-vertices are denoted with negative integers.
+        self.M, self.N = 0, 0
+
+        # Colors of the horizontal edges are identified when 2-cells glue them together. The classes
+        # live in a union-find, and for every class we keep the tails and heads of its horizontal
+        # edges, with multiplicities. These are the neighbors of its "out" and "in" nodes in the
+        # middle link graph L_1.
+        self.colors = UnionFind(1)  # Color 0 marks uncolored vertical edges
+        self.color_tails = {}
+        self.color_heads = {}
+        # Number of repeated (class, vertex) entries in these tables, each one is a fold
+        self.folds = 0
+
+        # Every change to L_A, L_B or the middle link graph gives it a new version number, and
+        # undoing the change restores the previous one, so that girth checks can be cached by
+        # version. Numbers are never reused, a version always denotes the same graph.
+        self.link_versions = {"A": 0, "B": 0, "middle": 0}
+        self.version_counter = itertools.count(1)
+        self.girth_cache = {}
 
         # Add 2-cells and keep track of the list
         self.two_cell_list = []
         for cell in two_cell_list:
             self.add_two_cell(*cell)
 
-        for u, v, data in self.edges.data(nbunch=a_vertices):
-            if u in a_vertices and v in a_vertices:
-                color = data['color']
-                self.middle_link_graph.add_edge(str(v), str(color) + "_in")
-                self.middle_link_graph.add_edge(str(u), str(color) + "_out")
-        for u, v, data in self.edges.data(nbunch=b_vertices):
-            if u in b_vertices and v in b_vertices:
-                color = data['color']
-                self.middle_link_graph.add_edge(str(v), str(color) + "_in")
-                self.middle_link_graph.add_edge(str(u), str(color) + "_out")
-
     def can_add_two_cell(self, i1, j1, i2, j2, max_M=-1, max_N=-1):
         """
         Returns true if the given 2-cell can be added to the taiko, false otherwise.
@@ -103,15 +91,68 @@ class Taiko(nx.DiGraph):
 
         return True
 
+    def candidate_cells(self, max_M=-1, max_N=-1):
+        """
+        Generates the 2-cells that can be added to the taiko, in the order of
+        permutations(range(1, M + 3), 2) x permutations(range(1, N + 3), 2).
+
+        Yields exactly the cells for which can_add_two_cell is true. The A- and B-sides of a cell
+        are checked separately, against left-alignment, the bounds and the orientation of the
+        existing horizontal edges, and only the admissible pairs of sides are combined. The
+        colors of the vertical edges are looked up only when both horizontal edges exist. Cells
+        added after a cell is yielded must be removed before asking for the next one.
+
+        :param max_M: the maximum number of A-vertices for this taiko, -1 if no bound
+        :param max_N: the maximum number of B-vertices for this taiko, -1 if no bound
+        :return: a generator of 4-tuples (i1, j1, i2, j2)
+        """
+        bounded = max_M > 0 and max_N > 0
+        a_pairs = self._candidate_pairs(self.M, max_M if bounded else -1, 1)
+        b_pairs = self._candidate_pairs(self.N, max_N if bounded else -1, -1)
+        for i1, i2 in a_pairs:
+            a_edge = i1 in self._succ and i2 in self._succ[i1]
+            for j1, j2 in b_pairs:
+                # Bipartite edges are colored
+                if a_edge and -j2 in self._succ.get(-j1, ()) and \
+                        (self._adj[i1][-j1]['color'] != 0 or self._adj[i2][-j2]['color'] != 0):
+                    continue
+                yield i1, j1, i2, j2
+
+    def _candidate_pairs(self, size, bound, sign):
+        """
+        Returns the pairs of vertices on one side that can be the horizontal edge of a new 2-cell.
+
+        :param size: the number of vertices on this side, M or N
+        :param bound: the maximum number of vertices on this side, -1 if no bound
+        :param sign: 1 for the A-side, -1 for the B-side
+        :return: the list of pairs of positive vertex numbers
+        """
+        pairs = []
+        for k1 in range(1, min(size + 1, bound if bound > 0 else size + 1) + 1):
+            for k2 in range(1, size + 3):
+                # Degenerate, above the bound, or not left-aligned
+                if k1 == k2 or (bound > 0 and k2 > bound) or (k2 > size + 1 and k2 > k1 + 1):
+                    continue
+                # Cannot add cell with current orientation
+                if sign * k1 in self._succ.get(sign * k2, ()):
+                    continue
+                pairs.append((k1, k2))
+        return pairs
+
     def add_two_cell(self, i1, j1, i2, j2):
         """
         Adds a 2-cell to the taiko.
 
+        Every change made to the taiko is recorded in a new entry of the undo log, so that
+        pop_two_cell can revert exactly this change without rebuilding the taiko.
+
         :param i1: the first A-coordinate
         :param j1: the first B-coordinate
         :param i2: the second A-coordinate
         :param j2: the second B-coordinate
         """
+        self.undo_log.append([("colors", self.colors.mark())])
+
         # Add any A-vertices needed
         lambda_a = self.M
         if i1 > lambda_a:
@@ -120,11 +161,10 @@ class Taiko(nx.DiGraph):
             lambda_a = i2
 
         for i in range(self.M + 1, lambda_a + 1):
-            self.add_node(i)
-            self.middle_link_graph.add_node(str(i))
+            self._add_vertex(i)
             for j in range(-1, -self.N - 1, -1):
                 self.add_edge(i, j, color=0)
-        self.M = lambda_a
+        self._set_attribute("M", lambda_a)
 
         # Add any B-vertices needed
         lambda_b = self.N
@@ -134,11 +174,10 @@ class Taiko(nx.DiGraph):
             lambda_b = j2
 
         for j in range(-self.N - 1, -lambda_b - 1, -1):
-            self.add_node(j)
-            self.middle_link_graph.add_node(str(j))
+            self._add_vertex(j)
             for i in range(1, self.M + 1):
                 self.add_edge(i, j, color=0)
-        self.N = lambda_b
+        self._set_attribute("N", lambda_b)
 
         # Update internal 2-cell list
         self.two_cell_list.append((i1, j1, i2, j2))
@@ -149,78 +188,182 @@ class Taiko(nx.DiGraph):
 
         # Both horizontial edges are colored
         if self.has_edge(i1, i2) and self.has_edge(j1, j2):
-            color_A = self.edges[i1, i2]['color']
-            color_B = self.edges[j1, j2]['color']
-            new_color = min(color_A, color_B)
-            old_color = max(color_A, color_B)
-
-            # Colors match
-            if new_color == old_color:
-                self.edges[i1, j1]['color'] = new_color
-                self.edges[i2, j2]['color'] = new_color
-            # Colors don't match
-            else:
-                self.edges[i1, j1]['color'] = new_color
-                self.edges[i2, j2]['color'] = new_color
-
-                if new_color == color_A:
-                    self.edges[j1, j2]['color'] = new_color
-                    self.middle_link_graph.remove_edge(str(j1), str(old_color) + "_out")
-                    self.middle_link_graph.remove_edge(str(j2), str(old_color) + "_in")
-                    self.middle_link_graph.add_edge(str(j1), str(new_color) + "_out")
-                    self.middle_link_graph.add_edge(str(j2), str(new_color) + "_in")
-                elif new_color == color_B:
-                    self.edges[i1, i2]['color'] = new_color
-                    self.middle_link_graph.remove_edge(str(i1), str(old_color) + "_out")
-                    self.middle_link_graph.remove_edge(str(i2), str(old_color) + "_in")
-                    self.middle_link_graph.add_edge(str(i1), str(new_color) + "_out")
-                    self.middle_link_graph.add_edge(str(i2), str(new_color) + "_in")
-
-                # Update all instances of old color to be new color
-                for u, v, color in self.edges.data("color", default=0):
-                    if color == old_color:
-                        self.edges[u, v]['color'] = new_color
-
-                        # Horizontial edge, should update middle link graph
-                        if u*v > 0:
-                            self.middle_link_graph.remove_edge(str(u), str(old_color) + "_out")
-                            self.middle_link_graph.remove_edge(str(v), str(old_color) + "_in")
-                            self.middle_link_graph.add_edge(str(u), str(new_color) + "_out")
-                            self.middle_link_graph.add_edge(str(v), str(new_color) + "_in")
+            new_color = self._merge_colors(self.edges[i1, i2]['color'], self.edges[j1, j2]['color'])
         # A-edge is colored
         elif self.has_edge(i1, i2):
-            new_color = self.edges[i1, i2]['color']
-            self.edges[i1, j1]['color'] = new_color
-            self.edges[i2, j2]['color'] = new_color
-            self.add_edge(j1, j2, color=new_color)
-            # self.edges[j1, j2]['color'] = new_color
-            self.middle_link_graph.add_edge(str(j1), str(new_color) + "_out")
-            self.middle_link_graph.add_edge(str(j2), str(new_color) + "_in")
+            new_color = self.edge_color(i1, i2)
+            self._add_horizontal_edge(j1, j2, new_color)
         # B-edge is colored
         elif self.has_edge(j1, j2):
-            new_color = self.edges[j1, j2]['color']
-            self.edges[i1, j1]['color'] = new_color
-            self.edges[i2, j2]['color'] = new_color
-            self.add_edge(i1, i2, color=new_color)
-            # self.edges[i1, i2]['color'] = new_color
-            self.middle_link_graph.add_edge(str(i1), str(new_color) + "_out")
-            self.middle_link_graph.add_edge(str(i2), str(new_color) + "_in")
+            new_color = self.edge_color(j1, j2)
+            self._add_horizontal_edge(i1, i2, new_color)
         # Neither edge is colored
         else:
-            new_color = self.next_color
-            self.add_edge(i1, i2, color=new_color)
-            # self.edges[i1, i2]['color'] = new_color
-            self.middle_link_graph.add_node(str(new_color) + "_out")
-            self.middle_link_graph.add_node(str(new_color) + "_in")
-            self.middle_link_graph.add_edge(str(i1), str(new_color) + "_out")
-            self.middle_link_graph.add_edge(str(i2), str(new_color) + "_in")
-            self.add_edge(j1, j2, color=new_color)
-            # self.edges[j1, j2]['color'] = new_color
-            self.middle_link_graph.add_edge(str(j1), str(new_color) + "_out")
-            self.middle_link_graph.add_edge(str(j2), str(new_color) + "_in")
-            self.edges[i1, j1]['color'] = new_color
-            self.edges[i2, j2]['color'] = new_color
-            self.next_color += 1
+            new_color = self.colors.add()
+            self.color_tails[new_color] = {}
+            self.color_heads[new_color] = {}
+            self.undo_log[-1].append(("new_color", new_color))
+            self._add_horizontal_edge(i1, i2, new_color)
+            self._add_horizontal_edge(j1, j2, new_color)
+            self._set_attribute("next_color", self.next_color + 1)
+        self._set_color(i1, j1, new_color)
+        self._set_color(i2, j2, new_color)
+
+    def edge_color(self, u, v):
+        """
+        Returns the color of the given edge.
+
+        Edges keep the color they were given when they were colored, and the classes of colors
+        that have been identified since are tracked by the union-find self.colors, so the color
+        attribute of an edge should not be read directly.
+
+        :param u: the tail of the edge
+        :param v: the head of the edge
+        :return: the color of the edge, 0 for an uncolored vertical edge
+        """
+        return self.colors.find(self._adj[u][v]['color'])
+
+    def _add_vertex(self, vertex):
+        """
+        Adds a new vertex to the taiko, recording it in the undo log.
+
+        Vertical edges at the new vertex don't need to be recorded, removing the vertex removes them.
+
+        :param vertex: the vertex, a positive integer for A-vertices and a negative one for B-vertices
+        """
+        self.add_node(vertex)
+        self.undo_log[-1].append(("vertex", vertex))
+
+    def _add_horizontal_edge(self, u, v, color):
+        """
+        Adds a new horizontal edge with the given color, recording it in the undo log.
+
+        The edge is also added to the tails and heads of its color class in the middle link graph.
+
+        :param u: the tail of the edge
+        :param v: the head of the edge
+        :param color: the color of the edge, the representative of its class
+        """
+        self.add_edge(u, v, color=color)
+        self._new_version("A" if u > 0 else "B")
+        self._new_version("middle")
+        for table, vertex in ((self.color_tails[color], u), (self.color_heads[color], v)):
+            if vertex in table:
+                table[vertex] += 1
+                self.folds += 1
+            else:
+                table[vertex] = 1
+        self.undo_log[-1].append(("edge", u, v, color))
+
+    def _merge_colors(self, color_A, color_B):
+        """
+        Identifies the classes of the given colors, recording the merge in the undo log.
+
+        The tails and heads of the absorbed class are added to those of the surviving one,
+        after swapping the two if needed so that the smaller tables are the ones copied.
+
+        :param color_A: a color
+        :param color_B: a color
+        :return: the representative of the merged class
+        """
+        new_color, old_color = self.colors.union(color_A, color_B)
+        if old_color is None:
+            return new_color
+        self._new_version("middle")
+
+        tails, heads = self.color_tails, self.color_heads
+        if len(tails[old_color]) + len(heads[old_color]) > len(tails[new_color]) + len(heads[new_color]):
+            tails[new_color], tails[old_color] = tails[old_color], tails[new_color]
+            heads[new_color], heads[old_color] = heads[old_color], heads[new_color]
+            self.undo_log[-1].append(("swap", new_color, old_color))
+        for table in (tails, heads):
+            for vertex, count in table[old_color].items():
+                if vertex in table[new_color]:
+                    table[new_color][vertex] += count
+                    self.folds += 1
+                else:
+                    table[new_color][vertex] = count
+        self.undo_log[-1].append(("merge", new_color, old_color))
+        return new_color
+
+    def _set_color(self, u, v, color):
+        """
+        Sets the color of an existing edge, recording the previous color in the undo log.
+
+        :param u: the tail of the edge
+        :param v: the head of the edge
+        :param color: the new color of the edge
+        """
+        data = self.edges[u, v]
+        if data['color'] != color:
+            self.undo_log[-1].append(("color", u, v, data['color']))
+            data['color'] = color
+
+    def _new_version(self, name):
+        """
+        Gives a new version number to one of the link graphs, recording the previous one in the undo log.
+
+        :param name: "A", "B" or "middle"
+        """
+        self.undo_log[-1].append(("version", name, self.link_versions[name]))
+        self.link_versions[name] = next(self.version_counter)
+
+    def _set_attribute(self, name, value):
+        """
+        Sets one of the counters M, N or next_color, recording the previous value in the undo log.
+
+        :param name: the name of the attribute
+        :param value: the new value
+        """
+        if getattr(self, name) != value:
+            self.undo_log[-1].append(("attribute", name, getattr(self, name)))
+            setattr(self, name, value)
+
+    def _undo_last_two_cell(self):
+        """
+        Reverts the changes made by the most recent call to add_two_cell, using the undo log.
+
+        :return: the reverted 2-cell, as a 4-tuple of integers
+        """
+        tails, heads = self.color_tails, self.color_heads
+        for record in reversed(self.undo_log.pop()):
+            kind = record[0]
+            if kind == "vertex":
+                self.remove_node(record[1])
+            elif kind == "edge":
+                _, u, v, color = record
+                self.remove_edge(u, v)
+                for table, vertex in ((tails[color], u), (heads[color], v)):
+                    table[vertex] -= 1
+                    if table[vertex] == 0:
+                        del table[vertex]
+                    else:
+                        self.folds -= 1
+            elif kind == "color":
+                self.edges[record[1], record[2]]['color'] = record[3]
+            elif kind == "attribute":
+                setattr(self, record[1], record[2])
+            elif kind == "new_color":
+                del tails[record[1]]
+                del heads[record[1]]
+            elif kind == "merge":
+                _, new_color, old_color = record
+                for table in (tails, heads):
+                    for vertex, count in table[old_color].items():
+                        table[new_color][vertex] -= count
+                        if table[new_color][vertex] == 0:
+                            del table[new_color][vertex]
+                        else:
+                            self.folds -= 1
+            elif kind == "swap":
+                _, new_color, old_color = record
+                tails[new_color], tails[old_color] = tails[old_color], tails[new_color]
+                heads[new_color], heads[old_color] = heads[old_color], heads[new_color]
+            elif kind == "colors":
+                self.colors.rollback(record[1])
+            elif kind == "version":
+                self.link_versions[record[1]] = record[2]
+        return self.two_cell_list.pop()
 
     def two_cell_in_taiko(self, i1, j1, i2, j2):
         """
@@ -246,13 +389,13 @@ class Taiko(nx.DiGraph):
         elif self.edges[i1, j1]['color'] == 0 or self.edges[i2, j2]['color'] == 0:
             return False
         # Bipartite edges don't match color
-        elif self.edges[i1, j1]['color'] != self.edges[i2, j2]['color']:
+        elif self.edge_color(i1, j1) != self.edge_color(i2, j2):
             return False
         # No horizontal edges
         elif not self.has_edge(i1, i2) or not self.has_edge(j1, j2):
             return False
         # Horizontal colors don't match
-        elif self.edges[i1, i2]['color'] != self.edges[j1, j2]['color']:
+        elif self.edge_color(i1, i2) != self.edge_color(j1, j2):
             return False
         # Passed checks
         else:
@@ -266,16 +409,52 @@ class Taiko(nx.DiGraph):
         """
         return len(self.two_cell_list)
 
+    def num_horizontal_edges(self):
+        """
+        Returns the number of horizontal edges in the taiko.
+
+        :return: the number of horizontal edges in the taiko
+        """
+        # Every A-vertex is joined to every B-vertex by a vertical edge
+        return self.number_of_edges() - self.M * self.N
+
+    def canonical_form(self, swap=True, flip=True):
+        """
+        Returns a certificate of the taiko, equal for taikos that are the same up to relabelling the
+        A- and B-vertices and, optionally, exchanging the sides and reversing the orientation.
+
+        :param swap: whether exchanging the A- and B-sides is a symmetry
+        :param flip: whether reversing the orientation of all the 2-cells is a symmetry
+        :return: the certificate, as a tuple of 4-tuples
+        """
+        return canonical_form(self.two_cell_list, swap, flip)
+
+    def to_bytes(self):
+        """
+        Serializes the 2-cells of the taiko in the order they were added, see
+        taiko_storage.encode_cells.
+
+        :return: the serialized taiko
+        """
+        return encode_cells(self.two_cell_list)
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Creates a taiko from the output of to_bytes.
+
+        :param data: the serialized taiko
+        :return: the taiko
+        """
+        return cls(decode_cells(data))
+
     def pop_two_cell(self):
         """
         Removes the most recently added 2-cell from the taiko.
 
         :return: the most recently added 2-cell, as a 4-tuple of integers
         """
-        # TODO speed this up by storing the most recent deleted color/edge
-        output = self.two_cell_list.pop()
-        self.__init__(two_cell_list=self.two_cell_list)
-        return output
+        return self._undo_last_two_cell()
 
     def remove_two_cell(self, i1, j1, i2, j2):
         """
@@ -286,8 +465,12 @@ class Taiko(nx.DiGraph):
         :param i2: the second A-coordinate
         :param j2: the second B-coordinate
         """
-        self.two_cell_list.remove((i1, j1, i2, j2))
-        self.__init__(two_cell_list=self.two_cell_list)
+        # Undo back to the given 2-cell and replay the ones added after it
+        index = self.two_cell_list.index((i1, j1, i2, j2))
+        later_cells = [self._undo_last_two_cell() for _ in range(len(self.two_cell_list) - index - 1)]
+        self._undo_last_two_cell()
+        for cell in reversed(later_cells):
+            self.add_two_cell(*cell)
 
     def is_left_aligned(self, i1, j1, i2, j2):
         """
@@ -319,52 +502,69 @@ class Taiko(nx.DiGraph):
         """
         Returns true if the taiko satisfies the no-fold condition, false otherwise.
 
+        A fold is a vertex with two incoming or two outgoing horizontal edges of the same color.
+        These show up as repeated entries in the tails and heads of the color classes, which
+        add_two_cell counts as it goes.
+
         :return: true if the taiko satisfies the no-fold condition, false otherwise
         """
-        used_colors_in = set()
-        used_colors_out = set()
-
-        # Find folds in L_A
-        for i1 in range(1, self.M + 1):
-            used_colors_in.clear()
-            used_colors_out.clear()
-
-            # Check vertex i1 for folds
-            for u, v, data in self.in_edges(nbunch=i1, data=True):
-                color = data['color']
-                if u >= 1:
-                    if color in used_colors_in:
-                        return False
-                    used_colors_in.add(color)
-
-            for u, v, data in self.out_edges(nbunch=i1, data=True):
-                color = data['color']
-                if v >= 1:
-                    if color in used_colors_out:
-                        return False
-                    used_colors_out.add(color)
-
-        # Find folds in L_B
-        for j1 in range(-1, -(self.N + 1), -1):
-            used_colors_in.clear()
-            used_colors_out.clear()
-
-            # Check vertex j1 for folds
-            for u, v, data in self.in_edges(nbunch=j1, data=True):
-                color = data['color']
-                if u <= -1:
-                    if color in used_colors_in:
-                        return False
-                    used_colors_in.add(color)
-
-            for u, v, data in self.out_edges(nbunch=j1, data=True):
-                color = data['color']
-                if v <= -1:
-                    if color in used_colors_out:
-                        return False
-                    used_colors_out.add(color)
+        return self.folds == 0
 
-        return True
+    @staticmethod
+    def has_short_cycle_through(source_vertex, n, neighbors):
+        """
+        Returns true if the given vertex lies on a cycle of length less than n, false otherwise.
+
+        Only the ball of radius n // 2 around the vertex is searched.
+
+        :param source_vertex: the vertex
+        :param n: a positive integer >= 3
+        :param neighbors: a function returning the neighbors of a vertex in an undirected simple graph
+        :return: true if the vertex lies on a cycle of length less than n, false otherwise
+        """
+        # Breadth-first search remembering through which neighbor of the source each vertex
+        # was reached. An edge between two different branches closes a cycle through the
+        # source, and every vertex of a cycle shorter than n lies within distance n // 2.
+        depth = {source_vertex: 0}
+        branch = {source_vertex: None}
+        layer = [source_vertex]
+        while layer and depth[layer[0]] <= n // 2:
+            next_layer = []
+            for vertex in layer:
+                for neighbor in neighbors(vertex):
+                    if neighbor not in depth:
+                        depth[neighbor] = depth[vertex] + 1
+                        branch[neighbor] = neighbor if vertex == source_vertex else branch[vertex]
+                        next_layer.append(neighbor)
+                    elif neighbor != source_vertex and vertex != source_vertex \
+                            and branch[neighbor] != branch[vertex] and depth[vertex] + depth[neighbor] + 1 < n:
+                        return True
+            layer = next_layer
+        return False
+
+    @staticmethod
+    def has_short_cycle(nodes, n, neighbors):
+        """
+        Returns true if the given graph has a cycle of length less than n, false otherwise.
+
+        Sources are searched in turn, each one in the graph without the previous sources, so that
+        every cycle is only looked for from the first of its vertices to be searched.
+
+        :param nodes: the nodes of the graph
+        :param n: a positive integer >= 3
+        :param neighbors: a function returning the neighbors of a node in an undirected simple graph
+        :return: true if the graph has a cycle of length less than n, false otherwise
+        """
+        searched = set()
+
+        def remaining_neighbors(node):
+            return [neighbor for neighbor in neighbors(node) if neighbor not in searched]
+
+        for source_vertex in nodes:
+            if Taiko.has_short_cycle_through(source_vertex, n, remaining_neighbors):
+                return True
+            searched.add(source_vertex)
+        return False
 
     @staticmethod
     def girth_at_least_n(graph, n):
@@ -375,16 +575,37 @@ class Taiko(nx.DiGraph):
         :param n: a positive integer >= 3
         :return: true if the girth of the given graph is at least n, false otherwise
         """
-        for source_vertex in graph.nodes():
-            layers = nx.bfs_layers(graph, [source_vertex])
-            next(layers, None)  # Distance 0
-            next(layers, None)  # Distance 1
-            for depth in range(3, n):
-                # Distance depth-1 vertices
-                for vertex in next(layers, ()):
-                    if source_vertex in graph.neighbors(vertex):
-                        return False
-        return True
+        return not Taiko.has_short_cycle(graph.nodes(), n, graph.neighbors)
+
+    def link_girth_at_least_n(self, name, n):
+        """
+        Returns true if the girth of L_A, L_B or the middle link graph is at least n, false otherwise.
+
+        The graphs are searched in place through their neighbor functions, and the answers are
+        cached by version number, so that a graph is not searched again until it changes.
+
+        :param name: "A" for L_A, "B" for L_B or "middle" for the middle link graph
+        :param n: a positive integer >= 3
+        :return: true if the girth of the graph is at least n, false otherwise
+        """
+        key = (name, self.link_versions[name], n)
+        if key in self.girth_cache:
+            return self.girth_cache[key]
+
+        if name == "A":
+            nodes, neighbors = range(1, self.M + 1), self._link_neighbors
+        elif name == "B":
+            nodes, neighbors = range(-1, -self.N - 1, -1), self._link_neighbors
+        else:
+            color_nodes = [(color, side) for color in self.color_tails if self.colors.find(color) == color
+                           for side in ("in", "out")]
+            nodes, neighbors = itertools.chain(self.nodes(), color_nodes), self._middle_link_neighbors
+        result = not Taiko.has_short_cycle(nodes, n, neighbors)
+
+        if len(self.girth_cache) >= GIRTH_CACHE_SIZE:
+            self.girth_cache.clear()
+        self.girth_cache[key] = result
+        return result
 
     def is_girth_p_q(self, p, q):
         """
@@ -394,13 +615,107 @@ class Taiko(nx.DiGraph):
         :param q: a positive integer
         :return: true if the taiko satisfies the girth(p,q), false otherwise
         """
-        a_vertices = [i for i in range(1, self.M + 1)]
-        b_vertices = [j for j in range(-1, -self.N - 1, -1)]
+        return self.link_girth_at_least_n("A", p) and self.link_girth_at_least_n("B", p) and \
+            self.link_girth_at_least_n("middle", 2 * q)
+
+    def last_two_cell_is_valid(self, p, q):
+        """
+        Returns true if the taiko satisfies the no-fold and girth(p,q) conditions, assuming that it
+        satisfied them before the most recent call to add_two_cell.
+
+        Only cycles through the edges created by that 2-cell can be new, so it is enough to search
+        for short cycles around their endpoints and around the color nodes it merged.
+
+        :param p: a positive integer >= 3
+        :param q: a positive integer
+        :return: true if the taiko still satisfies no-fold and girth(p,q), false otherwise
+        """
+        if self.folds:
+            return False
+
+        link_vertices, middle_link_nodes = set(), set()
+        for record in self.undo_log[-1]:
+            if record[0] == "edge":
+                _, u, v, color = record
+                link_vertices.update((u, v))
+                middle_link_nodes.update((u, v))
+            elif record[0] == "merge":
+                middle_link_nodes.update(((record[1], "in"), (record[1], "out")))
+
+        for vertex in link_vertices:
+            if Taiko.has_short_cycle_through(vertex, p, self._link_neighbors):
+                return False
+        for node in middle_link_nodes:
+            if Taiko.has_short_cycle_through(node, 2 * q, self._middle_link_neighbors):
+                return False
+
+        # Link graphs that were known to satisfy girth(p,q) before the 2-cell still do
+        previous_versions = dict(self.link_versions)
+        for record in reversed(self.undo_log[-1]):
+            if record[0] == "version":
+                previous_versions[record[1]] = record[2]
+        for name, n in (("A", p), ("B", p), ("middle", 2 * q)):
+            if self.girth_cache.get((name, previous_versions[name], n)):
+                self.girth_cache[(name, self.link_versions[name], n)] = True
+        return True
+
+    def _link_neighbors(self, vertex):
+        """
+        Returns the neighbors of a vertex in L_A or L_B, the graph of horizontal edges on its side.
+
+        :param vertex: an A- or B-vertex
+        :return: the list of neighbors
+        """
+        return [u for u in self._pred[vertex] if u * vertex > 0] + [v for v in self._succ[vertex] if v * vertex > 0]
 
-        L_A = self.subgraph(a_vertices).to_undirected()
-        L_B = self.subgraph(b_vertices).to_undirected()
-        return Taiko.girth_at_least_n(L_A, p) and Taiko.girth_at_least_n(L_B, p) and Taiko.girth_at_least_n(
-            self.middle_link_graph, 2 * q)
+    def _middle_link_neighbors(self, node):
+        """
+        Returns the neighbors of a node of the middle link graph.
+
+        Unlike the nodes of middle_link_graph, vertices are denoted by themselves and the nodes of
+        a color class by the pairs (color, "in") and (color, "out").
+
+        :param node: a vertex or a pair (color, "in"/"out") for a representative color
+        :return: the list of neighbors
+        """
+        if isinstance(node, tuple):
+            color, side = node
+            return list((self.color_heads if side == "in" else self.color_tails)[color])
+        return [(self.colors.find(data['color']), "in") for u, data in self._pred[node].items() if u * node > 0] + \
+               [(self.colors.find(data['color']), "out") for v, data in self._succ[node].items() if v * node > 0]
+
+    @property
+    def middle_link_graph(self):
+        """
+        Returns the middle link graph L_1 of the taiko.
+
+        Its nodes are the vertices of the taiko and an "in" and an "out" node for every color class.
+        A vertex is joined to the "out" node of the class of each horizontal edge leaving it and to
+        the "in" node of the class of each horizontal edge entering it. Vertices are denoted by
+        strings, e.g. "3" and "-2", and color nodes by strings like "5_in" and "5_out".
+
+        :return: the middle link graph, as a new networkx Graph
+        """
+        middle_link_graph = nx.Graph()
+        middle_link_graph.add_nodes_from(str(vertex) for vertex in self.nodes())
+        for color, tails in self.color_tails.items():
+            if self.colors.find(color) == color:
+                middle_link_graph.add_nodes_from([str(color) + "_in", str(color) + "_out"])
+                middle_link_graph.add_edges_from((str(u), str(color) + "_out") for u in tails)
+                middle_link_graph.add_edges_from((str(v), str(color) + "_in") for v in self.color_heads[color])
+        return middle_link_graph
+
+    def to_networkx(self):
+        """
+        Returns a copy of the taiko as a plain networkx DiGraph whose edges carry their current color.
+
+        :return: the DiGraph, with B-vertices denoted with negative integers
+        """
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.nodes())
+        graph.add_edges_from((u, v, {'color': self.colors.find(color)}) for u, v, color in self.edges.data('color'))
+        graph.next_color = self.next_color
+        return graph
 
     def layout(self):
         """
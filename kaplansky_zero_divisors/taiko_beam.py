@@ -0,0 +1,308 @@
+import heapq
+import random
+import sys
+import time
+from taiko import Taiko
+from taiko_dfs import state_key
+
+
+def valid_cells(taiko, max_M, max_N, p, q):
+    """
+    Returns the 2-cells that can be added to the taiko while keeping no-fold and girth(p,q).
+
+    :param taiko: the taiko, left as it was
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param p: the girth bound for L_A and L_B
+    :param q: the girth bound for the middle link graph is 2q
+    :return: the list of 2-cells, in the order of Taiko.candidate_cells
+    """
+    valid = []
+    for cell in taiko.candidate_cells(max_M, max_N):
+        taiko.add_two_cell(*cell)
+        if taiko.last_two_cell_is_valid(p, q):
+            valid.append(cell)
+        taiko.pop_two_cell()
+    return valid
+
+
+def grow_randomly(taiko, max_M, max_N, p, q, generator, num_two_cells=None, deadline=None):
+    """
+    Adds 2-cells drawn uniformly among the valid ones to the taiko, until it has num_two_cells
+    2-cells, no valid 2-cell is left or the deadline has passed.
+
+    :param taiko: the taiko to grow
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param p: the girth bound for L_A and L_B
+    :param q: the girth bound for the middle link graph is 2q
+    :param generator: the random.Random drawing the 2-cells
+    :param num_two_cells: the number of 2-cells to stop at, None to add as many as possible
+    :param deadline: the time.monotonic() value to stop at, None for no deadline
+    :return: true if the taiko is maximal, false if the growth stopped before it was known to be
+    """
+    while num_two_cells is None or taiko.num_two_cells() < num_two_cells:
+        if deadline is not None and time.monotonic() > deadline:
+            return False
+        valid = valid_cells(taiko, max_M, max_N, p, q)
+        if not valid:
+            return True
+        taiko.add_two_cell(*generator.choice(valid))
+    return False
+
+
+def is_maximal(taiko, max_M, max_N, p, q):
+    """
+    Returns true if no 2-cell can be added to the taiko while keeping no-fold and girth(p,q).
+
+    :param taiko: the taiko, left as it was
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param p: the girth bound for L_A and L_B
+    :param q: the girth bound for the middle link graph is 2q
+    :return: true if the taiko is maximal, false otherwise
+    """
+    for cell in taiko.candidate_cells(max_M, max_N):
+        taiko.add_two_cell(*cell)
+        valid = taiko.last_two_cell_is_valid(p, q)
+        taiko.pop_two_cell()
+        if valid:
+            return False
+    return True
+
+
+def _num_color_classes(taiko):
+    """
+    Returns the number of color classes of the horizontal edges of the taiko.
+    """
+    return sum(1 for color in range(1, len(taiko.colors)) if taiko.colors.find(color) == color)
+
+
+def shared_edges(taiko, max_M, max_N, p, q):
+    """
+    Scores a taiko by how much its 2-cells share horizontal edges, preferring the taikos with the
+    fewest horizontal edges and then the fewest color classes.
+
+    Every 2-cell colors two new vertical edges, so taikos with as many 2-cells only differ in their
+    horizontal edges. 2-cells glued along existing horizontal edges keep the link graphs sparse,
+    which leaves room for more 2-cells under girth(p,q). taiko_example_1 has 31 2-cells on 27
+    horizontal edges of 6 colors.
+
+    :return: the pair (-number of horizontal edges, -number of color classes)
+    """
+    return -taiko.num_horizontal_edges(), -_num_color_classes(taiko)
+
+
+def color_classes(taiko, max_M, max_N, p, q):
+    """
+    Scores a taiko by its number of color classes, preferring the taikos with the fewest.
+
+    :return: -number of color classes
+    """
+    return -_num_color_classes(taiko)
+
+
+def extension_count(taiko, max_M, max_N, p, q):
+    """
+    Scores a taiko by the number of 2-cells that can still be added to it, a one-step lookahead that
+    is much slower than the other scores.
+
+    :return: the number of valid extensions
+    """
+    return len(valid_cells(taiko, max_M, max_N, p, q))
+
+
+SCORES = {"shared-edges": shared_edges, "colors": color_classes, "extensions": extension_count}
+
+
+class BestTaikos:
+    """
+    The largest taikos found so far by an anytime search, one per state key.
+
+    Taikos are ranked by their number of 2-cells, and maximal taikos, those to which no 2-cell can
+    be added, before the others with as many 2-cells. Every taiko that enters the list is passed to
+    the report callback as it is found.
+    """
+
+    def __init__(self, max_M, max_N, keep=10, canonical=True, report=None):
+        """
+        :param max_M: the maximum number of A-vertices
+        :param max_N: the maximum number of B-vertices
+        :param keep: the number of taikos to keep
+        :param canonical: whether isomorphic taikos are kept once, see taiko_dfs.state_key
+        :param report: a function called as report(elapsed, cells, maximal) for every taiko that
+                       enters the list, None for no reports
+        """
+        self.max_M, self.max_N = max_M, max_N
+        self.keep = keep
+        self.canonical = canonical
+        self.report = report
+        self.start = time.monotonic()
+        self.heap = []  # Entries (num_cells, maximal, counter, key, cells), the worst one first
+        self.keys = set()
+        self.counter = 0
+
+    def offer(self, cells, maximal):
+        """
+        Adds a taiko to the list if it is among the largest ones found so far.
+
+        :param cells: the 2-cells of the taiko
+        :param maximal: whether no 2-cell can be added to the taiko
+        :return: true if the taiko entered the list, false otherwise
+        """
+        rank = (len(cells), maximal)
+        if len(self.heap) == self.keep and rank <= self.heap[0][:2]:
+            return False
+        key = state_key(frozenset(cells), self.max_M, self.max_N, self.canonical)
+        if key in self.keys:
+            return False
+        self.keys.add(key)
+        # Earlier taikos go first among taikos of the same rank, so they are dropped last
+        self.counter -= 1
+        entry = (len(cells), maximal, self.counter, key, tuple(cells))
+        if len(self.heap) < self.keep:
+            heapq.heappush(self.heap, entry)
+        else:
+            self.keys.discard(heapq.heappushpop(self.heap, entry)[3])
+        if self.report is not None:
+            self.report(time.monotonic() - self.start, tuple(cells), maximal)
+        return True
+
+    def best(self):
+        """
+        Returns the taikos in the list, the largest first.
+
+        :return: the list of pairs (cells, maximal)
+        """
+        return [(cells, maximal) for _, maximal, _, _, cells in sorted(self.heap, reverse=True)]
+
+
+def beam_search(max_M, max_N, p=4, q=4, width=16, score=shared_edges, time_budget=None, seed=None,
+                canonical=True, best=None, taiko_class=Taiko):
+    """
+    Beam search for large taikos satisfying no-fold and girth(p,q).
+
+    Taikos are grown one 2-cell at a time. At every step all the valid extensions of the taikos of
+    the beam are scored and the width best ones, one per state key, form the next beam, ties being
+    broken at random. Only the best children get a state key, see _select. Taikos without extensions
+    are maximal and offered to best. When the time budget runs out, the taikos of the current beam
+    are offered as well, after checking whether they are maximal.
+
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param p: the girth bound for L_A and L_B
+    :param q: the girth bound for the middle link graph is 2q
+    :param width: the number of taikos kept at every step
+    :param score: a function score(taiko, max_M, max_N, p, q) returning a number or a tuple, larger
+                  for better taikos, see SCORES
+    :param time_budget: the number of seconds after which the search stops, None for no limit
+    :param seed: the seed of the random generator breaking ties
+    :param canonical: whether to keep one taiko per isomorphism class, see taiko_dfs.state_key
+    :param best: the BestTaikos to offer the taikos to, None for a new one keeping 10 taikos
+    :param taiko_class: the class checking the extensions, Taiko or CompactTaiko, see taiko_dfs.ENGINES
+    :return: the BestTaikos
+    """
+    if best is None:
+        best = BestTaikos(max_M, max_N, canonical=canonical)
+    generator = random.Random(seed)
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    beam = [()]
+    while beam:
+        children = {}
+        for cells in beam:
+            if deadline is not None and time.monotonic() > deadline:
+                for state in beam:
+                    best.offer(state, is_maximal(taiko_class(list(state)), max_M, max_N, p, q))
+                return best
+            taiko = taiko_class(list(cells))
+            extended = False
+            for cell in valid_cells(taiko, max_M, max_N, p, q):
+                extended = True
+                child = cells + (cell,)
+                # Children reached from two taikos of the beam are only scored once
+                state = frozenset(child)
+                if state in children:
+                    continue
+                taiko.add_two_cell(*cell)
+                children[state] = (score(taiko, max_M, max_N, p, q), generator.random(), child)
+                taiko.pop_two_cell()
+            if not extended:
+                best.offer(cells, True)
+        beam = _select(children, width, max_M, max_N, canonical)
+    return best
+
+
+def _select(children, width, max_M, max_N, canonical):
+    """
+    Returns the width best scored children, one per state key.
+
+    State keys are computed in the order of the scores and only until the beam is full, as
+    canonical forms cost much more than scoring.
+
+    :param children: a dictionary from frozensets of 2-cells to triples (score, tie breaker, cells)
+    :param width: the number of children to keep
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param canonical: whether to keep one child per isomorphism class, see taiko_dfs.state_key
+    :return: the list of the 2-cells of the children, in the order they were added
+    """
+    ranked = sorted(children.items(), key=lambda item: item[1], reverse=True)
+    if not canonical:
+        return [child for _, (_, _, child) in ranked[:width]]
+    beam, keys = [], set()
+    for state, (_, _, child) in ranked:
+        key = state_key(state, max_M, max_N, canonical)
+        if key not in keys:
+            keys.add(key)
+            beam.append(child)
+            if len(beam) == width:
+                break
+    return beam
+
+
+def random_restarts(max_M, max_N, p=4, q=4, restarts=None, time_budget=None, seed=None, canonical=True,
+                    best=None, taiko_class=Taiko):
+    """
+    Randomized search for large taikos satisfying no-fold and girth(p,q).
+
+    Every restart grows a taiko from scratch with grow_randomly until it is maximal, and offers it
+    to best. When the time budget runs out, the taiko being grown is offered as well. One of
+    restarts and time_budget must be given.
+
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param p: the girth bound for L_A and L_B
+    :param q: the girth bound for the middle link graph is 2q
+    :param restarts: the number of restarts, None for no limit if there is a time budget
+    :param time_budget: the number of seconds after which the search stops, None for no limit if
+                        the number of restarts is bounded
+    :param seed: the seed of the random generator, the search is reproducible when restarts bounds it
+    :param canonical: whether to keep one taiko per isomorphism class, see taiko_dfs.state_key
+    :param best: the BestTaikos to offer the taikos to, None for a new one keeping 10 taikos
+    :param taiko_class: the class the taikos are grown in, Taiko or CompactTaiko, see taiko_dfs.ENGINES
+    :return: the BestTaikos
+    """
+    if restarts is None and time_budget is None:
+        raise ValueError("random restarts need a number of restarts or a time budget")
+    if best is None:
+        best = BestTaikos(max_M, max_N, canonical=canonical)
+    generator = random.Random(seed)
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+    restart = 0
+    while restarts is None or restart < restarts:
+        taiko = taiko_class()
+        if not grow_randomly(taiko, max_M, max_N, p, q, generator, deadline=deadline):
+            best.offer(taiko.two_cell_list, is_maximal(taiko, max_M, max_N, p, q))
+            return best
+        best.offer(taiko.two_cell_list, True)
+        restart += 1
+    return best
+
+
+def print_report(elapsed, cells, maximal, stream=sys.stdout):
+    """
+    Writes a taiko found by an anytime search, the report callback of BestTaikos used by taiko_dfs.main.
+    """
+    stream.write("{:.1f}s {} cells{}: {}\n".format(elapsed, len(cells), " (maximal)" if maximal else "",
+                                                   list(cells)))
+    stream.flush()
@@ -1,37 +1,285 @@
+import argparse
+import time
 from collections import deque
-from itertools import permutations
 import networkx as nx
+from canonical_form import canonical_form
+from compact_taiko import CompactTaiko
+from search_metrics import NullMetrics, SearchMetrics
 from taiko import *
+from taiko_storage import LeafWriter, load_checkpoint, save_checkpoint
+from visited_store import BloomStore, HashSetStore, KeySetStore, SqliteStore
 
+ENGINES = {"taiko": Taiko, "compact": CompactTaiko}  # Taiko classes the searches can use, see --engine
 
-def main():
+
+def state_key(state, max_M, max_N, canonical):
+    """
+    Returns the key under which a search state is recorded as explored.
+
+    With canonical keys, taikos that differ by relabelling vertices or reversing the orientation
+    are explored once, and so are taikos that differ by exchanging the sides when max_M == max_N.
+    The left-alignment of the candidate 2-cells already fixes the order in which new vertices
+    appear, so isomorphic states have isomorphic extensions and pruning them loses no leaves up
+    to isomorphism.
+
+    :param state: a frozenset of 2-cells
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param canonical: whether to identify isomorphic states
+    :return: the key
+    """
+    if canonical:
+        return canonical_form(state, swap=max_M == max_N)
+    return state
+
+
+def extensions(current, max_M, max_N, p, q, metrics=None, taiko_class=Taiko):
+    """
+    Returns the taikos obtained by adding one 2-cell to the given one that keep no-fold and girth(p,q).
+
+    :param current: a frozenset of 2-cells
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param p: the girth bound for L_A and L_B
+    :param q: the girth bound for the middle link graph is 2q
+    :param metrics: a search_metrics.SearchMetrics recording the expansion, None for no metrics
+    :param taiko_class: the class checking the extensions, Taiko or CompactTaiko, see ENGINES
+    :return: the list of extensions, as frozensets of 2-cells
+    """
+    if metrics is not None and metrics.enabled:
+        return _instrumented_extensions(current, max_M, max_N, p, q, metrics, taiko_class)
+    neighbors = []
+    current_two_cell_list = list(current)
+    current_taiko = taiko_class(current_two_cell_list)
+    for i1, j1, i2, j2 in current_taiko.candidate_cells(max_M, max_N):
+        current_taiko.add_two_cell(i1, j1, i2, j2)
+        if current_taiko.last_two_cell_is_valid(p, q):
+            neighbor = current.union(frozenset(((i1, j1, i2, j2),)))
+            neighbors.append(neighbor)
+        current_taiko.pop_two_cell()
+    return neighbors
+
+
+def _instrumented_extensions(current, max_M, max_N, p, q, metrics, taiko_class):
+    """
+    Computes extensions, recording which check rejects each candidate and the time of each step.
+    """
+    neighbors = []
+    current_taiko = taiko_class(list(current))
+    m, n = current_taiko.M, current_taiko.N
+    num_candidates = 0
+    step_time = metrics.step_time
+    for cell in current_taiko.candidate_cells(max_M, max_N):
+        num_candidates += 1
+        start = time.perf_counter()
+        current_taiko.add_two_cell(*cell)
+        added = time.perf_counter()
+        step_time["add_two_cell"] += added - start
+        no_fold = current_taiko.no_fold()
+        checked_fold = time.perf_counter()
+        step_time["no_fold"] += checked_fold - added
+        if not no_fold:
+            metrics.rejected["no_fold"] += 1
+            checked = checked_fold
+        else:
+            valid = current_taiko.last_two_cell_is_valid(p, q)
+            checked = time.perf_counter()
+            step_time["girth"] += checked - checked_fold
+            if valid:
+                neighbors.append(current.union(frozenset((cell,))))
+            else:
+                metrics.rejected["girth"] += 1
+        current_taiko.pop_two_cell()
+        step_time["pop_two_cell"] += time.perf_counter() - checked
+    # candidate_cells filters the cells of permutations(range(1, M + 3), 2) x permutations(range(1, N + 3), 2)
+    metrics.state(len(current), len(neighbors), num_candidates, (m + 2) * (m + 1) * (n + 2) * (n + 1))
+    return neighbors
+
+
+def search(max_M=4, max_N=4, p=4, q=4, canonical=True, leaf_path=None, checkpoint_path=None,
+           checkpoint_interval=600, resume=False, explored=None, metrics=None, taiko_class=Taiko):
+    """
+    Depth-first search for maximal taikos satisfying no-fold and girth(p,q).
+
+    Leaves are either collected in a list or, for long searches, appended to a leaf file as they
+    are found (see taiko_storage.LeafWriter). With a checkpoint path, the stack and the explored
+    states are saved every checkpoint_interval seconds and when the search ends, and a search
+    started with resume=True continues from the saved checkpoint. Leaves found before the
+    checkpoint are only kept if they went to a leaf file.
+
+    The explored states are kept in a visited_store.VisitedStore, by default an exact KeySetStore.
+    The other stores use less memory per state, see visited_store.
+
+    Progress and statistics of the search are recorded by metrics, see search_metrics.
+
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param p: the girth bound for L_A and L_B
+    :param q: the girth bound for the middle link graph is 2q
+    :param canonical: whether to explore one taiko per isomorphism class, see state_key
+    :param leaf_path: the leaf file to append the leaves to, None to return them as a list
+    :param checkpoint_path: the checkpoint file, None for no checkpoints
+    :param checkpoint_interval: the number of seconds between checkpoints
+    :param resume: whether to continue from the checkpoint
+    :param explored: the store for the explored states, None for a new KeySetStore. When resuming,
+                     it is restored from the checkpoint with VisitedStore.restore
+    :param metrics: a search_metrics.SearchMetrics, None for no metrics
+    :param taiko_class: the class checking the extensions, Taiko or CompactTaiko, see ENGINES
+    :return: the list of leaves, as frozensets of 2-cells, or the number of leaves written to the
+             leaf file in this run
+    """
+    parameters = (max_M, max_N, p, q, int(canonical))
     stack = deque()
-    stack.append(frozenset())
-    explored = set()
-    leaves = []
-    max_M = 4
-    max_N = 4
+    if explored is None:
+        explored = KeySetStore()
+    if metrics is None:
+        metrics = NullMetrics()
+    leaf_file_length = None
+    if resume:
+        saved_parameters, saved_stack, (kind, data), leaf_file_length = load_checkpoint(checkpoint_path)
+        if saved_parameters != parameters:
+            raise ValueError("checkpoint was saved with parameters " + str(saved_parameters))
+        if kind != explored.kind:
+            raise ValueError("checkpoint was saved with a " + kind + " store")
+        # A leaf file starts with its magic number, so a length of 0 means that there was none
+        if leaf_path is not None and leaf_file_length == 0:
+            raise ValueError("checkpoint was saved without a leaf file")
+        stack.extend(frozenset(state) for state in saved_stack)
+        explored = explored.restore(data)
+    else:
+        stack.append(frozenset())
+
+    leaves = [] if leaf_path is None else LeafWriter(leaf_path, truncate_to=leaf_file_length)
+    leaf_sink = leaves.append if leaf_path is None else leaves.write
+    last_checkpoint = time.monotonic()
 
     while stack:
         current = stack.pop()
-        if current not in explored:
-            explored.add(current)
-            current_two_cell_list = list(current)
-            current_taiko = Taiko(current_two_cell_list)
-            m = current_taiko.M
-            n = current_taiko.N
-            can_taiko_be_extended = False
-            for i1, i2 in permutations(range(1, m + 3), 2):
-                for j1, j2 in permutations(range(1, n + 3), 2):
-                    if current_taiko.can_add_two_cell(i1, j1, i2, j2, max_M, max_N):
-                        current_taiko.add_two_cell(i1, j1, i2, j2)
-                        if current_taiko.no_fold() and current_taiko.is_girth_p_q(4, 4):
-                            can_taiko_be_extended = True
-                            neighbor = current.union(frozenset(((i1, j1, i2, j2),)))
-                            stack.append(neighbor)
-                        current_taiko.remove_two_cell(i1, j1, i2, j2)
-            if not can_taiko_be_extended:
-                leaves.append(current)
+        if explored.add(state_key(current, max_M, max_N, canonical)):
+            profiling = metrics.start_profile()
+            neighbors = extensions(current, max_M, max_N, p, q, metrics, taiko_class)
+            if profiling:
+                metrics.stop_profile()
+            stack.extend(neighbors)
+            if not neighbors:
+                leaf_sink(current)
+                metrics.leaf()
+        else:
+            metrics.revisit()
+        metrics.maybe_report(explored)
+
+        if checkpoint_path is not None and time.monotonic() - last_checkpoint > checkpoint_interval:
+            save_checkpoint(checkpoint_path, parameters, stack, explored, leaves.tell() if leaf_path else 0)
+            last_checkpoint = time.monotonic()
+
+    if checkpoint_path is not None:
+        save_checkpoint(checkpoint_path, parameters, stack, explored, leaves.tell() if leaf_path else 0)
+    metrics.finish(explored)
+    explored.close()
+    if leaf_path is None:
+        return leaves
+    leaves.close()
+    return leaves.count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search for maximal taikos satisfying no-fold and girth(p,q).")
+    parser.add_argument("--max-M", type=int, default=4, help="maximum number of A-vertices")
+    parser.add_argument("--max-N", type=int, default=4, help="maximum number of B-vertices")
+    parser.add_argument("-p", type=int, default=4, help="girth bound for L_A and L_B")
+    parser.add_argument("-q", type=int, default=4, help="the middle link graph has girth at least 2q")
+    parser.add_argument("--no-canonical", dest="canonical", action="store_false",
+                        help="explore every labelled taiko instead of one per isomorphism class")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="taiko",
+                        help="taiko class checking the extensions, compact stores the taikos in arrays")
+    parser.add_argument("--strategy", choices=["dfs", "beam", "random"], default="dfs",
+                        help="exhaustive depth-first search, or an anytime beam search or randomized restarts "
+                             "reporting the largest taikos as they are found, see taiko_beam")
+    parser.add_argument("--beam-width", type=int, default=16, help="number of taikos kept by --strategy beam")
+    parser.add_argument("--score", choices=["shared-edges", "colors", "extensions"], default="shared-edges",
+                        help="heuristic ranking the taikos of --strategy beam")
+    parser.add_argument("--restarts", type=int,
+                        help="number of restarts of --strategy random, default no limit with --time-budget")
+    parser.add_argument("--seed", type=int, help="seed of --strategy beam and random")
+    parser.add_argument("--time-budget", type=float, metavar="SECONDS",
+                        help="stop --strategy beam and random after SECONDS seconds")
+    parser.add_argument("--keep", type=int, default=10, help="number of taikos kept by --strategy beam and random")
+    parser.add_argument("--workers", type=int, default=1, help="number of worker processes")
+    parser.add_argument("--split-depth", type=int, default=2,
+                        help="number of 2-cells at which subtrees are handed to the workers")
+    parser.add_argument("--leaves", help="append the leaves to this file as they are found")
+    parser.add_argument("--checkpoint", help="save the search state to this file periodically")
+    parser.add_argument("--checkpoint-interval", type=float, default=600, help="seconds between checkpoints")
+    parser.add_argument("--resume", action="store_true", help="continue the search saved in --checkpoint")
+    parser.add_argument("--visited", choices=["set", "hash", "sqlite", "bloom"], default="set",
+                        help="store for the explored states: exact states, 64/128-bit hashes, hashes in an "
+                             "SQLite database, or a Bloom filter")
+    parser.add_argument("--hash-bits", type=int, choices=[64, 128], default=64, help="hash size of --visited hash")
+    parser.add_argument("--visited-path", default="visited.sqlite", help="database of --visited sqlite")
+    parser.add_argument("--cache-size", type=int, default=1 << 20, help="LRU cache size of --visited sqlite")
+    parser.add_argument("--expected-states", type=float, default=1e6,
+                        help="capacity of the first filter of --visited bloom, which grows as needed")
+    parser.add_argument("--false-positive-rate", type=float, default=1e-6,
+                        help="bound on the false positive rate of --visited bloom")
+    parser.add_argument("--progress", type=float, default=0, metavar="SECONDS",
+                        help="print a progress line every SECONDS seconds")
+    parser.add_argument("--metrics", help="save search metrics to this JSON file, or CSV file if it ends in .csv")
+    parser.add_argument("--profile-every", type=int, default=0, metavar="N",
+                        help="profile one state expansion out of N and print the hottest functions")
+    parser.add_argument("--profile-output", help="dump the sampled profile to this file in pstats format")
+    args = parser.parse_args()
+    if args.strategy == "random" and args.restarts is None and args.time_budget is None:
+        parser.error("--strategy random needs --restarts or --time-budget")
+    taiko_class = ENGINES[args.engine]
+    if args.strategy != "dfs":
+        import taiko_beam
+        best = taiko_beam.BestTaikos(args.max_M, args.max_N, args.keep, args.canonical, taiko_beam.print_report)
+        if args.strategy == "beam":
+            taiko_beam.beam_search(args.max_M, args.max_N, args.p, args.q, args.beam_width,
+                                   taiko_beam.SCORES[args.score], args.time_budget, args.seed, args.canonical, best,
+                                   taiko_class)
+        else:
+            taiko_beam.random_restarts(args.max_M, args.max_N, args.p, args.q, args.restarts, args.time_budget,
+                                       args.seed, args.canonical, best, taiko_class)
+        for cells, maximal in best.best():
+            print(len(cells), "cells (maximal):" if maximal else "cells:", list(cells))
+        return
+    if args.resume and args.checkpoint is None:
+        parser.error("--resume needs --checkpoint")
+    if args.workers > 1 and (args.leaves or args.checkpoint):
+        parser.error("--leaves and --checkpoint are only supported by the serial search")
+    if args.workers > 1 and (args.progress or args.metrics or args.profile_every):
+        parser.error("--progress, --metrics and --profile-every are only supported by the serial search")
+    if args.workers > 1 and args.visited != "set":
+        parser.error("--visited is only supported by the serial search")
+
+    # Arguments are all checked before opening a store, which may clear an existing database
+    metrics = None
+    if args.progress or args.metrics or args.profile_every:
+        metrics = SearchMetrics(args.progress, args.metrics, args.profile_every, args.profile_output)
+    if args.visited == "hash":
+        explored = HashSetStore(args.hash_bits)
+    elif args.visited == "sqlite":
+        explored = SqliteStore(args.visited_path, args.cache_size, clear=not args.resume)
+    elif args.visited == "bloom":
+        explored = BloomStore(int(args.expected_states), args.false_positive_rate)
+    else:
+        explored = KeySetStore()
+
+    if args.workers > 1:
+        from parallel_dfs import parallel_search
+        leaves, statistics = parallel_search(args.max_M, args.max_N, args.p, args.q, args.canonical,
+                                             args.workers, args.split_depth, taiko_class=taiko_class)
+        print(statistics["explored"], "states explored,", statistics["stolen"], "stolen")
+        print(len(leaves), "leaves")
+    elif args.leaves:
+        count = search(args.max_M, args.max_N, args.p, args.q, args.canonical, args.leaves, args.checkpoint,
+                       args.checkpoint_interval, args.resume, explored, metrics, taiko_class)
+        print(count, "leaves written to", args.leaves)
+    else:
+        leaves = search(args.max_M, args.max_N, args.p, args.q, args.canonical, None, args.checkpoint,
+                        args.checkpoint_interval, args.resume, explored, metrics, taiko_class)
+        print(len(leaves), "leaves")
 
 
 if __name__ == '__main__':
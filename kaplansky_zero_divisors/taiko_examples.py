@@ -0,0 +1,38 @@
+import random
+from taiko import *
+from taiko_beam import grow_randomly
+
+# Examples from Section 2 of https://mineyev.web.illinois.edu/art/top-geom-uzd-origami.pdf
+taiko_example_1 = [(4, 8, 5, 5), (6, 4, 7, 3), (1, 1, 2, 9), (6, 5, 7, 4),
+                   (1, 2, 2, 1), (5, 6, 7, 5), (1, 3, 3, 1), (4, 9, 5, 8),
+                   (6, 7, 7, 6), (1, 4, 2, 3), (3, 2, 4, 1), (6, 8, 7, 7),
+                   (1, 5, 2, 4), (4, 2, 7, 8), (1, 6, 3, 4), (4, 3, 5, 9),
+                   (1, 7, 2, 6), (3, 5, 4, 4), (5, 1, 6, 9), (1, 8, 2, 7),
+                   (4, 5, 5, 2), (6, 1, 7, 9), (2, 2, 3, 9), (5, 7, 6, 6),
+                   (2, 5, 3, 3), (2, 8, 3, 6), (6, 2, 7, 1), (3, 7, 4, 6),
+                   (5, 3, 7, 2), (3, 8, 4, 7), (5, 4, 6, 3)]
+taiko_example_2 = [(1, 1, 2, 2), (1, 2, 2, 3), (2, 1, 3, 3), (4, 1, 1, 3),
+                   (3, 1, 5, 4), (3, 2, 4, 4), (1, 4, 6, 5), (2, 4, 7, 3),
+                   (3, 4, 6, 3), (3, 5, 4, 2), (4, 3, 7, 5), (5, 1, 1, 5),
+                   (5, 2, 7, 4), (5, 3, 8, 5), (8, 1, 2, 5), (8, 4, 4, 5),
+                   (5, 5, 7, 2), (6, 1, 8, 2), (6, 2, 8, 3), (7, 1, 6, 4)]
+
+
+def random_taiko(max_M, max_N, p=4, q=4, num_two_cells=None, seed=None):
+    """
+    Generates a random taiko satisfying no-fold and girth(p,q).
+
+    2-cells are drawn uniformly among the candidates that keep the taiko valid, until the taiko has
+    num_two_cells 2-cells or no such candidate is left, see taiko_beam.grow_randomly.
+
+    :param max_M: the maximum number of A-vertices
+    :param max_N: the maximum number of B-vertices
+    :param p: the girth bound for L_A and L_B
+    :param q: the girth bound for the middle link graph is 2q
+    :param num_two_cells: the number of 2-cells to add, None to add as many as possible
+    :param seed: the seed of the random generator
+    :return: the list of 2-cells, in the order they were added
+    """
+    taiko = Taiko()
+    grow_randomly(taiko, max_M, max_N, p, q, random.Random(seed), num_two_cells)
+    return list(taiko.two_cell_list)
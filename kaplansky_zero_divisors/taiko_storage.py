@@ -0,0 +1,364 @@
+import mmap
+import os
+import struct
+from array import array
+from itertools import chain
+import numpy as np
+
+LEAF_FILE_MAGIC = b"TKLF"
+CHECKPOINT_MAGIC = b"TKCP"
+CHECKPOINT_VERSION = 2
+ARCHIVE_MAGIC = b"TKAR"
+ARCHIVE_VERSION = 1
+ARCHIVE_HEADER = "<4sHHQQ"  # magic, version, bytes per coordinate, number of taikos, offsets position
+
+
+def pack_cells(two_cell_list):
+    """
+    Packs 2-cells into bytes, four unsigned bytes per cell in the given order.
+
+    :param two_cell_list: an iterable of 4-tuples of integers between 1 and 255
+    :return: the packed cells
+    """
+    return array('B', chain.from_iterable(two_cell_list)).tobytes()
+
+
+def unpack_cells(data):
+    """
+    Inverse of pack_cells.
+
+    :param data: packed cells
+    :return: the list of 4-tuples
+    """
+    values = array('B', data)
+    return [tuple(values[k:k + 4]) for k in range(0, len(values), 4)]
+
+
+def encode_cells(two_cell_list):
+    """
+    Encodes 2-cells as a byte giving the size of the coordinates, 1 or 2 bytes, followed by
+    the cells in the given order as unsigned little-endian integers of that size.
+
+    :param two_cell_list: an iterable of 4-tuples of integers between 1 and 65535
+    :return: the encoded cells
+    """
+    cells = np.array(list(two_cell_list), dtype=np.int64).reshape(-1, 4)
+    size = 1 if cells.size == 0 or cells.max() < 256 else 2
+    if cells.size and (cells.min() < 1 or cells.max() >= 1 << 16):
+        raise ValueError("2-cell coordinates must be between 1 and 65535")
+    return bytes((size,)) + cells.astype("<u" + str(size)).tobytes()
+
+
+def decode_cells(data):
+    """
+    Inverse of encode_cells.
+
+    :param data: encoded cells
+    :return: the list of 4-tuples
+    """
+    cells = np.frombuffer(data, dtype="<u" + str(data[0]), offset=1).reshape(-1, 4)
+    return [tuple(cell) for cell in cells.tolist()]
+
+
+def _write_record(file, two_cell_list):
+    """
+    Writes the number of cells as an unsigned 16-bit integer followed by the packed cells.
+    """
+    two_cell_list = sorted(two_cell_list)
+    file.write(struct.pack("<H", len(two_cell_list)))
+    file.write(pack_cells(two_cell_list))
+
+
+def _read_record(file):
+    """
+    Reads a record written by _write_record.
+
+    :return: the list of 4-tuples, or None at the end of the file
+    """
+    header = file.read(2)
+    if len(header) < 2:
+        return None
+    (count,) = struct.unpack("<H", header)
+    data = file.read(4 * count)
+    if len(data) < 4 * count:
+        return None
+    return unpack_cells(data)
+
+
+class LeafWriter:
+    """
+    Append-only file of leaves, each stored as a sorted list of packed 2-cells.
+
+    Leaves are written as soon as they are found. A new search starts the file afresh, and a
+    search resumed from a checkpoint first truncates it to the length recorded in the checkpoint.
+    """
+
+    def __init__(self, path, truncate_to=None):
+        """
+        Opens a leaf file for appending, creating it if needed.
+
+        :param path: the path of the file
+        :param truncate_to: the length to truncate an existing file to, None to drop all its leaves
+        """
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        self.file = open(path, "r+b" if exists else "wb")
+        if exists:
+            if self.file.read(len(LEAF_FILE_MAGIC)) != LEAF_FILE_MAGIC:
+                raise ValueError(path + " is not a leaf file")
+            self.file.truncate(max(truncate_to or 0, len(LEAF_FILE_MAGIC)))
+            self.file.seek(0, os.SEEK_END)
+        else:
+            self.file.write(LEAF_FILE_MAGIC)
+        self.count = 0
+
+    def write(self, leaf):
+        """
+        Appends a leaf to the file.
+
+        :param leaf: an iterable of 2-cells
+        """
+        _write_record(self.file, leaf)
+        self.count += 1
+
+    def tell(self):
+        """
+        Flushes the file and returns its length.
+
+        :return: the length of the file in bytes
+        """
+        self.file.flush()
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def read_leaves(path):
+    """
+    Iterates over the leaves of a leaf file written by LeafWriter.
+
+    :param path: the path of the file
+    :return: a generator of lists of 4-tuples
+    """
+    with open(path, "rb") as file:
+        if file.read(len(LEAF_FILE_MAGIC)) != LEAF_FILE_MAGIC:
+            raise ValueError(path + " is not a leaf file")
+        while True:
+            leaf = _read_record(file)
+            if leaf is None:
+                return
+            yield leaf
+
+
+def save_checkpoint(path, parameters, stack, explored, leaf_file_length):
+    """
+    Saves the state of a search to a binary checkpoint file.
+
+    The file is first written next to its destination and then renamed over it, so that a crash
+    while saving leaves the previous checkpoint intact.
+
+    :param path: the path of the checkpoint
+    :param parameters: the search parameters (max_M, max_N, p, q, canonical), as integers
+    :param stack: the states still to explore, as iterables of 2-cells
+    :param explored: the explored states, a visited_store.VisitedStore
+    :param leaf_file_length: the length of the leaf file at the time of the checkpoint, 0 if the
+                             search has no leaf file
+    """
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as file:
+        file.write(CHECKPOINT_MAGIC)
+        file.write(struct.pack("<H5iQ", CHECKPOINT_VERSION, *parameters, leaf_file_length))
+        file.write(struct.pack("<Q", len(stack)))
+        for state in stack:
+            _write_record(file, state)
+        kind, data = explored.kind.encode(), explored.to_bytes()
+        file.write(struct.pack("<HQ", len(kind), len(data)))
+        file.write(kind)
+        file.write(data)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Loads a checkpoint saved by save_checkpoint.
+
+    States are returned as sorted lists of 4-tuples, and the explored states as the kind and the
+    serialization of their store, to be passed to visited_store.VisitedStore.restore.
+
+    :param path: the path of the checkpoint
+    :return: a tuple (parameters, stack, (kind, data), leaf_file_length)
+    """
+    with open(path, "rb") as file:
+        if file.read(len(CHECKPOINT_MAGIC)) != CHECKPOINT_MAGIC:
+            raise ValueError(path + " is not a checkpoint")
+        header = file.read(struct.calcsize("<H5iQ"))
+        version, *parameters, leaf_file_length = struct.unpack("<H5iQ", header)
+        if version != CHECKPOINT_VERSION:
+            raise ValueError("unsupported checkpoint version " + str(version))
+        (count,) = struct.unpack("<Q", file.read(8))
+        stack = [_read_record(file) for _ in range(count)]
+        kind_length, data_length = struct.unpack("<HQ", file.read(struct.calcsize("<HQ")))
+        kind = file.read(kind_length).decode()
+        data = file.read(data_length)
+    return tuple(parameters), stack, (kind, data), leaf_file_length
+
+
+class TaikoArchiveWriter:
+    """
+    Writes many taikos to a single archive file, to be read with TaikoArchive.
+
+    The file holds a header, the 2-cells of all the taikos one after the other as an array of
+    unsigned 8- or 16-bit integers with four columns, and the offsets of every taiko in this
+    array. Taikos are streamed to the file as they are written, and the offsets are written
+    when the archive is closed.
+    """
+
+    def __init__(self, path, coordinate_size=1):
+        """
+        Creates an archive, replacing any existing file.
+
+        :param path: the path of the file
+        :param coordinate_size: the number of bytes per coordinate, 1 for up to 255 vertices on
+                                each side and 2 for up to 65535
+        """
+        if coordinate_size not in (1, 2):
+            raise ValueError("coordinate_size must be 1 or 2")
+        self.path = path
+        self.coordinate_size = coordinate_size
+        self.dtype = np.dtype("<u" + str(coordinate_size))
+        self.file = open(path, "wb")
+        self.file.write(struct.pack(ARCHIVE_HEADER, ARCHIVE_MAGIC, ARCHIVE_VERSION, coordinate_size, 0, 0))
+        self.offsets = [0]
+
+    def write(self, two_cell_list):
+        """
+        Appends a taiko to the archive, keeping the order of its 2-cells.
+
+        :param two_cell_list: an iterable of 4-tuples, or a Taiko or CompactTaiko
+        """
+        if hasattr(two_cell_list, "two_cell_list"):
+            two_cell_list = two_cell_list.two_cell_list
+        cells = np.array(list(two_cell_list), dtype=np.int64).reshape(-1, 4)
+        if cells.size and (cells.min() < 1 or cells.max() > np.iinfo(self.dtype).max):
+            raise ValueError("2-cell coordinates do not fit in " + str(self.coordinate_size) + " bytes")
+        self.file.write(cells.astype(self.dtype).tobytes())
+        self.offsets.append(self.offsets[-1] + len(cells))
+
+    def close(self):
+        offsets_position = self.file.tell()
+        self.file.write(np.array(self.offsets, dtype="<u8").tobytes())
+        self.file.seek(0)
+        self.file.write(struct.pack(ARCHIVE_HEADER, ARCHIVE_MAGIC, ARCHIVE_VERSION, self.coordinate_size,
+                                    len(self.offsets) - 1, offsets_position))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def write_taiko_archive(path, taikos, coordinate_size=1):
+    """
+    Writes taikos to an archive, see TaikoArchiveWriter.
+
+    :param path: the path of the file
+    :param taikos: an iterable of lists of 2-cells, Taikos or CompactTaikos
+    :param coordinate_size: the number of bytes per coordinate, 1 or 2
+    :return: the number of taikos written
+    """
+    with TaikoArchiveWriter(path, coordinate_size) as writer:
+        for taiko in taikos:
+            writer.write(taiko)
+        return len(writer.offsets) - 1
+
+
+class TaikoArchive:
+    """
+    Memory-mapped archive of taikos written by TaikoArchiveWriter.
+
+    Indexing the archive gives the 2-cells of a taiko as a read-only NumPy view of the file with
+    one row per cell, without copying. Taikos are only built when asked for with taiko().
+    """
+
+    def __init__(self, path):
+        """
+        Opens and memory-maps an archive.
+
+        :param path: the path of the file
+        """
+        self.path = path
+        with open(path, "rb") as file:
+            self.mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, coordinate_size, count, offsets_position = struct.unpack_from(ARCHIVE_HEADER, self.mmap)
+        if magic != ARCHIVE_MAGIC:
+            raise ValueError(path + " is not a taiko archive")
+        if version != ARCHIVE_VERSION:
+            raise ValueError("unsupported archive version " + str(version))
+        header_size = struct.calcsize(ARCHIVE_HEADER)
+        dtype = np.dtype("<u" + str(coordinate_size))
+        self.offsets = np.frombuffer(self.mmap, dtype="<u8", count=count + 1, offset=offsets_position)
+        self.cells = np.frombuffer(self.mmap, dtype=dtype, count=4 * int(self.offsets[-1]),
+                                   offset=header_size).reshape(-1, 4)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        """
+        Returns the 2-cells of a taiko.
+
+        :param index: the index of the taiko
+        :return: a read-only array of shape (number of 2-cells, 4)
+        """
+        if not -len(self) <= index < len(self):
+            raise IndexError("taiko index out of range")
+        index %= len(self)
+        return self.cells[self.offsets[index]:self.offsets[index + 1]]
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    def taiko(self, index, taiko_class=None):
+        """
+        Builds a taiko of the archive.
+
+        :param index: the index of the taiko
+        :param taiko_class: the class to build, Taiko by default
+        :return: the taiko
+        """
+        if taiko_class is None:
+            from taiko import Taiko
+            taiko_class = Taiko
+        return taiko_class([tuple(cell) for cell in self[index].tolist()])
+
+    def close(self):
+        """
+        Releases the memory map of the archive.
+
+        Arrays returned by indexing the archive are views of the map, and the map can't be closed
+        while one of them is alive. It is then left to be unmapped when the last view is freed.
+        """
+        self.offsets = self.cells = None
+        try:
+            self.mmap.close()
+        except BufferError:
+            pass
+        self.mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,96 @@
+class UnionFind:
+    """
+    Disjoint-set forest over the integers 0, 1, 2, ... with union by rank and path compression.
+
+    Every write to the forest is recorded in a history, so the forest can be rolled back to an
+    earlier mark. This keeps it usable inside structures with an undo log, such as the taikos.
+    """
+
+    def __init__(self, size=0):
+        """
+        Creates a forest of singleton classes {0}, {1}, ..., {size - 1}.
+
+        :param size: the number of elements to start with
+        """
+        self.parent = list(range(size))
+        self.rank = [0] * size
+        self.history = []
+
+    def __len__(self):
+        return len(self.parent)
+
+    def add(self):
+        """
+        Adds a new singleton class.
+
+        :return: the new element
+        """
+        self.parent.append(len(self.parent))
+        self.rank.append(0)
+        self.history.append(("add",))
+        return len(self.parent) - 1
+
+    def find(self, x):
+        """
+        Returns the representative of the class of x, compressing the path to it.
+
+        :param x: an element
+        :return: the representative of the class of x
+        """
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            self.history.append(("parent", x, parent[x]))
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, x, y):
+        """
+        Merges the classes of x and y.
+
+        The representative of the merged class is the representative of higher rank, ties are
+        broken in favour of the smaller representative.
+
+        :param x: an element
+        :param y: an element
+        :return: a pair (kept, merged) of the surviving and the absorbed representative,
+                 where merged is None if x and y were already in the same class
+        """
+        x, y = self.find(x), self.find(y)
+        if x == y:
+            return x, None
+        if self.rank[x] < self.rank[y] or (self.rank[x] == self.rank[y] and y < x):
+            x, y = y, x
+        self.history.append(("parent", y, y))
+        self.parent[y] = x
+        if self.rank[x] == self.rank[y]:
+            self.history.append(("rank", x, self.rank[x]))
+            self.rank[x] += 1
+        return x, y
+
+    def mark(self):
+        """
+        Returns a mark of the current state that can be passed to rollback.
+
+        :return: the mark, an integer
+        """
+        return len(self.history)
+
+    def rollback(self, mark):
+        """
+        Reverts every change made since the given mark was taken.
+
+        :param mark: a value returned by mark
+        """
+        history = self.history
+        while len(history) > mark:
+            record = history.pop()
+            if record[0] == "parent":
+                self.parent[record[1]] = record[2]
+            elif record[0] == "rank":
+                self.rank[record[1]] = record[2]
+            else:
+                self.parent.pop()
+                self.rank.pop()
@@ -0,0 +1,401 @@
+import hashlib
+import io
+import math
+import os
+import sqlite3
+import struct
+from collections import OrderedDict
+import numpy as np
+from taiko_storage import pack_cells
+
+
+def state_digest(key, size=8):
+    """
+    Returns a hash of a search state key that is the same in every process and every run.
+
+    :param key: a state key, an iterable of 2-cells
+    :param size: the size of the hash in bytes
+    :return: the hash, as a nonzero integer of 8 * size bits
+    """
+    digest = hashlib.blake2b(pack_cells(sorted(key)), digest_size=size).digest()
+    return int.from_bytes(digest, 'little') or 1
+
+
+class VisitedStore:
+    """
+    Set of explored search states, see taiko_dfs.search.
+
+    Subclasses store the states in different forms, trading exactness for memory. They can be
+    saved in checkpoints with to_bytes. A resumed search restores them with restore, which can
+    reuse the store it is called on, and store_from_bytes creates a new store.
+    """
+
+    kind = None
+
+    def add(self, key):
+        """
+        Marks a state as explored.
+
+        :param key: the state key, an iterable of 2-cells
+        :return: true if the state was not explored yet, false otherwise
+        """
+        raise NotImplementedError
+
+    def __len__(self):
+        raise NotImplementedError
+
+    def to_bytes(self):
+        """
+        Returns the contents of the store, to be passed to from_bytes.
+
+        :return: the serialized store
+        """
+        raise NotImplementedError
+
+    @classmethod
+    def from_bytes(cls, data):
+        """
+        Creates a store from the output of to_bytes.
+
+        :param data: the serialized store
+        :return: the store
+        """
+        raise NotImplementedError
+
+    def restore(self, data):
+        """
+        Returns a store with the contents saved by to_bytes, closing this one if it is not reused.
+
+        :param data: the serialized store, of the kind of this store
+        :return: the store
+        """
+        store = type(self).from_bytes(data)
+        self.close()
+        return store
+
+    def close(self):
+        pass
+
+
+class KeySetStore(VisitedStore):
+    """
+    Exact store of the states themselves, each kept as its packed sorted cells.
+
+    Every state is a Python bytes object in a set, about 100 bytes per state for small taikos and
+    more for larger ones.
+    """
+
+    kind = "set"
+
+    def __init__(self):
+        self.keys = set()
+
+    def add(self, key):
+        packed = pack_cells(sorted(key))
+        if packed in self.keys:
+            return False
+        self.keys.add(packed)
+        return True
+
+    def __len__(self):
+        return len(self.keys)
+
+    def to_bytes(self):
+        output = io.BytesIO()
+        for packed in self.keys:
+            output.write(struct.pack("<H", len(packed)))
+            output.write(packed)
+        return output.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        store = cls()
+        position = 0
+        while position < len(data):
+            (length,) = struct.unpack_from("<H", data, position)
+            store.keys.add(data[position + 2:position + 2 + length])
+            position += 2 + length
+        return store
+
+
+class HashSetStore(VisitedStore):
+    """
+    Store of 64- or 128-bit hashes of the states in an open-addressing table with linear probing.
+
+    Uses 16 to 32 bytes per state for 64-bit hashes and 32 to 64 bytes for 128-bit ones, as the
+    load factor of the table stays between one quarter and one half. Two states with the same
+    hash are taken to be the same, which for 64-bit hashes becomes likely around 2^32 states.
+    """
+
+    kind = "hash"
+
+    def __init__(self, bits=64, capacity=1 << 16):
+        """
+        Creates an empty store.
+
+        :param bits: the size of the hashes, 64 or 128
+        :param capacity: the initial number of slots, a power of two
+        """
+        if bits not in (64, 128):
+            raise ValueError("bits must be 64 or 128")
+        self.bits = bits
+        self.count = 0
+        self.slots = np.zeros((capacity, bits // 64), dtype=np.uint64)
+
+    def add(self, key):
+        digest = state_digest(key, self.bits // 8)
+        # A zero first word marks an empty slot
+        words = [digest & 0xFFFFFFFFFFFFFFFF or 1, digest >> 64][:self.bits // 64]
+        if self._insert(self.slots, words):
+            self.count += 1
+            if 2 * self.count > len(self.slots):
+                self._grow()
+            return True
+        return False
+
+    @staticmethod
+    def _insert(slots, words):
+        """
+        Inserts a hash, given as its 64-bit words, into a table of slots.
+
+        :return: true if the hash was inserted, false if it was already there
+        """
+        mask = len(slots) - 1
+        position = words[0] & mask
+        while True:
+            slot = slots[position]
+            if slot[0] == 0:
+                slots[position] = words
+                return True
+            if all(int(slot[k]) == words[k] for k in range(len(words))):
+                return False
+            position = (position + 1) & mask
+
+    def _grow(self):
+        slots = np.zeros((2 * len(self.slots), self.slots.shape[1]), dtype=np.uint64)
+        for slot in self.slots[self.slots[:, 0] != 0]:
+            self._insert(slots, [int(word) for word in slot])
+        self.slots = slots
+
+    def __len__(self):
+        return self.count
+
+    def to_bytes(self):
+        return struct.pack("<HQ", self.bits, self.count) + self.slots.tobytes()
+
+    @classmethod
+    def from_bytes(cls, data):
+        bits, count = struct.unpack_from("<HQ", data)
+        slots = np.frombuffer(data, dtype=np.uint64, offset=struct.calcsize("<HQ")).reshape(-1, bits // 64)
+        store = cls(bits, capacity=1)
+        store.slots = slots.copy()
+        store.count = count
+        return store
+
+
+class SqliteStore(VisitedStore):
+    """
+    Store of 64-bit hashes of the states in an SQLite database on disk, for searches whose explored
+    set does not fit in memory.
+
+    Recently added hashes are kept in an in-memory LRU cache, which absorbs the frequent revisits
+    of states near the top of the DFS stack without touching the database. Rows are numbered in
+    insertion order, so that restoring a checkpoint can drop the states added after it.
+    """
+
+    kind = "sqlite"
+
+    def __init__(self, path, cache_size=1 << 20, commit_interval=10000, clear=True):
+        """
+        Opens or creates a store.
+
+        :param path: the path of the database
+        :param cache_size: the number of hashes kept in the LRU cache
+        :param commit_interval: the number of insertions between commits
+        :param clear: whether to forget the states of a previous search in the database
+        """
+        self.path = path
+        self.cache_size = cache_size
+        self.commit_interval = commit_interval
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=OFF")
+        if clear:
+            self.connection.execute("DROP TABLE IF EXISTS visited")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS visited (hash INTEGER PRIMARY KEY, position INTEGER)"
+                                " WITHOUT ROWID")
+        # Restoring a checkpoint deletes the rows added after it by position
+        self.connection.execute("CREATE INDEX IF NOT EXISTS visited_position ON visited (position)")
+        self.count = self.connection.execute("SELECT COUNT(*) FROM visited").fetchone()[0]
+        self.cache = OrderedDict()
+        self.uncommitted = 0
+
+    def add(self, key):
+        # SQLite integers are signed
+        digest = state_digest(key) - (1 << 63)
+        if digest in self.cache:
+            self.cache.move_to_end(digest)
+            return False
+        self.cache[digest] = None
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        cursor = self.connection.execute("INSERT OR IGNORE INTO visited VALUES (?, ?)", (digest, self.count))
+        if cursor.rowcount == 0:
+            return False
+        self.count += 1
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_interval:
+            self.connection.commit()
+            self.uncommitted = 0
+        return True
+
+    def __len__(self):
+        return self.count
+
+    def to_bytes(self):
+        self.connection.commit()
+        self.uncommitted = 0
+        return struct.pack("<Q", self.count) + os.path.abspath(self.path).encode()
+
+    @classmethod
+    def from_bytes(cls, data, cache_size=1 << 20, commit_interval=10000):
+        (count,) = struct.unpack_from("<Q", data)
+        store = cls(data[8:].decode(), cache_size, commit_interval, clear=False)
+        store._truncate(count)
+        return store
+
+    def restore(self, data):
+        """
+        Returns a store with the contents saved by to_bytes, keeping the cache size and commit
+        interval of this store. This store is reused if it opened the saved database.
+
+        :param data: the serialized store
+        :return: the store
+        """
+        path = data[8:].decode()
+        if os.path.abspath(self.path) != path:
+            self.close()
+            return SqliteStore.from_bytes(data, self.cache_size, self.commit_interval)
+        (count,) = struct.unpack_from("<Q", data)
+        self._truncate(count)
+        return self
+
+    def _truncate(self, count):
+        """
+        Forgets the states added after the first count ones.
+
+        :param count: the number of states to keep
+        """
+        self.connection.execute("DELETE FROM visited WHERE position >= ?", (count,))
+        self.connection.commit()
+        self.uncommitted = 0
+        self.cache.clear()
+        self.count = count
+
+    def close(self):
+        self.connection.commit()
+        self.connection.close()
+
+
+class BloomStore(VisitedStore):
+    """
+    Scalable Bloom filter of the states, using a few bytes per state.
+
+    States go into a sequence of Bloom filters. When the last filter holds as many states as it
+    was sized for, a new filter with twice the capacity and half the false positive rate is added,
+    so that memory grows with the number of states. The false positive rates of the filters sum to
+    at most false_positive_rate, which bounds the probability that a new state is reported as
+    explored, in which case the search skips it and the leaves below it may be missed.
+    """
+
+    kind = "bloom"
+
+    def __init__(self, capacity=1 << 20, false_positive_rate=1e-6):
+        """
+        Creates an empty store.
+
+        :param capacity: the number of states of the first filter
+        :param false_positive_rate: the bound on the false positive rate, at any number of states
+        """
+        self.filters = []  # Lists [num_bits, num_hashes, capacity, count, false_positive_rate, bits]
+        self.count = 0
+        self._add_filter(capacity, false_positive_rate / 2)
+
+    def _add_filter(self, capacity, false_positive_rate):
+        """
+        Adds an empty filter sized for the given number of states and false positive rate.
+
+        :param capacity: the number of states of the filter
+        :param false_positive_rate: the false positive rate of the filter at that number of states
+        """
+        # The probes of a state are distinct when the number of bits is a power of two, see add
+        num_bits = 1 << max(6, math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2).bit_length())
+        num_hashes = max(1, min(round(num_bits / capacity * math.log(2)),
+                                math.ceil(-math.log2(false_positive_rate))))
+        self.filters.append([num_bits, num_hashes, capacity, 0, false_positive_rate,
+                             np.zeros((num_bits + 7) // 8, dtype=np.uint8)])
+
+    def add(self, key):
+        # Double hashing: the k probes are h1 + i * h2 for two independent 64-bit hashes, with h2 odd
+        digest = state_digest(key, 16)
+        first, second = digest & 0xFFFFFFFFFFFFFFFF, (digest >> 64) | 1
+        for num_bits, num_hashes, _, _, _, bits in self.filters[:-1]:
+            if all(bits[bit >> 3] & (1 << (bit & 7))
+                   for bit in ((first + i * second) % num_bits for i in range(num_hashes))):
+                return False
+        last = self.filters[-1]
+        num_bits, num_hashes, bits = last[0], last[1], last[5]
+        new = False
+        for i in range(num_hashes):
+            bit = (first + i * second) % num_bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not bits[byte] & mask:
+                bits[byte] |= mask
+                new = True
+        if new:
+            self.count += 1
+            last[3] += 1
+            if last[3] >= last[2]:
+                self._add_filter(2 * last[2], last[4] / 2)
+        return new
+
+    def __len__(self):
+        return self.count
+
+    def to_bytes(self):
+        output = io.BytesIO()
+        output.write(struct.pack("<QH", self.count, len(self.filters)))
+        for num_bits, num_hashes, capacity, count, false_positive_rate, bits in self.filters:
+            output.write(struct.pack("<QHQQd", num_bits, num_hashes, capacity, count, false_positive_rate))
+            output.write(bits.tobytes())
+        return output.getvalue()
+
+    @classmethod
+    def from_bytes(cls, data):
+        store = cls.__new__(cls)
+        store.count, num_filters = struct.unpack_from("<QH", data)
+        position = struct.calcsize("<QH")
+        store.filters = []
+        for _ in range(num_filters):
+            num_bits, num_hashes, capacity, count, false_positive_rate = struct.unpack_from("<QHQQd", data, position)
+            position += struct.calcsize("<QHQQd")
+            size = (num_bits + 7) // 8
+            bits = np.frombuffer(data, dtype=np.uint8, count=size, offset=position).copy()
+            position += size
+            store.filters.append([num_bits, num_hashes, capacity, count, false_positive_rate, bits])
+        return store
+
+
+STORES = {store.kind: store for store in (KeySetStore, HashSetStore, SqliteStore, BloomStore)}
+
+
+def store_from_bytes(kind, data):
+    """
+    Restores a store saved with to_bytes.
+
+    :param kind: the kind of the store
+    :param data: the serialized store
+    :return: the store
+    """
+    return STORES[kind].from_bytes(data)